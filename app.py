@@ -1,4 +1,10 @@
+import re
+import uuid
+
 import streamlit as st
+from core.chat_history import ChatHistory, get_spill_store
+from core.memory_backend import get_memory_backend
+from core.memory_store import load_memory_store
 from ui.sidebar import render_sidebar
 from ui.main_view import render_chat_interface, render_instructions
 
@@ -6,12 +12,23 @@ from ui.main_view import render_chat_interface, render_instructions
 st.set_page_config(page_title="PostgresWhisperer", page_icon="🤖", layout="wide")
 st.title("🤖 PostgresWhisperer: Conversational Agent for PostgreSQL")
 
+# Identificador de sesión estable en la URL, para recuperar la conversación tras recargar la página.
+# El enlace es un secreto al portador: quien lo tenga puede leer la conversación, no debe compartirse.
+# Solo se aceptan identificadores generados aquí (128 bits aleatorios en hexadecimal).
+if "session_id" not in st.session_state:
+    sid = st.query_params.get("sid", "")
+    st.session_state.session_id = sid if re.fullmatch(r"[0-9a-f]{32}", sid) else uuid.uuid4().hex
+    st.query_params["sid"] = st.session_state.session_id
+
 # Inicializar estado de la sesión
 if "messages" not in st.session_state:
-    st.session_state.messages = []
+    memory_backend = get_memory_backend()
     st.session_state.initialized = False
-    st.session_state.memory_store = []
-    st.session_state.conversation_summary = ""
+    st.session_state.memory_store = load_memory_store(memory_backend, st.session_state.session_id)
+    st.session_state.messages = ChatHistory(get_spill_store())
+    for message in st.session_state.memory_store:
+        role = "human" if message["role"] == "human" else "assistant"
+        st.session_state.messages.append(role, message["content"])
 
 # Renderizar componentes de UI
 render_sidebar()
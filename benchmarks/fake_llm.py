@@ -0,0 +1,64 @@
+import json
+import re
+import threading
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import Field, PrivateAttr
+
+from utils.text_search import estimate_tokens
+
+_CHUNK_RE = re.compile(r"\S+\s*|\s+")
+
+
+class ReplayChatModel(BaseChatModel):
+    """
+    Deterministic chat model that replays recorded responses. The first rule whose regex matches the
+    prompt wins; its named groups can be used in the response, e.g. to echo the table of the question.
+    """
+
+    rules: list = Field(default_factory=list)
+    default_response: str = "OK."
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    _stats: dict = PrivateAttr(default_factory=lambda: {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0})
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, "r", encoding="utf-8") as f:
+            recorded = json.load(f)
+        rules = [(re.compile(rule["pattern"], re.DOTALL), rule["response"]) for rule in recorded["rules"]]
+        return cls(rules=rules, default_response=recorded.get("default", "OK."))
+
+    @property
+    def _llm_type(self):
+        return "replay"
+
+    @property
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+    def _respond(self, messages):
+        prompt = "\n".join(str(message.content) for message in messages)
+        response = self.default_response
+        for pattern, template in self.rules:
+            match = pattern.search(prompt)
+            if match:
+                response = template.format(**match.groupdict())
+                break
+        with self._lock:
+            self._stats["calls"] += 1
+            self._stats["prompt_tokens"] += estimate_tokens(prompt)
+            self._stats["completion_tokens"] += estimate_tokens(response)
+        return response
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self._respond(messages)))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        for token in _CHUNK_RE.findall(self._respond(messages)):
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager is not None:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
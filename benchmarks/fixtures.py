@@ -0,0 +1,73 @@
+import os
+
+from sqlalchemy import create_engine, inspect, text
+
+# Table names are built from these words so schema pruning has realistic names to rank
+DOMAINS = [
+    "customer", "order", "product", "invoice", "payment", "shipment", "supplier", "employee", "store",
+    "region", "category", "review", "refund", "warehouse", "campaign", "ticket", "subscription", "coupon",
+]
+
+STATUSES = ("'active'", "'pending'", "'closed'")
+
+
+def table_name(i):
+    return f"{DOMAINS[i % len(DOMAINS)]}_{i:04d}"
+
+
+def _rows_source(dialect, rows):
+    """A row source of n = 1..rows, generated inside the database"""
+    if dialect == "postgresql":
+        return f"generate_series(1, {rows}) AS seq(n)"
+    return f"(WITH RECURSIVE seq(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM seq WHERE n < {rows}) SELECT n FROM seq)"
+
+
+def _create_table(conn, dialect, i, rows):
+    name, parent = table_name(i), table_name(i - 1) if i else None
+    parent_column = f", {table_name(i - 1)}_id INTEGER REFERENCES {parent}(id)" if parent else ""
+    conn.execute(text(
+        f"CREATE TABLE {name} (id INTEGER PRIMARY KEY, name VARCHAR(64), amount NUMERIC(12, 2), "
+        f"status VARCHAR(16), created_at DATE{parent_column})"
+    ))
+    if dialect == "postgresql":
+        created_at = "DATE '2024-01-01' + (n % 365)"
+        comment = f"COMMENT ON TABLE {name} IS 'Synthetic {DOMAINS[i % len(DOMAINS)]} records'"
+        conn.execute(text(comment))
+    else:
+        created_at = "date('2024-01-01', '+' || (n % 365) || ' days')"
+    status = f"CASE n % 3 WHEN 0 THEN {STATUSES[0]} WHEN 1 THEN {STATUSES[1]} ELSE {STATUSES[2]} END"
+    parent_value = f", (n % {rows}) + 1" if parent else ""
+    parent_insert = f", {table_name(i - 1)}_id" if parent else ""
+    conn.execute(text(
+        f"INSERT INTO {name} (id, name, amount, status, created_at{parent_insert}) "
+        f"SELECT n, '{name} ' || n, (n * 7919 % 100000) / 100.0, {status}, {created_at}{parent_value} "
+        f"FROM {_rows_source(dialect, rows)}"
+    ))
+
+
+def build_synthetic_database(tables, rows, url=None, cache_dir=".cache/bench"):
+    """
+    Create (or reuse) a synthetic database of `tables` tables chained by foreign keys, with `rows`
+    rows spread evenly over them. Without a URL the database is a cached SQLite file.
+    Returns the database URL.
+    """
+    if url is None:
+        os.makedirs(cache_dir, exist_ok=True)
+        url = f"sqlite:///{os.path.join(cache_dir, f'synthetic_{tables}_{rows}.db')}"
+
+    engine = create_engine(url)
+    try:
+        existing = set(inspect(engine).get_table_names())
+        if len(existing) >= tables and table_name(tables - 1) in existing:
+            return url
+
+        rows_per_table = max(1, rows // tables)
+        with engine.begin() as conn:
+            for i in range(tables):
+                if table_name(i) not in existing:
+                    _create_table(conn, engine.dialect.name, i, rows_per_table)
+            if engine.dialect.name == "postgresql":
+                conn.execute(text("ANALYZE"))
+        return url
+    finally:
+        engine.dispose()
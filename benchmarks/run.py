@@ -0,0 +1,253 @@
+"""
+Offline benchmarks of the question pipeline: a replaying fake chat model and a synthetic database,
+so changes to dispatch parsing, memory search, schema introspection or process_query can be measured
+without Ollama, OpenAI or a production database.
+
+    python -m benchmarks.run --tables 500 --rows 1000000
+    python -m benchmarks.run --tables 500 --rows 1000000 --save-baseline
+    python -m benchmarks.run --tables 500 --rows 1000000 --baseline benchmarks/baseline.json
+
+Each stage reports throughput, p50/p95 latency, prompt tokens sent to the model per call and peak
+Python memory. With --baseline the run fails (exit code 1) when a stage is slower, more verbose or
+bigger than the stored baseline for the same scenario, beyond the tolerance.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+# Keep benchmark runs from writing the conversation and trace files of the app
+os.environ.setdefault("MEMORY_BACKEND_URL", "none")
+os.environ.setdefault("TRACE_EXPORT_PATH", "")
+
+from benchmarks.fake_llm import ReplayChatModel  # noqa: E402
+from benchmarks.fixtures import build_synthetic_database, table_name  # noqa: E402
+from core import plan_cache, result_cache, snapshots  # noqa: E402
+from core.agent_factory import initialize_agents  # noqa: E402
+from core.background import pending_background_tasks  # noqa: E402
+from core.fast_dispatch import FastDispatcher  # noqa: E402
+from core.llm_gateway import GatewayChatModel, get_gateway  # noqa: E402
+from core.memory import create_memory  # noqa: E402
+from core.memory_store import MemoryStore  # noqa: E402
+from core.pipeline import process_query  # noqa: E402
+from core.result_stream import StreamingSQLDatabase  # noqa: E402
+from core.schema_cache import load_schema_catalog  # noqa: E402
+from core.schema_index import SchemaIndex  # noqa: E402
+from core.session import ChatSession  # noqa: E402
+from utils.json_helpers import parse_dispatch_result  # noqa: E402
+
+RESPONSES_PATH = os.path.join(os.path.dirname(__file__), "responses.json")
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+DISPATCH_OUTPUTS = [
+    '{"reasoning": "Needs data", "action": "database_query", "explanation": "Count rows"}',
+    '```json\n{"reasoning": "Refers back", "action": "memory_lookup", "explanation": "Earlier answer"}\n```',
+    'I think this is "action": "direct_response" because it is a general question.',
+]
+
+
+def _percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+def _wait_for_background(timeout=30.0):
+    deadline = time.perf_counter() + timeout
+    while pending_background_tasks() and time.perf_counter() < deadline:
+        time.sleep(0.005)
+
+
+def measure(name, fn, iterations, llm=None):
+    """Time fn(i) over the iterations, then run it once more under tracemalloc for peak memory"""
+    tokens_before = llm.stats["prompt_tokens"] if llm is not None else 0
+    calls_before = llm.stats["calls"] if llm is not None else 0
+    latencies = []
+    started = time.perf_counter()
+    for i in range(iterations):
+        t0 = time.perf_counter()
+        fn(i)
+        latencies.append((time.perf_counter() - t0) * 1000)
+    elapsed = time.perf_counter() - started
+
+    prompt_tokens = calls = 0
+    if llm is not None:
+        calls = llm.stats["calls"] - calls_before
+        prompt_tokens = llm.stats["prompt_tokens"] - tokens_before
+
+    tracemalloc.start()
+    fn(iterations)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return name, {
+        "iterations": iterations,
+        "throughput_per_s": round(iterations / elapsed, 2) if elapsed else None,
+        "p50_ms": round(statistics.median(latencies), 3),
+        "p95_ms": round(_percentile(latencies, 0.95), 3),
+        "llm_calls_per_op": round(calls / iterations, 2),
+        "prompt_tokens_per_op": round(prompt_tokens / iterations, 1),
+        "peak_kib": peak // 1024,
+    }
+
+
+def make_session(db, llm, schema_index):
+    """Build a ChatSession the way core/session.create_session does, around the fake model"""
+    gateway = get_gateway("replay")
+    answer_llm = GatewayChatModel(inner=llm, gateway=gateway)
+    summary_llm = GatewayChatModel(inner=llm, gateway=gateway, priority="background")
+    agents = initialize_agents(db, answer_llm, answer_llm, "ollama")
+    return ChatSession(
+        "benchmark", db, answer_llm, agents["sql_agent"], agents["dispatcher_chain"],
+        create_memory(summary_llm, "hybrid"),
+        MemoryStore(), "ollama", "replay", schema_index=schema_index,
+        fast_dispatcher=FastDispatcher(schema_index.table_names), decompose_chain=agents["decompose_chain"],
+    )
+
+
+def run_benchmarks(args):
+    url = build_synthetic_database(args.tables, args.rows, args.database_url)
+    db = StreamingSQLDatabase.from_uri(url, lazy_table_reflection=True)
+    llm = ReplayChatModel.from_file(RESPONSES_PATH)
+    question_tables = [table_name(i) for i in range(min(args.tables, 50))]
+    iterations = args.iterations
+
+    results = dict([measure("schema_introspection", lambda i: load_schema_catalog(db), max(1, iterations // 5))])
+    catalog = load_schema_catalog(db)
+    schema_index = SchemaIndex(catalog)
+    results.update([measure(
+        "schema_slice", lambda i: schema_index.build_slice(f"How many rows are in {question_tables[i % 50 % len(question_tables)]}?"),
+        iterations
+    )])
+    results.update([measure(
+        "parse_dispatch_result", lambda i: parse_dispatch_result(DISPATCH_OUTPUTS[i % len(DISPATCH_OUTPUTS)]),
+        iterations * 10
+    )])
+
+    session = make_session(db, llm, schema_index)
+    for i in range(args.memory_turns):
+        table = question_tables[i % len(question_tables)]
+        session.memory_store.add_turn(f"How many rows are in {table}?", f"The table {table} has {i} rows.")
+    results.update([measure(
+        "memory_search",
+        lambda i: session.memory_tool._run(f"What did you say about {question_tables[i % len(question_tables)]}?"),
+        iterations
+    )])
+
+    def ask(question):
+        # The SQL agent is verbose; its stdout trace is not part of the benchmark output
+        with contextlib.redirect_stdout(io.StringIO()):
+            answer = process_query(session, question)
+        _wait_for_background()
+        return answer
+
+    def ask_cold(i):
+        # Fresh caches, so every question goes through the dispatcher and the SQL agent
+        result_cache._result_cache = result_cache.ResultCache()
+        plan_cache._plan_cache = plan_cache.PlanCache()
+        snapshots._snapshot_store = snapshots.SnapshotStore()
+        ask(f"How many rows are in {question_tables[i % len(question_tables)]}?")
+
+    warm_questions = [f"How many rows are in {table}?" for table in question_tables[:5]]
+
+    def ask_warm(i):
+        ask(warm_questions[i % len(warm_questions)])
+
+    def ask_compound(i):
+        # Independent sub-queries run in parallel, then a single narration call
+        result_cache._result_cache = result_cache.ResultCache()
+        snapshots._snapshot_store = snapshots.SnapshotStore()
+        first, second, third = (question_tables[(i + k) % len(question_tables)] for k in range(3))
+        ask(f"Compare the row counts of {first}, {second} and {third}")
+
+    session = make_session(db, llm, schema_index)
+    results.update([measure("process_query_cold", ask_cold, iterations, llm)])
+    results.update([measure("process_query_compound", ask_compound, iterations, llm)])
+    for question in warm_questions:
+        ask(question)  # Answered once so the measured runs hit the answer cache
+    results.update([measure("process_query_warm", ask_warm, iterations, llm)])
+
+    memory = make_session(db, llm, schema_index).memory
+
+    def update_memory(i):
+        memory.save_context({"input": f"How many rows are in {question_tables[i % len(question_tables)]}?"},
+                            {"output": "The table has 1000 rows. " * 20})
+        _wait_for_background()
+
+    results.update([measure("memory_update", update_memory, iterations, llm)])
+    db._engine.dispose()
+    return results
+
+
+def compare(results, baseline, tolerance, token_tolerance):
+    """Return the regressions of results against the baseline stages"""
+    regressions = []
+    for stage, current in results.items():
+        reference = baseline.get(stage)
+        if reference is None:
+            continue
+        checks = [("p95_ms", tolerance), ("peak_kib", tolerance), ("prompt_tokens_per_op", token_tolerance)]
+        for metric, allowed in checks:
+            if reference.get(metric) and current[metric] > reference[metric] * (1 + allowed):
+                regressions.append(f"{stage}.{metric}: {current[metric]} > {reference[metric]} (+{allowed:.0%})")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmarks of the question pipeline")
+    parser.add_argument("--tables", type=int, default=100, help="Tables in the synthetic schema (10-5000)")
+    parser.add_argument("--rows", type=int, default=10000, help="Rows spread over all tables (10k-10M)")
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--memory-turns", type=int, default=200, help="Turns in the memory store being searched")
+    parser.add_argument("--database-url", help="Build the fixture in this database (e.g. a local PostgreSQL)")
+    parser.add_argument("--baseline", help="Fail on regressions against this baseline file")
+    parser.add_argument("--save-baseline", nargs="?", const=DEFAULT_BASELINE, help="Store the results as baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed latency and memory increase")
+    parser.add_argument("--token-tolerance", type=float, default=0.05, help="Allowed prompt token increase")
+    parser.add_argument("--output", help="Also write the results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    scenario = f"{args.tables}x{args.rows}"
+    results = run_benchmarks(args)
+
+    print(f"{'stage':<24}{'ops/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'calls':>7}{'tokens':>9}{'peak KiB':>10}")
+    for stage, r in results.items():
+        print(f"{stage:<24}{r['throughput_per_s']:>10}{r['p50_ms']:>10}{r['p95_ms']:>10}"
+              f"{r['llm_calls_per_op']:>7}{r['prompt_tokens_per_op']:>9}{r['peak_kib']:>10}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({scenario: results}, f, indent=2)
+
+    if args.save_baseline:
+        stored = {}
+        if os.path.exists(args.save_baseline):
+            with open(args.save_baseline, "r", encoding="utf-8") as f:
+                stored = json.load(f)
+        stored[scenario] = results
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(stored, f, indent=2)
+        print(f"Baseline for {scenario} saved to {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f).get(scenario)
+        if baseline is None:
+            print(f"No baseline for scenario {scenario} in {args.baseline}")
+            return 1
+        regressions = compare(results, baseline, args.tolerance, args.token_tolerance)
+        if regressions:
+            print("Regressions against the baseline:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+        print("No regressions against the baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
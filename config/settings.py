@@ -14,12 +14,14 @@ Examples:
 - "Can you explain more about those results?" -> Search memory
 - "How does this system work?" -> Respond directly
 
-Respond with a clear decision in the following JSON format:
+Respond only with a JSON object in the following format, with the action first:
 {{
-  "reasoning": "Your step-by-step reasoning",
   "action": "database_query|memory_lookup|direct_response",
-  "explanation": "Brief explanation of why you chose this action"
+  "explanation": "Brief explanation of why you chose this action",
+  "reasoning": "Your step-by-step reasoning"
 }}
+
+User question: {input}
 """
 
 MEMORY_SEARCH_PROMPT = """
@@ -49,6 +51,61 @@ DO NOT invent columns or tables. Only use what's listed here. If the information
 {schema_text}
 """
 
+SCHEMA_SLICE_PROMPT = """The following tables are the most relevant ones for this question. Use them first and only explore other tables if they are clearly insufficient.
+
+{schema_text}
+
+Question: {prompt}
+"""
+
+PLAN_NARRATION_PROMPT = """
+The user asked: "{prompt}"
+
+This SQL query was executed to answer it:
+{sql}
+
+Result:
+{result}
+
+Answer the user's question in natural language using only this result.
+"""
+
+DECOMPOSE_PROMPT = """Split the user's question into independent PostgreSQL queries that can run at the same time, one for each figure or list the answer needs.
+Use these tables:
+
+{schema_text}
+
+Question: {input}
+
+Each query must be a single read-only SELECT that does not depend on the result of another query.
+Respond only with a JSON object in the following format:
+{{
+  "queries": [
+    {{"label": "What this query answers", "sql": "SELECT ..."}}
+  ]
+}}
+"""
+
+MULTI_QUERY_NARRATION_PROMPT = """
+The user asked: "{prompt}"
+
+These SQL queries were executed to answer it:
+{results}
+
+Answer the user's question in natural language using only these results, comparing them where the question asks for it.
+"""
+
+SUMMARY_UPDATE_PROMPT = """Progressively summarize the conversation between a user and a PostgreSQL assistant.
+Add the new lines to the current summary and return a new, concise summary. Keep table names, filters and key figures.
+
+Current summary:
+{summary}
+
+New lines of conversation:
+{new_lines}
+
+New summary:"""
+
 # Configuración por defecto
 DEFAULT_TEMPERATURE = 0.1
 DEFAULT_MODEL_TYPE = "Local (Ollama)"
@@ -58,4 +115,130 @@ DEFAULT_OPENAI_MODEL = "gpt-3.5-turbo"
 DEFAULT_DB_HOST = "localhost"
 DEFAULT_DB_PORT = "5432"
 DEFAULT_DB_NAME = "postgres"
-DEFAULT_DB_USER = "postgres"
\ No newline at end of file
+DEFAULT_DB_USER = "postgres"
+
+# Pool de conexiones compartido entre sesiones
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "5"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+DB_ENGINE_IDLE_TIMEOUT = int(os.getenv("DB_ENGINE_IDLE_TIMEOUT", "900"))
+
+# Caché de introspección del esquema
+SCHEMA_CACHE_DIR = os.getenv("SCHEMA_CACHE_DIR", ".cache/schema")
+
+# Poda del esquema por relevancia
+SCHEMA_TOP_K = int(os.getenv("SCHEMA_TOP_K", "8"))
+SCHEMA_MAX_FK_NEIGHBORS = int(os.getenv("SCHEMA_MAX_FK_NEIGHBORS", "4"))
+
+# Caché de respuestas para preguntas repetidas
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "512"))
+RESULT_CACHE_TTL = int(os.getenv("RESULT_CACHE_TTL", "600"))
+RESULT_CACHE_NEAR_DUPLICATES = os.getenv("RESULT_CACHE_NEAR_DUPLICATES", "false").lower() == "true"
+RESULT_CACHE_SIMILARITY = float(os.getenv("RESULT_CACHE_SIMILARITY", "0.8"))
+
+# Caché de planes NL→SQL
+PLAN_CACHE_MAX_ENTRIES = int(os.getenv("PLAN_CACHE_MAX_ENTRIES", "512"))
+PLAN_CACHE_NARRATE = os.getenv("PLAN_CACHE_NARRATE", "true").lower() == "true"
+
+# Clasificador local previo al planner LLM
+FAST_DISPATCH_ENABLED = os.getenv("FAST_DISPATCH_ENABLED", "true").lower() == "true"
+FAST_DISPATCH_THRESHOLD = float(os.getenv("FAST_DISPATCH_THRESHOLD", "0.8"))
+
+# Trabajo en segundo plano (resúmenes, escrituras de memoria, cachés)
+BACKGROUND_WORKERS = int(os.getenv("BACKGROUND_WORKERS", "4"))
+
+# Almacén de memoria indexado para la herramienta de búsqueda
+MEMORY_STORE_MAX_TURNS = int(os.getenv("MEMORY_STORE_MAX_TURNS", "200"))
+MEMORY_SEARCH_TOP_K = int(os.getenv("MEMORY_SEARCH_TOP_K", "5"))
+MEMORY_SEARCH_TOKEN_BUDGET = int(os.getenv("MEMORY_SEARCH_TOKEN_BUDGET", "1500"))
+
+# Persistencia de la memoria de conversación ("none" para desactivarla)
+MEMORY_BACKEND_URL = os.getenv("MEMORY_BACKEND_URL", "sqlite:///.cache/memory.db")
+MEMORY_LOAD_RECENT_TURNS = int(os.getenv("MEMORY_LOAD_RECENT_TURNS", "20"))
+MEMORY_WRITE_BATCH_SIZE = int(os.getenv("MEMORY_WRITE_BATCH_SIZE", "50"))
+MEMORY_WRITE_FLUSH_SECONDS = float(os.getenv("MEMORY_WRITE_FLUSH_SECONDS", "1.0"))
+
+# Memoria híbrida: ventana de turnos recientes + resumen por lotes
+MEMORY_MODE = os.getenv("MEMORY_MODE", "hybrid")  # "hybrid", "summary" o "buffer"
+MEMORY_WINDOW_TURNS = int(os.getenv("MEMORY_WINDOW_TURNS", "6"))
+MEMORY_SUMMARY_TOKEN_THRESHOLD = int(os.getenv("MEMORY_SUMMARY_TOKEN_THRESHOLD", "1000"))
+
+# Resultados en streaming con cursores del lado del servidor
+RESULT_FETCH_BATCH_SIZE = int(os.getenv("RESULT_FETCH_BATCH_SIZE", "500"))
+LLM_RESULT_MAX_ROWS = int(os.getenv("LLM_RESULT_MAX_ROWS", "50"))
+RESULT_PAGE_SIZE = int(os.getenv("RESULT_PAGE_SIZE", "100"))
+
+# Buffers columnares y resúmenes estadísticos para el LLM
+COLUMNAR_MAX_ROWS = int(os.getenv("COLUMNAR_MAX_ROWS", "100000"))
+LLM_SUMMARY_MAX_ROWS = int(os.getenv("LLM_SUMMARY_MAX_ROWS", "2000"))  # filas leídas por consulta del agente
+LLM_SAMPLE_ROWS = int(os.getenv("LLM_SAMPLE_ROWS", "5"))
+
+# Protección de consultas: EXPLAIN previo, timeout y sesiones de solo lectura
+QUERY_MAX_COST = float(os.getenv("QUERY_MAX_COST", "1000000"))
+QUERY_MAX_ROWS = int(os.getenv("QUERY_MAX_ROWS", "100000"))
+QUERY_AUTO_LIMIT = os.getenv("QUERY_AUTO_LIMIT", "true").lower() == "true"
+QUERY_STATEMENT_TIMEOUT_MS = int(os.getenv("QUERY_STATEMENT_TIMEOUT_MS", "30000"))
+QUERY_READ_ONLY = os.getenv("QUERY_READ_ONLY", "true").lower() == "true"
+
+# Vistas previas de tablas en la barra lateral
+TABLE_PREVIEW_ROWS = int(os.getenv("TABLE_PREVIEW_ROWS", "5"))
+TABLE_PREVIEW_TTL = int(os.getenv("TABLE_PREVIEW_TTL", "300"))
+TABLE_PREVIEW_WORKERS = int(os.getenv("TABLE_PREVIEW_WORKERS", "4"))
+TABLE_PREVIEW_PREFETCH = int(os.getenv("TABLE_PREVIEW_PREFETCH", "3"))
+TABLE_PREVIEW_SAMPLE_MIN_ROWS = int(os.getenv("TABLE_PREVIEW_SAMPLE_MIN_ROWS", "100000"))
+TABLE_BROWSER_PAGE_SIZE = int(os.getenv("TABLE_BROWSER_PAGE_SIZE", "50"))  # tablas por página en la barra lateral
+
+# Caché de clientes LLM y agentes compartidos entre sesiones
+RESOURCE_CACHE_MAX_ENTRIES = int(os.getenv("RESOURCE_CACHE_MAX_ENTRIES", "32"))
+
+# Trazas por petición (latencias, tokens, SQL) exportadas a un fichero local
+TRACE_ENABLED = os.getenv("TRACE_ENABLED", "true").lower() == "true"
+TRACE_EXPORT_PATH = os.getenv("TRACE_EXPORT_PATH", ".cache/traces.jsonl")  # "" para no exportar
+TRACE_EXPORT_FORMAT = os.getenv("TRACE_EXPORT_FORMAT", "jsonl")  # "jsonl" u "otel" (OTLP/JSON)
+TRACE_HISTORY = int(os.getenv("TRACE_HISTORY", "200"))
+
+# Servicio API (FastAPI); con SERVICE_URL la app de Streamlit actúa como cliente ligero
+SERVICE_URL = os.getenv("SERVICE_URL", "")
+SERVICE_WORKERS = int(os.getenv("SERVICE_WORKERS", "8"))
+SERVICE_MAX_QUEUE = int(os.getenv("SERVICE_MAX_QUEUE", "64"))
+SERVICE_MAX_QUEUE_PER_SESSION = int(os.getenv("SERVICE_MAX_QUEUE_PER_SESSION", "4"))
+SERVICE_SESSION_IDLE_TIMEOUT = int(os.getenv("SERVICE_SESSION_IDLE_TIMEOUT", "3600"))
+SERVICE_REQUEST_TIMEOUT = float(os.getenv("SERVICE_REQUEST_TIMEOUT", "300"))
+SERVICE_SECRET_KEY = os.getenv("SERVICE_SECRET_KEY", "")  # firma los tokens de sesión; vacío = clave por proceso
+
+# Pasarela LLM: límite de peticiones simultáneas por backend, prioridades y keep-alive
+LLM_MAX_CONCURRENCY_OLLAMA = int(os.getenv("LLM_MAX_CONCURRENCY_OLLAMA", "2"))
+LLM_MAX_CONCURRENCY_OPENAI = int(os.getenv("LLM_MAX_CONCURRENCY_OPENAI", "8"))
+LLM_COALESCE_ENABLED = os.getenv("LLM_COALESCE_ENABLED", "true").lower() == "true"
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")  # tiempo que Ollama mantiene el modelo cargado
+LLM_WARM_ON_CONNECT = os.getenv("LLM_WARM_ON_CONNECT", "true").lower() == "true"
+
+# Salida estructurada del planner: JSON forzado (Ollama format=json / modo JSON de OpenAI)
+DISPATCH_STRUCTURED_OUTPUT = os.getenv("DISPATCH_STRUCTURED_OUTPUT", "true").lower() == "true"
+DISPATCH_EARLY_COMMIT = os.getenv("DISPATCH_EARLY_COMMIT", "true").lower() == "true"  # decidir al leer "action"
+
+# Preguntas compuestas: subconsultas independientes ejecutadas en paralelo
+MULTI_QUERY_ENABLED = os.getenv("MULTI_QUERY_ENABLED", "true").lower() == "true"
+MULTI_QUERY_WORKERS = int(os.getenv("MULTI_QUERY_WORKERS", "4"))  # no más que DB_POOL_SIZE + DB_MAX_OVERFLOW
+MULTI_QUERY_MAX_QUERIES = int(os.getenv("MULTI_QUERY_MAX_QUERIES", "6"))
+
+# Instantáneas de resultados para las consultas SQL más frecuentes
+SNAPSHOT_ENABLED = os.getenv("SNAPSHOT_ENABLED", "true").lower() == "true"
+SNAPSHOT_AUTO = os.getenv("SNAPSHOT_AUTO", "true").lower() == "true"  # crear instantáneas sin confirmación
+SNAPSHOT_MIN_HITS = int(os.getenv("SNAPSHOT_MIN_HITS", "3"))  # veces que debe repetirse una consulta
+SNAPSHOT_MAX_AGE = int(os.getenv("SNAPSHOT_MAX_AGE", "900"))  # segundos que una instantánea se considera fresca
+SNAPSHOT_REFRESH_INTERVAL = int(os.getenv("SNAPSHOT_REFRESH_INTERVAL", "300"))
+SNAPSHOT_IDLE_TIMEOUT = int(os.getenv("SNAPSHOT_IDLE_TIMEOUT", "3600"))  # sin uso: deja de refrescarse
+SNAPSHOT_MAX_ENTRIES = int(os.getenv("SNAPSHOT_MAX_ENTRIES", "256"))
+
+# Historial del chat: solo se dibujan los últimos turnos; los mensajes grandes se guardan en disco
+CHAT_HISTORY_RECENT_TURNS = int(os.getenv("CHAT_HISTORY_RECENT_TURNS", "10"))
+CHAT_HISTORY_PAGE_TURNS = int(os.getenv("CHAT_HISTORY_PAGE_TURNS", "10"))  # turnos por página anterior
+CHAT_HISTORY_MAX_MESSAGES = int(os.getenv("CHAT_HISTORY_MAX_MESSAGES", "2000"))
+CHAT_SPILL_DIR = os.getenv("CHAT_SPILL_DIR", ".cache/spill")
+CHAT_SPILL_THRESHOLD = int(os.getenv("CHAT_SPILL_THRESHOLD", "2000"))  # caracteres a partir de los que se guarda fuera
+CHAT_SPILL_PREVIEW_CHARS = int(os.getenv("CHAT_SPILL_PREVIEW_CHARS", "300"))
+CHAT_SPILL_CACHE_ENTRIES = int(os.getenv("CHAT_SPILL_CACHE_ENTRIES", "64"))
+CHAT_SPILL_MAX_AGE_DAYS = int(os.getenv("CHAT_SPILL_MAX_AGE_DAYS", "7"))
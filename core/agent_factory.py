@@ -1,24 +1,44 @@
-from langchain.agents import create_sql_agent
-from langchain.agents.agent_types import AgentType
-from langchain_community.agent_toolkits import SQLDatabaseToolkit
 from langchain_core.prompts import PromptTemplate
 from langchain_core.runnables import RunnablePassthrough
 from langchain_core.output_parsers import StrOutputParser
 
-from config.settings import DISPATCH_PROMPT
+from config.settings import DECOMPOSE_PROMPT, DISPATCH_PROMPT, DISPATCH_STRUCTURED_OUTPUT
+
+# Request options that constrain each backend to emit a single JSON object
+JSON_MODE_OPTIONS = {
+    "ollama": {"format": "json"},
+    "openai": {"response_format": {"type": "json_object"}},
+}
 
 
 def create_sql_toolkit(db, llm):
     """Create SQL toolkit for database operations"""
+    from langchain_community.agent_toolkits import SQLDatabaseToolkit
+
     return SQLDatabaseToolkit(db=db, llm=llm)
 
 
-def create_dispatcher_chain(planner_llm):
+def extract_sql_queries(response):
+    """Return the SQL statements the agent executed successfully, in order"""
+    queries = []
+    for action, observation in response.get("intermediate_steps", []):
+        if getattr(action, "tool", None) != "sql_db_query":
+            continue
+        tool_input = action.tool_input
+        query = tool_input.get("query", "") if isinstance(tool_input, dict) else str(tool_input)
+        if query and not str(observation).startswith("Error"):
+            queries.append(query)
+    return queries
+
+
+def create_dispatcher_chain(planner_llm, model_type="ollama"):
     """Create the dispatcher chain for deciding which action to take"""
     dispatcher_prompt = PromptTemplate(
         template=DISPATCH_PROMPT,
         input_variables=["input"]
     )
+    if DISPATCH_STRUCTURED_OUTPUT and model_type in JSON_MODE_OPTIONS:
+        planner_llm = planner_llm.bind(**JSON_MODE_OPTIONS[model_type])
 
     dispatcher_chain = (
             {"input": RunnablePassthrough()}
@@ -30,8 +50,24 @@ def create_dispatcher_chain(planner_llm):
     return dispatcher_chain
 
 
+def create_decompose_chain(planner_llm, model_type="ollama"):
+    """Create the chain that splits a compound question into independent SQL queries"""
+    decompose_prompt = PromptTemplate(
+        template=DECOMPOSE_PROMPT,
+        input_variables=["schema_text", "input"]
+    )
+    if model_type in JSON_MODE_OPTIONS:
+        planner_llm = planner_llm.bind(**JSON_MODE_OPTIONS[model_type])
+
+    return decompose_prompt | planner_llm | StrOutputParser()
+
+
 def initialize_agents(db, llm, planner_llm=None, model_type="ollama"):
     """Initialize all agent components required for the application"""
+    # langchain.agents takes over a second to import, so it is only loaded once an agent is built
+    from langchain.agents import create_sql_agent
+    from langchain.agents.agent_types import AgentType
+
     if planner_llm is None:
         planner_llm = llm  # Use same LLM if planner not specified
 
@@ -45,12 +81,14 @@ def initialize_agents(db, llm, planner_llm=None, model_type="ollama"):
         agent_type=AgentType.OPENAI_FUNCTIONS if model_type == "openai" else AgentType.ZERO_SHOT_REACT_DESCRIPTION,
         verbose=True,
         handle_parsing_errors=True,
+        agent_executor_kwargs={"return_intermediate_steps": True},
     )
 
     # Create dispatcher
-    dispatcher_chain = create_dispatcher_chain(planner_llm)
+    dispatcher_chain = create_dispatcher_chain(planner_llm, model_type)
 
     return {
         "sql_agent": sql_agent,
-        "dispatcher_chain": dispatcher_chain
+        "dispatcher_chain": dispatcher_chain,
+        "decompose_chain": create_decompose_chain(planner_llm, model_type),
     }
\ No newline at end of file
@@ -0,0 +1,57 @@
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from config.settings import BACKGROUND_WORKERS
+
+logger = logging.getLogger(__name__)
+
+# Process-wide pool for work that must not delay the answer (summaries, memory writes, cache fills)
+_executor = ThreadPoolExecutor(max_workers=BACKGROUND_WORKERS, thread_name_prefix="background")
+
+# Pending tasks per key; tasks sharing a key run one at a time, in submission order
+_keyed_queues = {}
+_queues_lock = threading.Lock()
+
+
+def _run_safely(fn, args, kwargs):
+    try:
+        fn(*args, **kwargs)
+    except Exception:
+        logger.exception("Background task %s failed", getattr(fn, "__name__", fn))
+
+
+def _drain(key):
+    while True:
+        with _queues_lock:
+            queue = _keyed_queues[key]
+            if not queue:
+                del _keyed_queues[key]
+                return
+            fn, args, kwargs = queue.popleft()
+        _run_safely(fn, args, kwargs)
+
+
+def submit_background(fn, *args, key=None, **kwargs):
+    """
+    Run fn(*args, **kwargs) in the background pool.
+    Tasks submitted with the same key (e.g. one conversation memory) never run concurrently.
+    """
+    if key is None:
+        _executor.submit(_run_safely, fn, args, kwargs)
+        return
+
+    with _queues_lock:
+        queue = _keyed_queues.get(key)
+        if queue is not None:
+            queue.append((fn, args, kwargs))
+            return
+        _keyed_queues[key] = deque([(fn, args, kwargs)])
+    _executor.submit(_drain, key)
+
+
+def pending_background_tasks():
+    """Number of keyed tasks still waiting to run"""
+    with _queues_lock:
+        return sum(len(queue) for queue in _keyed_queues.values())
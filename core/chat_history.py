@@ -0,0 +1,133 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, deque, namedtuple
+
+from config.settings import (
+    CHAT_HISTORY_MAX_MESSAGES, CHAT_SPILL_CACHE_ENTRIES, CHAT_SPILL_DIR, CHAT_SPILL_MAX_AGE_DAYS,
+    CHAT_SPILL_PREVIEW_CHARS, CHAT_SPILL_THRESHOLD
+)
+
+logger = logging.getLogger(__name__)
+
+# text is the whole content, or only a preview when the content was spilled to disk under spill_id;
+# meta holds what the full-result view needs (id plus sql/sql_params or result_id), None otherwise
+ChatMessage = namedtuple("ChatMessage", ["role", "text", "spill_id", "meta"])
+
+
+class SpillStore:
+    """
+    Content-addressed files for large message contents, so the session state only keeps a preview and an id.
+    Recently read contents are kept in a small LRU; files older than `max_age_days` are pruned on startup.
+    """
+
+    def __init__(self, directory=CHAT_SPILL_DIR, cache_entries=CHAT_SPILL_CACHE_ENTRIES,
+                 max_age_days=CHAT_SPILL_MAX_AGE_DAYS):
+        self.directory = directory
+        self.cache_entries = cache_entries
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.prune(max_age_days * 86400)
+
+    def _path(self, spill_id):
+        return os.path.join(self.directory, f"{spill_id}.txt")
+
+    def _remember(self, spill_id, text):
+        with self._lock:
+            self._cache[spill_id] = text
+            self._cache.move_to_end(spill_id)
+            while len(self._cache) > self.cache_entries:
+                self._cache.popitem(last=False)
+
+    def put(self, text):
+        """Store text and return its id; identical contents share one file"""
+        spill_id = hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]
+        path = self._path(spill_id)
+        if not os.path.exists(path):
+            # Written aside and renamed, so a reader never sees a partial file
+            temp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                f.write(text)
+            os.replace(temp_path, path)
+        else:
+            os.utime(path)
+        self._remember(spill_id, text)
+        return spill_id
+
+    def get(self, spill_id):
+        """Text stored under spill_id, or None when its file is gone"""
+        with self._lock:
+            text = self._cache.get(spill_id)
+            if text is not None:
+                self._cache.move_to_end(spill_id)
+                return text
+        try:
+            with open(self._path(spill_id), "r", encoding="utf-8") as f:
+                text = f.read()
+        except FileNotFoundError:
+            return None
+        self._remember(spill_id, text)
+        return text
+
+    def prune(self, max_age_seconds):
+        """Delete spilled contents not written or reused for max_age_seconds"""
+        cutoff = time.time() - max_age_seconds
+        for entry in os.scandir(self.directory):
+            try:
+                if entry.is_file() and entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+            except OSError as e:
+                logger.warning("Could not prune spilled content %s: %s", entry.path, e)
+
+
+_spill_store = None
+_spill_lock = threading.Lock()
+
+
+def get_spill_store():
+    """Return the process-wide spill store, created on first use"""
+    global _spill_store
+    with _spill_lock:
+        if _spill_store is None:
+            _spill_store = SpillStore()
+        return _spill_store
+
+
+class ChatHistory:
+    """
+    Messages of one chat as compact tuples, oldest first. Contents above `spill_threshold` characters live
+    in the spill store and are only read back for the messages being rendered.
+    """
+
+    def __init__(self, spill_store=None, max_messages=CHAT_HISTORY_MAX_MESSAGES,
+                 spill_threshold=CHAT_SPILL_THRESHOLD):
+        self.spill_store = spill_store
+        self.spill_threshold = spill_threshold
+        self._messages = deque(maxlen=max_messages)
+
+    def __len__(self):
+        return len(self._messages)
+
+    def append(self, role, content, **meta):
+        spill_id = None
+        if self.spill_store is not None and len(content) > self.spill_threshold:
+            spill_id = self.spill_store.put(content)
+            content = content[:CHAT_SPILL_PREVIEW_CHARS]
+        message = ChatMessage(role, content, spill_id, meta or None)
+        self._messages.append(message)
+        return message
+
+    def window(self, count):
+        """The last count messages, oldest first, without copying the rest"""
+        start = max(0, len(self._messages) - count)
+        return [self._messages[i] for i in range(start, len(self._messages))]
+
+    def content(self, message):
+        """Full content of a message, read back from the spill store when needed"""
+        if message.spill_id is None:
+            return message.text
+        text = self.spill_store.get(message.spill_id)
+        return text if text is not None else f"{message.text}… (full content no longer available)"
@@ -0,0 +1,251 @@
+import io
+from collections import Counter
+from decimal import Decimal
+
+import numpy as np
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+except ImportError:  # Optional: COPY + Arrow fast path
+    pa = None
+    pa_csv = None
+
+from config.settings import COLUMNAR_MAX_ROWS, RESULT_FETCH_BATCH_SIZE
+
+# Values in the top-values list of each column
+TOP_VALUES = 3
+
+
+class ColumnarResult:
+    """Query result held as one NumPy array per column (backed by an Arrow table when fetched with COPY)"""
+
+    def __init__(self, names, arrays, row_count, truncated, table=None):
+        self.names = names
+        self.arrays = arrays
+        self.row_count = row_count
+        self.truncated = truncated
+        self.table = table
+
+    @classmethod
+    def from_rows(cls, names, rows, truncated=False):
+        """Build a result from row tuples, e.g. a page received from the API service"""
+        columns = list(zip(*rows)) if rows else [()] * len(names)
+        return cls(list(names), [_to_array(list(values)) for values in columns], len(rows), truncated)
+
+    def rows(self, n=None):
+        """First n rows as tuples of Python values"""
+        n = self.row_count if n is None else min(n, self.row_count)
+        if self.table is not None:
+            return [tuple(row.values()) for row in self.table.slice(0, n).to_pylist()]
+        return list(zip(*(array[:n].tolist() for array in self.arrays)))
+
+    def frame_data(self):
+        """Data for st.dataframe and charts without copying: the Arrow table or a dict of column arrays"""
+        if self.table is not None:
+            return self.table
+        return dict(zip(self.names, self.arrays))
+
+    def numeric_columns(self):
+        return [name for name, array in zip(self.names, self.arrays) if _numeric_values(array) is not None]
+
+
+def _is_numeric(array):
+    return np.issubdtype(array.dtype, np.number) and not np.issubdtype(array.dtype, np.bool_)
+
+
+def _is_number(value):
+    return isinstance(value, (int, float, Decimal)) and not isinstance(value, bool)
+
+
+def _float_exact(value):
+    """Whether a number survives conversion to float, as far as its printed value goes"""
+    if isinstance(value, float):
+        return True
+    if isinstance(value, int):
+        return abs(value) <= 2 ** 53
+    return value.is_finite() and Decimal(repr(float(value))) == value
+
+
+def _to_array(values):
+    """
+    Build a typed array when the column converts without losing anything (no NULLs, ints within int64,
+    only floats), falling back to an object array of the original values
+    """
+    if values and all(isinstance(v, int) and not isinstance(v, bool) and -2 ** 63 <= v < 2 ** 63 for v in values):
+        return np.asarray(values, dtype=np.int64)
+    if values and all(isinstance(v, float) for v in values):
+        return np.asarray(values, dtype=np.float64)
+    array = np.empty(len(values), dtype=object)
+    array[:] = values
+    return array
+
+
+def _numeric_values(array):
+    """
+    Float array of a numeric column for statistics and charts (NaN for NULLs), or None when the column
+    is not numeric or one of its values would change as a float
+    """
+    if _is_numeric(array):
+        return array
+    if array.dtype != object:
+        return None
+    values = array.tolist()
+    non_null = [v for v in values if v is not None]
+    if not non_null or not all(_is_number(v) and _float_exact(v) for v in non_null):
+        return None
+    return np.asarray([np.nan if v is None else float(v) for v in values], dtype=np.float64)
+
+
+def _copy_supported(engine, command, parameters):
+    return (pa is not None and engine.dialect.name == "postgresql" and isinstance(command, str)
+            and not parameters)
+
+
+# PostgreSQL type OIDs whose CSV text converts exactly; anything else stays a string, so '01234' or
+# numeric-looking text reach the LLM as they are stored
+_INTEGER_OIDS = {20, 21, 23}
+_FLOAT_OIDS = {700, 701}
+_NUMERIC_OID = 1700
+
+
+class _CopyUnsupported(Exception):
+    """The result has a column Arrow cannot hold exactly"""
+
+
+def _arrow_type(column):
+    if column.type_code in _INTEGER_OIDS:
+        return pa.int64()
+    if column.type_code in _FLOAT_OIDS:
+        return pa.float64()
+    if column.type_code == _NUMERIC_OID:
+        # Exact decimals need a declared precision; unconstrained NUMERIC goes through the cursor
+        if column.precision is None or column.scale is None or column.precision > 38:
+            raise _CopyUnsupported(column.name)
+        return pa.decimal128(column.precision, column.scale)
+    if column.type_code == 16:
+        return pa.bool_()
+    return pa.string()
+
+
+def _to_numpy(column):
+    # Arrow turns integer columns with NULLs into floats; those keep their Python values instead
+    if column.null_count or pa.types.is_decimal(column.type):
+        return _to_array(column.to_pylist())
+    return column.to_numpy(zero_copy_only=False)
+
+
+def _copy_errors(engine):
+    """Errors that mean the COPY fast path cannot be used, as opposed to the query itself failing"""
+    return (AttributeError, engine.dialect.dbapi.NotSupportedError, pa.ArrowException, _CopyUnsupported)
+
+
+def _fetch_with_copy(engine, sql, max_rows):
+    """COPY the result as CSV straight into an Arrow table, bypassing per-row Python objects"""
+    limited = f"SELECT * FROM ({sql.strip().rstrip(';')}) AS columnar_result LIMIT {int(max_rows) + 1}"
+    buffer = io.BytesIO()
+    with engine.connect() as conn:
+        cursor = conn.connection.dbapi_connection.cursor()
+        try:
+            # Column types come from the query itself, never guessed from the CSV text
+            cursor.execute(f"SELECT * FROM ({limited}) AS columnar_types LIMIT 0")
+            column_types = {column.name: _arrow_type(column) for column in cursor.description}
+            # NULL is written as an unquoted \N; a value equal to it is quoted, so '' and '\N' stay strings
+            cursor.copy_expert(f"COPY ({limited}) TO STDOUT WITH (FORMAT csv, HEADER true, NULL '\\N')", buffer)
+        finally:
+            cursor.close()
+    buffer.seek(0)
+    table = pa_csv.read_csv(buffer, convert_options=pa_csv.ConvertOptions(
+        column_types=column_types, null_values=["\\N"], strings_can_be_null=True,
+        quoted_strings_can_be_null=False, true_values=["t"], false_values=["f"],
+    ))
+    truncated = table.num_rows > max_rows
+    if truncated:
+        table = table.slice(0, max_rows)
+    arrays = [_to_numpy(column) for column in table.columns]
+    return ColumnarResult(table.column_names, arrays, table.num_rows, truncated, table)
+
+
+def fetch_columnar(engine, command, max_rows=COLUMNAR_MAX_ROWS, parameters=None, execution_options=None):
+    """Fetch up to max_rows rows into per-column arrays"""
+    from core.result_stream import is_paginable, stream_rows
+
+    if _copy_supported(engine, command, parameters) and is_paginable(command):
+        try:
+            return _fetch_with_copy(engine, command, max_rows)
+        except _copy_errors(engine):
+            pass  # COPY or Arrow cannot handle this result; SQL errors (timeouts, bad columns) propagate
+
+    names, buffers, row_count, truncated = [], None, 0, False
+    batches = stream_rows(engine, command, parameters, RESULT_FETCH_BATCH_SIZE, execution_options)
+    try:
+        for names, batch in batches:
+            if buffers is None:
+                buffers = [[] for _ in names]
+            taken = batch[:max_rows - row_count]
+            for buffer, values in zip(buffers, zip(*taken)):
+                buffer.extend(values)
+            row_count += len(taken)
+            if row_count >= max_rows:
+                truncated = len(taken) < len(batch) or next(batches, None) is not None
+                break
+    finally:
+        batches.close()
+
+    arrays = [_to_array(buffer) for buffer in buffers] if buffers else []
+    return ColumnarResult(names, arrays, row_count, truncated)
+
+
+def summarize_column(array):
+    """Vectorized statistics of one column"""
+    numeric = _numeric_values(array)
+    if numeric is not None:
+        valid = numeric if np.issubdtype(numeric.dtype, np.integer) else numeric[~np.isnan(numeric)]
+        stats = {"count": int(valid.size), "nulls": int(array.size - valid.size)}
+        if valid.size:
+            q25, q50, q75 = np.quantile(valid, [0.25, 0.5, 0.75])
+            uniques, counts = np.unique(valid, return_counts=True)
+            top = np.argsort(counts)[::-1][:TOP_VALUES]
+            stats.update({
+                "min": valid.min().item(), "max": valid.max().item(), "mean": round(valid.mean().item(), 4),
+                "p25": q25.item(), "p50": q50.item(), "p75": q75.item(), "distinct": int(uniques.size),
+            })
+            if uniques.size < valid.size:  # Top values say nothing about unique columns
+                stats["top"] = [(uniques[i].item(), int(counts[i])) for i in top]
+        return stats
+
+    if np.issubdtype(array.dtype, np.datetime64):
+        valid = array[~np.isnat(array)]
+        stats = {"count": int(valid.size), "nulls": int(array.size - valid.size)}
+        if valid.size:
+            stats.update({"min": str(valid.min()), "max": str(valid.max()), "distinct": int(np.unique(valid).size)})
+        return stats
+
+    valid = [value for value in array.tolist() if value is not None]
+    stats = {"count": len(valid), "nulls": int(array.size) - len(valid)}
+    if valid:
+        counts = Counter(str(value) for value in valid)
+        stats["distinct"] = len(counts)
+        if len(counts) < len(valid):
+            stats["top"] = counts.most_common(TOP_VALUES)
+        try:
+            stats.update({"min": str(min(valid)), "max": str(max(valid))})
+        except TypeError:
+            pass  # Mixed, unorderable types
+    return stats
+
+
+def format_column_summary(result, max_value_length=60):
+    """Compact text with the statistics of every column, sent to the LLM instead of raw rows"""
+    lines = []
+    for name, array in zip(result.names, result.arrays):
+        stats = summarize_column(array)
+        parts = []
+        for key, value in stats.items():
+            if key == "top":
+                value = ", ".join(f"{str(v)[:max_value_length]} ({c})" for v, c in value)
+            elif isinstance(value, str):
+                value = value[:max_value_length]
+            parts.append(f"{key}={value}")
+        lines.append(f"- {name}: " + "; ".join(parts))
+    return "\n".join(lines)
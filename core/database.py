@@ -1,39 +1,164 @@
-from langchain_community.utilities.sql_database import SQLDatabase
-from sqlalchemy import inspect
+import hashlib
+import threading
+import time
+import weakref
+
+from sqlalchemy import event, text
 from langchain_core.messages import SystemMessage
 
+from config.settings import (
+    DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE,
+    DB_POOL_PRE_PING, DB_ENGINE_IDLE_TIMEOUT
+)
+from core.guardrails import session_options
+from core.result_stream import StreamingSQLDatabase
+from core.schema_cache import load_schema_catalog, format_schema
+
+# Process-wide registry of SQLDatabase objects, shared by every session using the same credentials.
+# Entries hold the database weakly, plus a strong reference while it is in use, so an engine stays
+# registered (and shared) for as long as any session, agent or snapshot still holds its database.
+_engine_registry = {}
+# Reentrant: the finalizer of a collected database can run while this thread holds the lock
+_registry_lock = threading.RLock()
+
+
+def _registry_key(db_user, db_password, db_host, db_port, db_name):
+    """Build a registry key without keeping the raw password around"""
+    raw = f"{db_user}:{db_password}@{db_host}:{db_port}/{db_name}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _touch_entry(entry):
+    """Pool checkout listener that marks the engine as recently used"""
+    def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+        entry["last_used"] = time.time()
+    return _on_checkout
+
+
+def _forget_engine(key, ref, engine):
+    """Finalizer of a registered database: unregister it and close its pool once nothing holds it"""
+    with _registry_lock:
+        entry = _engine_registry.get(key)
+        if entry is not None and entry["ref"] is ref:
+            del _engine_registry[key]
+    engine.dispose()
+
+
+def evict_idle_engines(idle_timeout=DB_ENGINE_IDLE_TIMEOUT):
+    """
+    Release the registry's hold on engines whose pool has not been used for `idle_timeout` seconds.
+    The pool is only disposed once no session or agent references the database anymore.
+    """
+    now = time.time()
+    with _registry_lock:
+        for entry in list(_engine_registry.values()):
+            db = entry["db"]
+            if db is not None and db._engine.pool.checkedout() == 0 and now - entry["last_used"] > idle_timeout:
+                entry["db"] = None
+
 
 def connect_to_database(db_user, db_password, db_host, db_port, db_name):
-    """Connect to PostgreSQL database and return SQLDatabase object"""
-    connection_string = f"postgresql+psycopg2://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}"
-    try:
-        db = SQLDatabase.from_uri(connection_string)
+    """Connect to PostgreSQL database and return a shared SQLDatabase object"""
+    evict_idle_engines()
+
+    key = _registry_key(db_user, db_password, db_host, db_port, db_name)
+    with _registry_lock:
+        entry = _engine_registry.get(key)
+        db = entry["ref"]() if entry is not None else None
+        if db is not None:
+            entry["db"] = db
+            entry["last_used"] = time.time()
+            return db
+
+        connection_string = f"postgresql+psycopg2://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}"
+        engine_args = {
+            "pool_size": DB_POOL_SIZE,
+            "max_overflow": DB_MAX_OVERFLOW,
+            "pool_timeout": DB_POOL_TIMEOUT,
+            "pool_recycle": DB_POOL_RECYCLE,
+            "pool_pre_ping": DB_POOL_PRE_PING,
+            # Every pooled session gets the statement timeout and read-only transactions
+            "connect_args": {"options": session_options()},
+        }
+        try:
+            # Table metadata is reflected on demand; the schema prompt comes from the cached catalog
+            db = StreamingSQLDatabase.from_uri(connection_string, engine_args=engine_args, lazy_table_reflection=True)
+        except Exception as e:
+            raise ConnectionError(f"Failed to connect to database: {str(e)}")
+
+        entry = {
+            "db": db,
+            "ref": weakref.ref(db),
+            "label": f"{db_user}@{db_host}:{db_port}/{db_name}",
+            "created": time.time(),
+            "last_used": time.time(),
+        }
+        event.listen(db._engine, "checkout", _touch_entry(entry))
+        weakref.finalize(db, _forget_engine, key, entry["ref"], db._engine)
+        _engine_registry[key] = entry
         return db
-    except Exception as e:
-        raise ConnectionError(f"Failed to connect to database: {str(e)}")
 
 
-def build_schema_prompt(db):
-    """Extract real tables and columns from PostgreSQL and build schema instruction block."""
-    inspector = inspect(db._engine)
-    schema_lines = ["The database has the following tables and columns:\n"]
+def get_pool_stats():
+    """Return connection pool statistics for every registered engine"""
+    now = time.time()
+    with _registry_lock:
+        entries = list(_engine_registry.values())
+
+    stats = []
+    for entry in entries:
+        db = entry["ref"]()
+        if db is None:
+            continue
+        pool = db._engine.pool
+        stats.append({
+            "database": entry["label"],
+            "pool_size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": pool.overflow(),
+            "idle_seconds": int(now - entry["last_used"]),
+        })
+    return stats
+
 
-    for table_name in inspector.get_table_names():
-        columns = inspector.get_columns(table_name)
-        column_list = [f"- {col['name']} ({col['type']})" for col in columns]
-        schema_lines.append(f"Table: {table_name}")
-        schema_lines.extend(column_list)
-        schema_lines.append("")  # Blank line between tables
+# Cumulative row changes per table; bumps whenever the table's data changes
+TABLE_VERSIONS_QUERY = text("""
+SELECT relname AS table_name, n_tup_ins + n_tup_upd + n_tup_del AS version
+FROM pg_catalog.pg_stat_user_tables
+WHERE schemaname = current_schema() AND relname = ANY(:tables)
+""")
 
-    return "\n".join(schema_lines)
 
+def get_table_versions(db, table_names):
+    """Return {table: version} for the given tables, None for tables without statistics"""
+    versions = dict.fromkeys(table_names)
+    if not table_names or db.dialect != "postgresql":
+        return versions
+    with db._engine.connect() as conn:
+        for row in conn.execute(TABLE_VERSIONS_QUERY, {"tables": list(table_names)}):
+            versions[row.table_name] = row.version
+    return versions
 
-def inject_db_schema_to_memory(db, memory, debug=False):
+
+def build_schema_prompt(db):
+    """Extract real tables and columns from PostgreSQL and build schema instruction block."""
+    return format_schema(load_schema_catalog(db))
+
+
+def inject_db_schema_to_memory(db, memory, debug=False, schema_index=None):
     """
     Injects the real database schema as a SystemMessage into the memory context.
     Ensures that the LLM (e.g., Ollama) only uses real tables/columns.
+    With a schema index on a large database only the table names are injected; the
+    columns of the relevant tables are sent with each question instead.
     """
-    schema_text = build_schema_prompt(db)
+    if schema_index is not None and len(schema_index.catalog) > schema_index.top_k:
+        schema_text = "The database has the following tables: " + ", ".join(schema_index.table_names)
+    elif schema_index is not None:
+        schema_text = format_schema(schema_index.catalog)
+    else:
+        schema_text = build_schema_prompt(db)
 
     from config.settings import DB_SCHEMA_PROMPT
     system_msg = SystemMessage(content=DB_SCHEMA_PROMPT.format(schema_text=schema_text))
@@ -47,12 +172,3 @@ def inject_db_schema_to_memory(db, memory, debug=False):
 
     return schema_text
 
-
-def get_table_preview(db, table_name, limit=5):
-    """Get a preview of a database table"""
-    query = f"SELECT * FROM {table_name} LIMIT {limit};"
-    try:
-        result = db.run(query)
-        return result
-    except Exception as e:
-        return f"Error querying {table_name}: {str(e)}"
\ No newline at end of file
@@ -0,0 +1,93 @@
+import re
+import threading
+
+from config.settings import FAST_DISPATCH_THRESHOLD
+from utils.text_search import tokenize
+
+_GREETING_RE = re.compile(
+    r"^\s*(hi|hello|hey|hola|buenas|good (morning|afternoon|evening)|thanks|thank you|thx|gracias|ok|okay|bye)\b",
+    re.IGNORECASE,
+)
+_HELP_RE = re.compile(
+    r"\b(how does (this|the) (system|app|application|tool|agent) work|what can you do|who are you|help me use)\b",
+    re.IGNORECASE,
+)
+_MEMORY_RE = re.compile(
+    r"\b(before|earlier|previous(ly)?|you (showed|said|told|mentioned|gave|found)|(last|that|those|these) "
+    r"(answer|result|results|response|query|queries|table you)|we (talked|discussed)|remind me|"
+    r"explain (more|that|those|it))\b",
+    re.IGNORECASE,
+)
+_DATA_RE = re.compile(
+    r"\b(show|list|count|how many|how much|top \d+|last \d+|first \d+|average|avg|sum|total|max(imum)?|"
+    r"min(imum)?|find|select|group(ed)? by|per|rows?|records?|latest|oldest)\b",
+    re.IGNORECASE,
+)
+
+
+class FastDispatcher:
+    """
+    Local rule-based classifier that decides obvious cases without calling the planner LLM.
+    Returns a decision only when its confidence reaches the threshold.
+    """
+
+    def __init__(self, table_names, threshold=FAST_DISPATCH_THRESHOLD):
+        self.threshold = threshold
+        # Table names as token tuples, so "order_items" needs both "order" and "item" in the question
+        self._tables = {name: frozenset(tokenize(name)) for name in table_names}
+        self._lock = threading.Lock()
+        self.fast_hits = 0
+        self.fallbacks = 0
+
+    def _matched_tables(self, tokens):
+        return [name for name, table_tokens in self._tables.items() if table_tokens and table_tokens <= tokens]
+
+    def score(self, prompt):
+        """Return ({action: score}, matched tables)"""
+        tokens = frozenset(tokenize(prompt))
+        tables = self._matched_tables(tokens)
+        scores = {"database_query": 0.0, "memory_lookup": 0.0, "direct_response": 0.0}
+
+        if _GREETING_RE.match(prompt) and len(prompt.split()) <= 5:
+            scores["direct_response"] = 0.95
+        if _HELP_RE.search(prompt):
+            scores["direct_response"] = max(scores["direct_response"], 0.9)
+        if _MEMORY_RE.search(prompt):
+            scores["memory_lookup"] = 0.9
+
+        has_data_words = _DATA_RE.search(prompt) is not None
+        if tables and has_data_words:
+            scores["database_query"] = 0.9
+        elif tables:
+            scores["database_query"] = 0.75
+        elif has_data_words:
+            scores["database_query"] = 0.4
+
+        return scores, tables
+
+    def classify(self, prompt):
+        """Return (reasoning, action, explanation, confidence) for confident cases, None otherwise"""
+        scores, tables = self.score(prompt)
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        (action, best), (_, runner_up) = ranked[0], ranked[1]
+        # Competing signals ("show the orders you showed before") lower the confidence
+        confidence = best - runner_up / 2 if runner_up >= 0.5 else best
+
+        with self._lock:
+            if confidence < self.threshold:
+                self.fallbacks += 1
+                return None
+            self.fast_hits += 1
+
+        reasoning = f"Rule-based match: {action}" + (f" (tables: {', '.join(tables)})" if tables else "")
+        explanation = f"Decided locally with confidence {confidence:.2f}, planner LLM skipped"
+        return reasoning, action, explanation, confidence
+
+    def stats(self):
+        with self._lock:
+            total = self.fast_hits + self.fallbacks
+            return {
+                "fast_hits": self.fast_hits,
+                "fallbacks": self.fallbacks,
+                "hit_rate": self.fast_hits / total if total else 0.0,
+            }
@@ -0,0 +1,94 @@
+import json
+import re
+import threading
+
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+
+from config.settings import (
+    QUERY_MAX_COST, QUERY_MAX_ROWS, QUERY_AUTO_LIMIT, QUERY_STATEMENT_TIMEOUT_MS, QUERY_READ_ONLY
+)
+
+_READ_QUERY_RE = re.compile(r"^\s*(select|with|table|values)\b", re.IGNORECASE)
+
+_stats = {"checked": 0, "rejected": 0, "limited": 0}
+_stats_lock = threading.Lock()
+
+
+class QueryRejected(SQLAlchemyError):
+    """Raised before execution when a query's estimated plan is over the configured limits"""
+
+
+def session_options():
+    """libpq options applied to every pooled connection: statement timeout and read-only transactions"""
+    options = [f"-c statement_timeout={QUERY_STATEMENT_TIMEOUT_MS}"]
+    if QUERY_READ_ONLY:
+        options.append("-c default_transaction_read_only=on")
+    return " ".join(options)
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def _sql_text(command):
+    return (command.text if hasattr(command, "text") else command).strip().rstrip(";").strip()
+
+
+def explain_query(conn, sql, parameters=None):
+    """Return the top plan node of `EXPLAIN (FORMAT JSON)` for the query, without running it"""
+    plan = conn.execute(text(f"EXPLAIN (FORMAT JSON) {sql}"), parameters or {}).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]["Plan"]
+
+
+def guard_query(engine, command, parameters=None):
+    """
+    Check a read query's estimated cost and row count before it runs. Returns the command to execute
+    (with a LIMIT added when it would return too many rows) and a note for the agent, or raises
+    QueryRejected with feedback the agent can use to write a cheaper query.
+    """
+    if engine.dialect.name != "postgresql":
+        return command, None
+    sql = _sql_text(command)
+    if not _READ_QUERY_RE.match(sql):
+        return command, None
+
+    _count("checked")
+    with engine.connect() as conn:
+        plan = explain_query(conn, sql, parameters)
+        note = None
+        if plan["Plan Rows"] > QUERY_MAX_ROWS and plan["Node Type"] != "Limit" and QUERY_AUTO_LIMIT:
+            # The trailing newline keeps the LIMIT out of a trailing "--" comment
+            sql = f"{sql}\nLIMIT {QUERY_MAX_ROWS}"
+            plan = explain_query(conn, sql, parameters)
+            command = text(sql)
+            note = (f"Note: the query was estimated to return too many rows, so only the first "
+                    f"{QUERY_MAX_ROWS} were read. Aggregate or filter in SQL for complete answers.")
+
+    cost, rows = plan["Total Cost"], plan["Plan Rows"]
+    if cost > QUERY_MAX_COST:
+        _count("rejected")
+        raise QueryRejected(
+            f"Query rejected before execution: estimated cost {cost:.0f} is above the limit of "
+            f"{QUERY_MAX_COST:.0f} (top plan node: {plan['Node Type']}). Write a cheaper query: filter "
+            f"with WHERE on indexed columns, join on keys instead of cross joining, aggregate in SQL "
+            f"and add a LIMIT."
+        )
+    if rows > QUERY_MAX_ROWS:
+        _count("rejected")
+        raise QueryRejected(
+            f"Query rejected before execution: it is estimated to return {rows} rows, above the limit "
+            f"of {QUERY_MAX_ROWS}. Aggregate, filter or use a smaller LIMIT."
+        )
+    if note is not None:
+        _count("limited")
+    return command, note
+
+
+def get_guardrail_stats():
+    """Return how many queries were checked, rejected and limited"""
+    with _stats_lock:
+        return dict(_stats)
@@ -0,0 +1,332 @@
+import asyncio
+import contextlib
+import copy
+import hashlib
+import heapq
+import itertools
+import json
+import logging
+import threading
+import time
+import urllib.request
+from concurrent.futures import Future
+from typing import Any
+
+from langchain_core.language_models import BaseChatModel
+from pydantic import Field
+
+from config.settings import (
+    LLM_COALESCE_ENABLED, LLM_MAX_CONCURRENCY_OLLAMA, LLM_MAX_CONCURRENCY_OPENAI, OLLAMA_KEEP_ALIVE,
+    DEFAULT_OLLAMA_HOST
+)
+from core.tracing import current_trace
+
+logger = logging.getLogger(__name__)
+
+# Lower runs first: answers the user is waiting for go ahead of summaries and warm-ups
+PRIORITIES = {"interactive": 0, "background": 1}
+
+# Result of a coalesced request whose leader was cancelled; its followers make the request themselves
+_ABANDONED = object()
+
+
+class _Waiter:
+    def __init__(self, priority, seq, wake):
+        self.priority = priority
+        self.rank = (PRIORITIES.get(priority, 0), seq)
+        self.wake = wake
+
+    def __lt__(self, other):
+        return self.rank < other.rank
+
+
+class LLMGateway:
+    """
+    Admission control for one LLM backend (an Ollama host or the OpenAI API). At most max_concurrency
+    requests are in flight; the rest wait by priority, then arrival. Identical prompts that are already
+    in flight are coalesced into one request whose result every caller shares.
+    """
+
+    def __init__(self, name, max_concurrency):
+        self.name = name
+        self.max_concurrency = max(1, max_concurrency)
+        self._lock = threading.Lock()
+        self._waiters = []
+        self._seq = itertools.count()
+        self._in_flight = 0
+        self._pending = {}
+        self._stats = {"calls": 0, "queued": 0, "coalesced": 0, "max_queue_depth": 0,
+                       "wait_seconds": 0.0, "max_wait_seconds": 0.0}
+
+    def _enqueue_locked(self, priority, wake):
+        """Take a free slot now (returns None) or queue a waiter that is woken once granted one"""
+        self._stats["calls"] += 1
+        if self._in_flight < self.max_concurrency and not self._waiters:
+            self._in_flight += 1
+            return None
+        waiter = _Waiter(priority, next(self._seq), wake)
+        heapq.heappush(self._waiters, waiter)
+        self._stats["queued"] += 1
+        self._stats["max_queue_depth"] = max(self._stats["max_queue_depth"], len(self._waiters))
+        return waiter
+
+    def _grant_locked(self):
+        while self._waiters and self._in_flight < self.max_concurrency:
+            self._in_flight += 1
+            heapq.heappop(self._waiters).wake()
+
+    def _record_wait(self, started, priority):
+        waited = time.time() - started
+        with self._lock:
+            self._stats["wait_seconds"] += waited
+            self._stats["max_wait_seconds"] = max(self._stats["max_wait_seconds"], waited)
+        trace = current_trace()
+        if trace is not None:
+            trace.add_span("llm_queue", started, started + waited, backend=self.name, priority=priority)
+
+    def acquire(self, priority="interactive"):
+        """Block until a request slot is free"""
+        started = time.time()
+        granted = threading.Event()
+        with self._lock:
+            waiter = self._enqueue_locked(priority, granted.set)
+        if waiter is not None:
+            granted.wait()
+            self._record_wait(started, priority)
+
+    async def aacquire(self, priority="interactive"):
+        """Wait for a request slot without blocking the event loop"""
+        started = time.time()
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+
+        def wake():
+            loop.call_soon_threadsafe(lambda: granted.done() or granted.set_result(True))
+
+        with self._lock:
+            waiter = self._enqueue_locked(priority, wake)
+        if waiter is None:
+            return
+        try:
+            await granted
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                    heapq.heapify(self._waiters)
+                    waiter = None
+            if waiter is not None:
+                # The slot was granted just as the caller gave up
+                self.release()
+            raise
+        self._record_wait(started, priority)
+
+    def release(self):
+        with self._lock:
+            self._in_flight -= 1
+            self._grant_locked()
+
+    @contextlib.contextmanager
+    def slot(self, priority="interactive"):
+        self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+    @contextlib.asynccontextmanager
+    async def aslot(self, priority="interactive"):
+        await self.aacquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def _join(self, key):
+        """Return (future, is_leader) for a request key; followers share the leader's future"""
+        with self._lock:
+            future = self._pending.get(key)
+            if future is not None:
+                self._stats["coalesced"] += 1
+                return future, False
+            future = self._pending[key] = Future()
+            return future, True
+
+    def _settle(self, key, future, result=None, error=None):
+        with self._lock:
+            self._pending.pop(key, None)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def call(self, key, fn, priority="interactive"):
+        """Run fn() within a slot, or wait for the identical request already in flight"""
+        if key is None:
+            with self.slot(priority):
+                return fn()
+        future, leader = self._join(key)
+        if not leader:
+            result = future.result()
+            if result is _ABANDONED:
+                return self.call(key, fn, priority)
+            # Callers may mutate what they get back (langchain sets message ids), so each gets its own copy
+            return copy.deepcopy(result)
+        try:
+            with self.slot(priority):
+                result = fn()
+        except Exception as e:
+            self._settle(key, future, error=e)
+            raise
+        except BaseException:
+            # Cancellation or shutdown of this caller only, not an answer to share
+            self._settle(key, future, _ABANDONED)
+            raise
+        self._settle(key, future, result)
+        return result
+
+    async def acall(self, key, afn, priority="interactive"):
+        """Async call(): await afn() within a slot, or the identical request already in flight"""
+        if key is None:
+            async with self.aslot(priority):
+                return await afn()
+        future, leader = self._join(key)
+        if not leader:
+            # Shielded, so a follower that gives up does not cancel the future the others share
+            result = await asyncio.shield(asyncio.wrap_future(future))
+            if result is _ABANDONED:
+                return await self.acall(key, afn, priority)
+            return copy.deepcopy(result)
+        try:
+            async with self.aslot(priority):
+                result = await afn()
+        except Exception as e:
+            self._settle(key, future, error=e)
+            raise
+        except BaseException:
+            self._settle(key, future, _ABANDONED)
+            raise
+        self._settle(key, future, result)
+        return result
+
+    def stats(self):
+        with self._lock:
+            queued = {name: 0 for name in PRIORITIES}
+            for waiter in self._waiters:
+                queued[waiter.priority] = queued.get(waiter.priority, 0) + 1
+            stats = dict(self._stats)
+            in_flight = self._in_flight
+        waits = stats.pop("wait_seconds")
+        return {
+            "backend": self.name,
+            "max_concurrency": self.max_concurrency,
+            "in_flight": in_flight,
+            "queue_depth": sum(queued.values()),
+            "queued_by_priority": queued,
+            **stats,
+            "avg_wait_seconds": round(waits / stats["queued"], 3) if stats["queued"] else 0.0,
+        }
+
+
+_gateways = {}
+_gateways_lock = threading.Lock()
+
+
+def get_gateway(model_type, base_url=None):
+    """Return the process-wide gateway for an LLM backend; every model on one host shares it"""
+    if model_type == "ollama":
+        name, limit = f"ollama {base_url or DEFAULT_OLLAMA_HOST}", LLM_MAX_CONCURRENCY_OLLAMA
+    else:
+        name, limit = f"{model_type} {base_url or 'api'}", LLM_MAX_CONCURRENCY_OPENAI
+    with _gateways_lock:
+        gateway = _gateways.get(name)
+        if gateway is None:
+            gateway = _gateways[name] = LLMGateway(name, limit)
+        return gateway
+
+
+def get_gateway_stats():
+    with _gateways_lock:
+        gateways = list(_gateways.values())
+    return [gateway.stats() for gateway in gateways]
+
+
+def _request_key(model, messages, stop, kwargs, credential=None):
+    """Identity of a request: same credential, model settings, messages, stop words and call options"""
+    payload = json.dumps(
+        [credential, model._identifying_params, [(m.type, m.content, m.additional_kwargs) for m in messages],
+         stop, kwargs],
+        sort_keys=True, default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class GatewayChatModel(BaseChatModel):
+    """
+    Chat model that sends every call of the wrapped client through its backend's gateway.
+    Whole responses are coalesced across identical in-flight prompts; streams only share the slot limit.
+    """
+
+    inner: BaseChatModel
+    gateway: Any = Field(exclude=True)
+    priority: str = "interactive"
+    # Hash of the API key, so identical prompts are only coalesced among callers billed to the same key
+    credential: str | None = None
+
+    @property
+    def _llm_type(self):
+        return self.inner._llm_type
+
+    @property
+    def _identifying_params(self):
+        return self.inner._identifying_params
+
+    def _coalesce_key(self, messages, stop, kwargs):
+        return _request_key(self.inner, messages, stop, kwargs, self.credential) if LLM_COALESCE_ENABLED else None
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        return self.gateway.call(
+            self._coalesce_key(messages, stop, kwargs),
+            lambda: self.inner._generate(messages, stop=stop, run_manager=run_manager, **kwargs),
+            self.priority,
+        )
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        return await self.gateway.acall(
+            self._coalesce_key(messages, stop, kwargs),
+            lambda: self.inner._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs),
+            self.priority,
+        )
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        with self.gateway.slot(self.priority):
+            yield from self.inner._stream(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        # A plain try/finally, so a consumer that stops reading early still frees the slot on close
+        await self.gateway.aacquire(self.priority)
+        try:
+            chunks = self.inner._astream(messages, stop=stop, run_manager=run_manager, **kwargs)
+            async with contextlib.aclosing(chunks):
+                async for chunk in chunks:
+                    yield chunk
+        finally:
+            self.gateway.release()
+
+
+def warm_model(model_type, model_name, base_url=None):
+    """Load an Ollama model ahead of the first question and keep it resident for OLLAMA_KEEP_ALIVE"""
+    if model_type != "ollama":
+        return
+    # A generate request without a prompt only loads the model
+    request = urllib.request.Request(
+        f"{(base_url or DEFAULT_OLLAMA_HOST).rstrip('/')}/api/generate",
+        data=json.dumps({"model": model_name, "keep_alive": OLLAMA_KEEP_ALIVE}).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+    )
+    try:
+        with get_gateway(model_type, base_url).slot("background"):
+            with urllib.request.urlopen(request, timeout=120) as response:
+                response.read()
+    except OSError as e:
+        logger.warning("Could not warm up %s on %s: %s", model_name, base_url or DEFAULT_OLLAMA_HOST, e)
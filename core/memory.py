@@ -1,15 +1,147 @@
-from langchain.memory import ConversationBufferMemory, ConversationSummaryMemory
+import threading
+import time
 
+from langchain_core.chat_history import InMemoryChatMessageHistory
+from langchain_core.messages import SystemMessage
+
+from config.settings import (
+    MEMORY_WINDOW_TURNS, MEMORY_SUMMARY_TOKEN_THRESHOLD, SUMMARY_UPDATE_PROMPT
+)
+from core.background import submit_background
+from utils.text_search import estimate_tokens
+
+
+class HybridSummaryMemory:
+    """
+    Keeps the last `window_turns` turns verbatim and folds older turns into a cached running summary.
+    Older turns are summarized in batches, in the background, once they exceed `summary_token_threshold`
+    tokens, instead of one blocking LLM call on every turn like ConversationSummaryMemory.
+    """
+
+    def __init__(self, llm, window_turns=MEMORY_WINDOW_TURNS,
+                 summary_token_threshold=MEMORY_SUMMARY_TOKEN_THRESHOLD, memory_key="chat_history"):
+        self.llm = llm
+        self.window_turns = window_turns
+        self.summary_token_threshold = summary_token_threshold
+        self.memory_key = memory_key
+        self.chat_memory = InMemoryChatMessageHistory()
+        self.buffer = ""  # Running summary, only recomputed when a new batch is folded in
+        self._pending = []  # (human, ai) turns that left the window and are not summarized yet
+        self._summarizing = False
+        self._lock = threading.Lock()
+        self.on_summary = None  # Called with each new summary, e.g. to persist it
+        self.stats = {
+            "summary_calls": 0,
+            "turns_summarized": 0,
+            "last_summary_seconds": 0.0,
+            "total_summary_seconds": 0.0,
+            "tokens_sent": 0,
+            "tokens_saved": 0,
+        }
+
+    def save_context(self, inputs, outputs):
+        """Add a turn; schedules a background summary when enough turns have left the window"""
+        with self._lock:
+            self.chat_memory.add_user_message(inputs.get("input", ""))
+            self.chat_memory.add_ai_message(outputs.get("output", ""))
+            self._trim_window()
+
+            should_summarize = not self._summarizing and self._pending_tokens() >= self.summary_token_threshold
+            if should_summarize:
+                self._summarizing = True
+
+        if should_summarize:
+            submit_background(self._summarize_pending, key=("summary", id(self)))
+
+    def _pending_tokens(self):
+        return sum(estimate_tokens(human) + estimate_tokens(ai) for human, ai in self._pending)
+
+    def _trim_window(self):
+        """Move turns older than the window to the pending batch; system messages (the schema) stay"""
+        messages = self.chat_memory.messages
+        system_messages = [m for m in messages if isinstance(m, SystemMessage)]
+        conversation = [m for m in messages if not isinstance(m, SystemMessage)]
+        overflow = len(conversation) - 2 * self.window_turns
+        if overflow <= 0:
+            return
+        dropped = conversation[:overflow]
+        for i in range(0, len(dropped) - 1, 2):
+            self._pending.append((dropped[i].content, dropped[i + 1].content))
+        self.chat_memory.messages = system_messages + conversation[overflow:]
+
+    def _summarize_pending(self):
+        with self._lock:
+            batch = list(self._pending)
+            summary = self.buffer
+
+        succeeded = False
+        try:
+            if not batch:
+                return
+            turn_lines = [f"Human: {human}\nAI: {ai}" for human, ai in batch]
+            prompt = SUMMARY_UPDATE_PROMPT.format(summary=summary or "(empty)", new_lines="\n".join(turn_lines))
+
+            started = time.perf_counter()
+            new_summary = self.llm.invoke(prompt).content.strip()
+            elapsed = time.perf_counter() - started
+
+            with self._lock:
+                self.buffer = new_summary
+                del self._pending[:len(batch)]
+                sent = estimate_tokens(prompt)
+                # A per-turn summarizer would have sent the prompt and the summary once per turn
+                per_turn = sum(
+                    estimate_tokens(SUMMARY_UPDATE_PROMPT.format(summary=summary or "(empty)", new_lines=line))
+                    for line in turn_lines
+                )
+                self.stats["summary_calls"] += 1
+                self.stats["turns_summarized"] += len(batch)
+                self.stats["last_summary_seconds"] = elapsed
+                self.stats["total_summary_seconds"] += elapsed
+                self.stats["tokens_sent"] += sent
+                self.stats["tokens_saved"] += max(0, per_turn - sent)
+            succeeded = True
+            if self.on_summary is not None:
+                self.on_summary(new_summary)
+        finally:
+            with self._lock:
+                # Turns that arrived while summarizing may already form the next batch
+                self._summarizing = succeeded and self._pending_tokens() >= self.summary_token_threshold
+                resubmit = self._summarizing
+            if resubmit:
+                submit_background(self._summarize_pending, key=("summary", id(self)))
+
+    def load_memory_variables(self, inputs=None):
+        """Summary, not yet summarized turns and the recent window, as messages"""
+        with self._lock:
+            messages = [SystemMessage(content=f"Conversation summary: {self.buffer}")] if self.buffer else []
+            for human, ai in self._pending:
+                messages.append(SystemMessage(content=f"Human: {human}\nAI: {ai}"))
+            messages.extend(self.chat_memory.messages)
+        return {self.memory_key: messages}
+
+    def clear(self):
+        with self._lock:
+            self.chat_memory.clear()
+            self._pending = []
+            self.buffer = ""
+
+
+def create_memory(llm, mode="hybrid"):
+    """Create conversation memory system ("hybrid", "summary" or "buffer")"""
+    if mode == "hybrid":
+        memory = HybridSummaryMemory(llm=llm)
+    elif mode == "summary":
+        from langchain.memory import ConversationSummaryMemory
 
-def create_memory(llm, use_summary=True):
-    """Create conversation memory system"""
-    if use_summary:
         memory = ConversationSummaryMemory(
             llm=llm,
             memory_key="chat_history",
             return_messages=True
         )
     else:
+        from langchain.memory import ConversationBufferMemory
+
         memory = ConversationBufferMemory(
             memory_key="chat_history",
             return_messages=True
@@ -18,14 +150,27 @@ def create_memory(llm, use_summary=True):
     return memory
 
 
+def get_conversation_summary(memory):
+    """Return the running summary kept by the memory, or an empty string"""
+    # Summary memories keep a string buffer; a plain buffer memory holds messages
+    buffer = getattr(memory, "buffer", "")
+    return buffer if isinstance(buffer, str) else ""
+
+
 def save_to_memory_store(memory_store, human_message, ai_message):
     """Save interaction to memory store for search tool"""
-    memory_store.append({"role": "human", "content": human_message})
-    memory_store.append({"role": "ai", "content": ai_message})
+    memory_store.add_turn(human_message, ai_message)
     return memory_store
 
 
 def update_conversation_memory(memory, human_input, ai_output):
     """Update the conversation memory with new interaction"""
     memory.save_context({"input": human_input}, {"output": ai_output})
-    return memory
\ No newline at end of file
+    return memory
+
+
+def persist_summary(backend, session_id, memory):
+    """Store the current conversation summary, if the memory keeps one"""
+    summary = get_conversation_summary(memory)
+    if backend is not None and summary:
+        backend.save_summary(session_id, summary)
@@ -0,0 +1,139 @@
+import logging
+import os
+import queue
+import threading
+import time
+
+from sqlalchemy import Column, Float, Index, Integer, MetaData, String, Table, Text, create_engine, delete, select
+from sqlalchemy.engine import make_url
+
+from config.settings import MEMORY_BACKEND_URL, MEMORY_WRITE_BATCH_SIZE, MEMORY_WRITE_FLUSH_SECONDS
+
+logger = logging.getLogger(__name__)
+
+metadata = MetaData()
+
+chat_turns = Table(
+    "chat_turns", metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("session_id", String(64), nullable=False),
+    Column("created_at", Float, nullable=False),
+    Column("human", Text, nullable=False),
+    Column("ai", Text, nullable=False),
+    Index("ix_chat_turns_session_id", "session_id", "id"),
+)
+
+chat_summaries = Table(
+    "chat_summaries", metadata,
+    Column("session_id", String(64), primary_key=True),
+    Column("summary", Text, nullable=False),
+    Column("updated_at", Float, nullable=False),
+)
+
+
+class MemoryBackend:
+    """
+    Durable conversation memory in SQLite or PostgreSQL (any SQLAlchemy URL).
+    Writes are queued and flushed in batches by a background thread, so saving a turn never blocks the answer.
+    """
+
+    def __init__(self, url, batch_size=MEMORY_WRITE_BATCH_SIZE, flush_interval=MEMORY_WRITE_FLUSH_SECONDS):
+        parsed_url = make_url(url)
+        if parsed_url.get_backend_name() == "sqlite" and parsed_url.database not in (None, "", ":memory:"):
+            os.makedirs(os.path.dirname(os.path.abspath(parsed_url.database)), exist_ok=True)
+
+        self.engine = create_engine(url, pool_pre_ping=True)
+        metadata.create_all(self.engine)
+
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue()
+        self._writer = threading.Thread(target=self._write_loop, name="memory-writer", daemon=True)
+        self._writer.start()
+
+    def save_turn(self, session_id, human_message, ai_message):
+        """Queue a turn for writing"""
+        self._queue.put(("turn", session_id, human_message, ai_message, time.time()))
+
+    def save_summary(self, session_id, summary):
+        """Queue the latest conversation summary for writing"""
+        self._queue.put(("summary", session_id, summary, None, time.time()))
+
+    def flush(self):
+        """Block until every queued write has been stored"""
+        self._queue.join()
+
+    def load_recent_turns(self, session_id, limit):
+        """Return the last `limit` (human, ai) turns of the session, oldest first"""
+        self.flush()
+        query = (
+            select(chat_turns.c.human, chat_turns.c.ai)
+            .where(chat_turns.c.session_id == session_id)
+            .order_by(chat_turns.c.id.desc())
+            .limit(limit)
+        )
+        with self.engine.connect() as conn:
+            rows = conn.execute(query).all()
+        return [(row.human, row.ai) for row in reversed(rows)]
+
+    def load_summary(self, session_id):
+        """Return the stored summary of the session, or an empty string"""
+        self.flush()
+        query = select(chat_summaries.c.summary).where(chat_summaries.c.session_id == session_id)
+        with self.engine.connect() as conn:
+            summary = conn.execute(query).scalar()
+        return summary or ""
+
+    def _write_loop(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+
+            try:
+                self._write_batch(batch)
+            except Exception:
+                logger.exception("Failed to persist %d memory writes", len(batch))
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write_batch(self, batch):
+        turns = [
+            {"session_id": session_id, "human": human, "ai": ai, "created_at": created_at}
+            for kind, session_id, human, ai, created_at in batch if kind == "turn"
+        ]
+        # Only the newest summary of each session matters
+        summaries = {
+            session_id: {"session_id": session_id, "summary": summary, "updated_at": updated_at}
+            for kind, session_id, summary, _, updated_at in batch if kind == "summary"
+        }
+
+        with self.engine.begin() as conn:
+            if turns:
+                conn.execute(chat_turns.insert(), turns)
+            if summaries:
+                conn.execute(delete(chat_summaries).where(chat_summaries.c.session_id.in_(list(summaries))))
+                conn.execute(chat_summaries.insert(), list(summaries.values()))
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_memory_backend():
+    """Return the process-wide memory backend, or None when persistence is disabled"""
+    global _backend
+    if MEMORY_BACKEND_URL.lower() == "none":
+        return None
+    with _backend_lock:
+        if _backend is None:
+            _backend = MemoryBackend(MEMORY_BACKEND_URL)
+    return _backend
@@ -0,0 +1,96 @@
+import threading
+from collections import deque, namedtuple
+
+from config.settings import (
+    MEMORY_STORE_MAX_TURNS, MEMORY_SEARCH_TOP_K, MEMORY_SEARCH_TOKEN_BUDGET, MEMORY_LOAD_RECENT_TURNS
+)
+from utils.text_search import BM25Index, tokenize, estimate_tokens
+
+Turn = namedtuple("Turn", ["turn_id", "human", "ai"])
+
+
+class MemoryStore:
+    """
+    Bounded store of conversation turns with an incremental BM25 index.
+    Appends are O(1) amortized; the oldest turn (and its postings) is evicted past `max_turns`.
+    """
+
+    def __init__(self, max_turns=MEMORY_STORE_MAX_TURNS, backend=None, session_id=None):
+        self.max_turns = max_turns
+        self.backend = backend
+        self.session_id = session_id
+        self._turns = deque()
+        self._index = BM25Index()
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._turns)
+
+    def __iter__(self):
+        """Yield messages as {"role", "content"} dicts, oldest first"""
+        with self._lock:
+            turns = list(self._turns)
+        yield from turns_as_messages(turns)
+
+    def add_turn(self, human_message, ai_message, persist=True):
+        """Append a question/answer pair, index it and queue it for the persistent backend"""
+        if persist and self.backend is not None:
+            self.backend.save_turn(self.session_id, human_message, ai_message)
+        with self._lock:
+            turn = Turn(self._next_id, human_message, ai_message)
+            self._next_id += 1
+            self._turns.append(turn)
+            self._index.add(turn.turn_id, tokenize(human_message) + tokenize(ai_message))
+
+            while len(self._turns) > self.max_turns:
+                evicted = self._turns.popleft()
+                self._index.remove(evicted.turn_id)
+        return turn
+
+    def recent(self, n):
+        """The last n turns, oldest first"""
+        with self._lock:
+            return list(self._turns)[-n:] if n > 0 else []
+
+    def search(self, query, k=MEMORY_SEARCH_TOP_K, token_budget=MEMORY_SEARCH_TOKEN_BUDGET):
+        """
+        Return the turns most relevant to the query, in conversation order, within a token budget.
+        The latest turn is always included since follow-up questions usually refer to it.
+        """
+        with self._lock:
+            if not self._turns:
+                return []
+            ranked_ids = [turn_id for turn_id, _ in self._index.search(tokenize(query), k)]
+            latest = self._turns[-1]
+            first_id = self._turns[0].turn_id
+
+            candidates = [latest.turn_id] + [turn_id for turn_id in ranked_ids if turn_id != latest.turn_id]
+            selected = []
+            used_tokens = 0
+            for turn_id in candidates:
+                # Turn ids are consecutive, so a turn is found by offset without scanning the deque
+                turn = self._turns[turn_id - first_id]
+                cost = estimate_tokens(turn.human) + estimate_tokens(turn.ai)
+                if selected and used_tokens + cost > token_budget:
+                    continue
+                selected.append(turn)
+                used_tokens += cost
+
+        return sorted(selected, key=lambda turn: turn.turn_id)
+
+
+def turns_as_messages(turns):
+    """{"role", "content"} dicts of the given turns, oldest first"""
+    for turn in turns:
+        yield {"role": "human", "content": turn.human}
+        yield {"role": "ai", "content": turn.ai}
+
+
+def load_memory_store(backend, session_id, recent_turns=MEMORY_LOAD_RECENT_TURNS):
+    """Create the session's store, lazily restoring only its most recent turns from the backend"""
+    memory_store = MemoryStore(backend=backend, session_id=session_id)
+    if backend is not None:
+        for human_message, ai_message in backend.load_recent_turns(session_id, recent_turns):
+            memory_store.add_turn(human_message, ai_message, persist=False)
+    return memory_store
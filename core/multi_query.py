@@ -0,0 +1,74 @@
+import asyncio
+import contextvars
+import functools
+import logging
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from pydantic import ValidationError
+
+from config.settings import MULTI_QUERY_MAX_QUERIES, MULTI_QUERY_WORKERS
+from core.tracing import trace_span
+from models.schema import QueryPlan
+
+logger = logging.getLogger(__name__)
+
+# Process-wide pool, so concurrent compound questions cannot take more connections than it has workers
+_executor = ThreadPoolExecutor(max_workers=MULTI_QUERY_WORKERS, thread_name_prefix="multi-query")
+
+# Separators of the parts of a compound question ("orders, signups and refunds", "ventas vs devoluciones")
+_PART_SEPARATOR_RE = re.compile(r",|;|\b(?:and|y|vs\.?|versus|as well as|compared to|frente a)\b", re.IGNORECASE)
+_COMPARE_RE = re.compile(r"\b(?:compare|comparison|compara\w*|each of|both)\b", re.IGNORECASE)
+_SELECT_RE = re.compile(r"^\s*(?:select|with)\b", re.IGNORECASE)
+
+
+def looks_compound(prompt, schema_slice=None):
+    """
+    Whether a question asks for several independent figures, each answerable by its own query:
+    it lists parts or asks for a comparison, and the relevant schema spans more than one table.
+    """
+    if schema_slice is not None and len(schema_slice[1]["tables"]) < 2:
+        return False
+    separators = len(_PART_SEPARATOR_RE.findall(prompt))
+    return separators >= 2 or (separators >= 1 and _COMPARE_RE.search(prompt) is not None)
+
+
+def parse_query_plan(reply):
+    """Sub-queries of a planner reply, or None when it is unusable or not worth splitting"""
+    start, end = reply.find("{"), reply.rfind("}")
+    if start == -1 or end < start:
+        return None
+    try:
+        plan = QueryPlan.model_validate_json(reply[start:end + 1])
+    except ValidationError:
+        logger.info("Query plan was not valid JSON: %s", reply[:200])
+        return None
+
+    queries = [query for query in plan.queries if _SELECT_RE.match(query.sql)]
+    if len(queries) < 2 or len(queries) != len(plan.queries) or len(queries) > MULTI_QUERY_MAX_QUERIES:
+        return None
+    return queries
+
+
+def _run_one(db, query):
+    with trace_span("sub_query", label=query.label):
+        return db.run_no_throw(query.sql)
+
+
+async def run_sub_queries(db, queries):
+    """Run the sub-queries concurrently on the bounded pool; results come back in plan order"""
+    loop = asyncio.get_running_loop()
+    # Each task carries the request's context, so its SQL spans land in the current trace
+    tasks = [
+        loop.run_in_executor(_executor, functools.partial(contextvars.copy_context().run, _run_one, db, query))
+        for query in queries
+    ]
+    return await asyncio.gather(*tasks)
+
+
+def format_results(queries, results):
+    """Labelled SQL and results of the sub-queries, for the narration prompt"""
+    sections = []
+    for index, (query, result) in enumerate(zip(queries, results), start=1):
+        sections.append(f"{index}. {query.label or 'Query'}\n{query.sql}\nResult: {result or 'No rows.'}")
+    return "\n\n".join(sections)
@@ -0,0 +1,342 @@
+import asyncio
+import contextlib
+import functools
+import logging
+import time
+
+from langchain_core.exceptions import OutputParserException
+
+from config.settings import (
+    MEMORY_SEARCH_PROMPT, DIRECT_RESPONSE_PROMPT, SCHEMA_SLICE_PROMPT, PLAN_NARRATION_PROMPT, PLAN_CACHE_NARRATE,
+    DISPATCH_EARLY_COMMIT, MULTI_QUERY_ENABLED, MULTI_QUERY_NARRATION_PROMPT
+)
+from core.agent_factory import extract_sql_queries
+from core.background import submit_background
+from core.database import get_table_versions
+from core.memory import update_conversation_memory, save_to_memory_store, persist_summary
+from core.memory_backend import get_memory_backend
+from core.multi_query import format_results, looks_compound, parse_query_plan, run_sub_queries
+from core.plan_cache import get_plan_cache
+from core.result_cache import get_result_cache
+from core.snapshots import get_snapshot_store
+from core.tracing import start_trace, trace_config, trace_span, traced, export_trace
+from utils.json_helpers import DispatchStreamParser
+from utils.sql_helpers import extract_tables
+
+logger = logging.getLogger(__name__)
+
+
+class NullStream:
+    """
+    Stream that discards everything, used when nobody is watching the answer being produced.
+    Also documents the interface the pipeline reports progress through.
+    """
+
+    first_token_seconds = None
+
+    def status(self, message):
+        """What the pipeline is doing right now (decided action, SQL being run...)"""
+
+    def reasoning(self, reasoning, action, explanation):
+        """The planner's decision, only reported when the session shows reasoning"""
+
+    def note(self, message):
+        """A side remark about how the answer was produced (cache hits...)"""
+
+    def new_message(self):
+        """A new LLM message starts; the partial text of the previous one is replaced"""
+
+    def token(self, chunk):
+        """A token of the answer being generated"""
+
+    def finish(self, result):
+        """The final answer"""
+
+
+def _schema_fingerprint(session):
+    """Fingerprint of the connected schema, used to key cached answers"""
+    return session.schema_index.fingerprint if session.schema_index is not None else None
+
+
+def _db_role(db):
+    """Database user the session connects as; cached answers and plans are only shared within one role"""
+    return db._engine.url.username
+
+
+def _cache_answer(db, schema_index, prompt, result, sql_queries, sql_params=None):
+    """Store the answer with the versions of the tables its SQL read (runs in the background)"""
+    fingerprint = schema_index.fingerprint if schema_index is not None else None
+    known_tables = schema_index.catalog if schema_index is not None else None
+    tables = []
+    for sql in sql_queries:
+        tables.extend(t for t in extract_tables(sql, known_tables) if t not in tables)
+    get_result_cache().store(prompt, fingerprint, _db_role(db), result, sql_queries, get_table_versions(db, tables),
+                             sql_params)
+
+    # Count the SQL per question, so the queries asked for all day get a precomputed snapshot
+    snapshot_store = get_snapshot_store()
+    if snapshot_store is not None and not sql_params:
+        snapshot_store.record(db, prompt, sql_queries, known_tables)
+
+
+async def stream_llm(llm, llm_prompt, stream):
+    """Stream an LLM answer to the stream and return the full text"""
+    stream.new_message()
+    chunks = []
+    async for chunk in llm.astream(llm_prompt, config=trace_config()):
+        chunks.append(chunk.content)
+        stream.token(chunk.content)
+    return "".join(chunks)
+
+
+async def stream_agent(agent, agent_input, stream):
+    """Run the SQL agent streaming its steps and tokens, returning its final output dict"""
+    response = {"output": "Agent returned no output."}
+    async for event in agent.astream_events({"input": agent_input}, config=trace_config(), version="v2"):
+        kind = event["event"]
+        if kind == "on_chat_model_start":
+            stream.new_message()
+        elif kind == "on_chat_model_stream":
+            stream.token(event["data"]["chunk"].content)
+        elif kind == "on_tool_start":
+            tool_input = event["data"].get("input")
+            if event["name"] == "sql_db_query":
+                query = tool_input.get("query", tool_input) if isinstance(tool_input, dict) else tool_input
+                stream.status(f"🛢 Running SQL: `{query}`")
+            else:
+                stream.status(f"🔧 {event['name']}")
+        elif kind == "on_chain_end" and not event.get("parent_ids"):
+            response = event["data"].get("output") or response
+    return response
+
+
+async def run_database_query(session, prompt, schema_slice=None, stream=None):
+    """Run the SQL agent on the relevant slice of the schema and cache successful answers"""
+    stream = stream or NullStream()
+    # Send only the slice of the schema relevant to this question
+    agent_input = prompt
+    if schema_slice is not None:
+        schema_text, slice_stats = schema_slice
+        agent_input = SCHEMA_SLICE_PROMPT.format(schema_text=schema_text, prompt=prompt)
+        session.schema_slice_stats = slice_stats
+
+    try:
+        with trace_span("agent"):
+            response = await stream_agent(session.sql_agent, agent_input, stream)
+        result = response.get("output", "Agent returned no output.")
+    except OutputParserException as e:
+        raw = getattr(e, "llm_output", "No raw output")
+        return f"Se encontró un error al interpretar la respuesta. Intentaré extraer la información útil:\n\n{raw}"
+    except Exception as e:
+        return f"Error en la consulta: {str(e)}"
+
+    # Only answers backed by real SQL are cached
+    sql_queries = extract_sql_queries(response)
+    if sql_queries:
+        session.last_result_query = (sql_queries[-1], {})
+        submit_background(_cache_answer, session.db, session.schema_index, prompt, result, sql_queries)
+    if len(sql_queries) == 1:
+        # Single-query answers become templates that later questions can re-run without the agent
+        get_plan_cache().learn(prompt, _schema_fingerprint(session), _db_role(session.db), sql_queries[0])
+
+    return result
+
+
+async def run_plan(session, prompt, plan, params, stream):
+    """Execute a compiled plan directly and narrate the result with at most one LLM call"""
+    db = session.db
+    stream.status(f"🛢 Running compiled plan: `{plan.sql}`")
+    try:
+        db_result = await asyncio.to_thread(db.run, plan.statement, parameters=params)
+    except Exception:
+        return None  # Let the agent handle it, the schema or data may have changed
+
+    if PLAN_CACHE_NARRATE:
+        narration_prompt = PLAN_NARRATION_PROMPT.format(prompt=prompt, sql=plan.sql, result=db_result or "No rows.")
+        result = await stream_llm(session.llm, narration_prompt, stream)
+    else:
+        result = f"```sql\n{plan.sql}\n```\n\n{db_result or 'No rows returned.'}"
+
+    session.last_result_query = (plan.sql, params)
+    submit_background(_cache_answer, db, session.schema_index, prompt, result, [plan.sql], params)
+    return result
+
+
+async def run_multi_query(session, prompt, schema_slice, stream):
+    """
+    Answer a compound question with independent SQL queries run concurrently and one narration call.
+    Returns None when the question does not split, so the SQL agent handles it instead.
+    """
+    if schema_slice is not None:
+        schema_text, session.schema_slice_stats = schema_slice
+    else:
+        schema_text = await asyncio.to_thread(session.db.get_table_info)
+    with trace_span("decompose") as span:
+        try:
+            reply = await session.decompose_chain.ainvoke(
+                {"schema_text": schema_text, "input": prompt}, config=trace_config()
+            )
+        except Exception as e:
+            # The SQL agent can still answer the question on its own
+            logger.warning("Could not split the question into queries: %s", e)
+            return None
+        queries = parse_query_plan(reply)
+        span["queries"] = len(queries) if queries else 0
+    if queries is None:
+        return None
+
+    stream.status(f"🛢 Running {len(queries)} queries in parallel")
+    with trace_span("multi_query", queries=len(queries)):
+        results = await run_sub_queries(session.db, queries)
+    if all(str(result).startswith("Error") for result in results):
+        return None  # Let the agent work out the queries step by step
+
+    narration_prompt = MULTI_QUERY_NARRATION_PROMPT.format(prompt=prompt, results=format_results(queries, results))
+    result = await stream_llm(session.llm, narration_prompt, stream)
+
+    sql_queries = [query.sql for query, query_result in zip(queries, results)
+                   if not str(query_result).startswith("Error")]
+    session.last_result_query = (sql_queries[-1], {})
+    submit_background(_cache_answer, session.db, session.schema_index, prompt, result, sql_queries)
+    return result
+
+
+async def answer_from_caches(session, prompt, stream):
+    """Answer from the result cache or a compiled plan, skipping the dispatcher and the agent loop"""
+    db = session.db
+    cached = await asyncio.to_thread(
+        get_result_cache().lookup, prompt, _schema_fingerprint(session), _db_role(db),
+        functools.partial(get_table_versions, db)
+    )
+    if cached is not None:
+        if session.show_reasoning:
+            stream.note("⚡ Answer served from the result cache")
+        if cached["sql"]:
+            session.last_result_query = (cached["sql"][-1], cached["sql_params"])
+        return cached["answer"]
+
+    planned = get_plan_cache().match(prompt, _schema_fingerprint(session), _db_role(db))
+    if planned is not None:
+        plan, params = planned
+        result = await run_plan(session, prompt, plan, params, stream)
+        if result is not None and session.show_reasoning:
+            stream.note(f"⚡ Answer from a compiled plan: `{plan.sql}` with {params}")
+        return result
+
+    return None
+
+
+async def dispatch(session, prompt):
+    """Decide the action locally when obvious, otherwise ask the planner LLM"""
+    # Obvious cases are decided locally, the planner LLM only sees the ambiguous ones
+    with trace_span("dispatch") as span:
+        decision = session.fast_dispatcher.classify(prompt) if session.fast_dispatcher is not None else None
+        if decision is not None:
+            reasoning, action, explanation, _ = decision
+            span.update(path="fast", action=action)
+            return reasoning, action, explanation
+
+        parser = DispatchStreamParser()
+        committed = False
+        if DISPATCH_EARLY_COMMIT and not session.show_reasoning:
+            # The reply is streamed so the action can be acted on as soon as it is generated
+            async with contextlib.aclosing(session.dispatcher_chain.astream(prompt, config=trace_config())) as chunks:
+                async for chunk in chunks:
+                    if parser.feed(chunk):
+                        committed = True
+                        break
+        else:
+            # The whole reply is needed anyway; a single call lets the gateway coalesce identical prompts
+            parser.feed(await session.dispatcher_chain.ainvoke(prompt, config=trace_config()))
+        reasoning, action, explanation = parser.result(complete=not committed)
+        span.update(path="planner", action=action, early_commit=committed)
+        return reasoning, action, explanation
+
+
+def _discard_task(task):
+    """Cancel a speculative task whose result is not needed, so its errors are not reported as unhandled"""
+    if not task.cancel() and not task.cancelled():
+        task.exception()  # Already finished: marks a raised exception as retrieved
+
+
+async def process_query_async(session, prompt, stream=None):
+    """Process user query through the planning system"""
+    started = time.perf_counter()
+    stream = stream or NullStream()
+    session.last_result_query = None
+    trace = start_trace(prompt)
+
+    with trace_span("cache_lookup") as span:
+        result = await answer_from_caches(session, prompt, stream)
+        span["hit"] = result is not None
+    if result is None:
+        # Slice the schema speculatively while the dispatcher decides
+        slice_task = None
+        if session.schema_index is not None:
+            slice_task = asyncio.create_task(asyncio.to_thread(session.schema_index.build_slice, prompt))
+        try:
+            reasoning, action, explanation = await dispatch(session, prompt)
+            stream.status(f"🧭 Decided action: {action}")
+            if session.show_reasoning:
+                stream.reasoning(reasoning, action, explanation)
+
+            # Based on the decided action, call the corresponding agent
+            if action == "database_query":
+                schema_slice = await slice_task if slice_task is not None else None
+                if (MULTI_QUERY_ENABLED and session.decompose_chain is not None
+                        and looks_compound(prompt, schema_slice)):
+                    result = await run_multi_query(session, prompt, schema_slice, stream)
+                if result is None:
+                    result = await run_database_query(session, prompt, schema_slice, stream)
+            elif action == "memory_lookup":
+                # Use the memory tool to search the conversation
+                memory_result = session.memory_tool._run(prompt)
+
+                # Generate a response based on memory
+                memory_prompt = MEMORY_SEARCH_PROMPT.format(
+                    memory_result=memory_result,
+                    prompt=prompt
+                )
+
+                result = await stream_llm(session.llm, memory_prompt, stream)
+            else:  # direct_response
+                # Generate a direct response without querying database or memory
+                direct_prompt = DIRECT_RESPONSE_PROMPT.format(prompt=prompt)
+                result = await stream_llm(session.llm, direct_prompt, stream)
+        finally:
+            if slice_task is not None:
+                _discard_task(slice_task)
+
+    session.last_answer_seconds = time.perf_counter() - started
+    session.last_ttft_seconds = stream.first_token_seconds
+    if trace is not None:
+        trace.finish()
+        session.last_trace = trace
+
+    # The summary update (an extra LLM call) and the memory-store write run after the answer is shown,
+    # one at a time per conversation so turns are recorded in order
+    memory = session.memory
+    submit_background(traced(trace, "memory_update", update_conversation_memory), memory, prompt, result,
+                      key=id(memory))
+    submit_background(traced(trace, "memory_store", save_to_memory_store), session.memory_store,
+                      prompt, result, key=id(memory))
+    submit_background(persist_summary, get_memory_backend(), session.session_id, memory, key=id(memory))
+    if trace is not None:
+        # Queued behind the memory updates so their timings are part of the exported trace
+        submit_background(export_trace, trace, key=id(memory))
+
+    return result
+
+
+async def answer_question(session, prompt, stream=None):
+    """Answer one question, turning pipeline failures into an error message for the user"""
+    try:
+        return await process_query_async(session, prompt, stream)
+    except Exception as e:
+        error_msg = f"Error al procesar la consulta: {str(e)}"
+        return error_msg
+
+
+def process_query(session, prompt, stream=None):
+    """Run the async query pipeline from a synchronous caller (e.g. the Streamlit script thread)"""
+    return asyncio.run(answer_question(session, prompt, stream))
@@ -0,0 +1,154 @@
+import re
+import threading
+from collections import Counter, OrderedDict
+
+from sqlalchemy import text
+
+from config.settings import PLAN_CACHE_MAX_ENTRIES
+from core.result_cache import normalize_question
+
+# Literal values in the user's question: quoted strings or numbers
+_QUESTION_LITERAL_RE = re.compile(r"'([^']*)'|\"([^\"]*)\"|(?<![\w.])(\d+(?:\.\d+)?)(?![\w.])")
+# Tokens in the SQL that may hold those values; identifiers in double quotes are matched so they are skipped
+_SQL_TOKEN_RE = re.compile(r"'(?:[^']|'')*'|\"[^\"]*\"|(?<![\w.:])\d+(?:\.\d+)?(?![\w.])")
+# What SQLAlchemy's text() treats as a bind parameter
+_BIND_RE = re.compile(r"(?<![:\w\\]):(\w+)(?!:)")
+
+
+def _split_question(question):
+    """Return (template, literals) where literals are ("num"|"str", value) in order of appearance"""
+    literals = []
+
+    def _placeholder(match):
+        if match.group(3) is not None:
+            literals.append(("num", match.group(3)))
+            return " numparam "
+        value = match.group(1) if match.group(1) is not None else match.group(2)
+        literals.append(("str", value))
+        return " strparam "
+
+    template = _QUESTION_LITERAL_RE.sub(_placeholder, question)
+    return normalize_question(template), literals
+
+
+def _coerce(kind, value):
+    if kind == "str":
+        return value
+    return float(value) if "." in value else int(value)
+
+
+class PlanTemplate:
+    """Validated SQL from the agent with the question's literal values replaced by bind parameters"""
+
+    def __init__(self, sql, literals, bindings):
+        self.sql = sql
+        self.statement = text(sql)
+        self.literals = literals
+        self.bindings = bindings  # literal index -> bind name, None when the literal isn't in the SQL
+        self.uses = 0
+
+    def parameters_for(self, literals):
+        """Bind values for a new question, or None when it differs in a value the SQL doesn't expose"""
+        if [kind for kind, _ in literals] != [kind for kind, _ in self.literals]:
+            return None
+        params = {}
+        for i, (kind, value) in enumerate(literals):
+            name = self.bindings[i]
+            if name is None:
+                if value != self.literals[i][1]:
+                    return None
+                continue
+            params[name] = _coerce(kind, value)
+        return params
+
+
+def _sql_literal(token):
+    """("num"|"str", value) of a SQL literal token, or None for a quoted identifier"""
+    if token.startswith('"'):
+        return None
+    if token.startswith("'"):
+        return "str", token[1:-1].replace("''", "'")
+    return "num", token
+
+
+def compile_plan(question, sql):
+    """Turn (question, final SQL) into (template_key, PlanTemplate), or None if the SQL can't be parameterized"""
+    template_key, literals = _split_question(question)
+    bindings = [None] * len(literals)
+    sql = sql.strip().rstrip(";")
+
+    # "users with id 5" answered with "WHERE id = 5 LIMIT 5": which 5 is the question's is unknown
+    occurrences = Counter(_sql_literal(match.group(0)) for match in _SQL_TOKEN_RE.finditer(sql))
+    if any(occurrences[literal] > 1 for literal in literals):
+        return None
+
+    def _bind(match):
+        token = match.group(0)
+        literal = _sql_literal(token)
+        if literal is None:
+            return token  # Quoted identifier
+        matching = [i for i, question_literal in enumerate(literals) if question_literal == literal]
+        if len(matching) != 1:
+            # Values not in the question (or ambiguous ones) stay as constants of the plan
+            return token
+        i = matching[0]
+        bindings[i] = f"p{i}"
+        return f":p{i}"
+
+    parameterized = _SQL_TOKEN_RE.sub(_bind, sql)
+    expected = {name for name in bindings if name is not None}
+    if set(_BIND_RE.findall(parameterized)) != expected:
+        return None  # Other ":name" sequences would be read as bind parameters by SQLAlchemy
+    return template_key, PlanTemplate(parameterized, literals, bindings)
+
+
+class PlanCache:
+    """Process-wide LRU cache of parameterized SQL plans keyed on the schema fingerprint, role and question template"""
+
+    def __init__(self, max_entries=PLAN_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._plans = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def learn(self, question, schema_fingerprint, role, sql):
+        """Store the agent's final SQL for this question as a reusable template"""
+        compiled = compile_plan(question, sql)
+        if compiled is None:
+            return None
+        template_key, plan = compiled
+        key = (schema_fingerprint, role, template_key)
+        with self._lock:
+            self._plans[key] = plan
+            self._plans.move_to_end(key)
+            while len(self._plans) > self.max_entries:
+                self._plans.popitem(last=False)
+        return plan
+
+    def match(self, question, schema_fingerprint, role):
+        """Return (plan, parameters) for a question matching a known template, or None"""
+        template_key, literals = _split_question(question)
+        key = (schema_fingerprint, role, template_key)
+        with self._lock:
+            plan = self._plans.get(key)
+            params = plan.parameters_for(literals) if plan is not None else None
+            if params is None:
+                self.misses += 1
+                return None
+            self._plans.move_to_end(key)
+            self.hits += 1
+            plan.uses += 1
+            return plan, params
+
+    def stats(self):
+        with self._lock:
+            return {"plans": len(self._plans), "hits": self.hits, "misses": self.misses}
+
+
+_plan_cache = PlanCache()
+
+
+def get_plan_cache():
+    """Return the process-wide plan cache"""
+    return _plan_cache
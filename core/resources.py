@@ -0,0 +1,96 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+from config.settings import OLLAMA_KEEP_ALIVE, RESOURCE_CACHE_MAX_ENTRIES
+
+
+class ResourceCache:
+    """
+    Process-wide cache of expensive, thread-safe objects (LLM clients, toolkits, agents) keyed by their
+    configuration, so every rerun and session with the same settings shares one instance and its HTTP pool.
+    """
+
+    def __init__(self, max_entries=RESOURCE_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_create(self, key, factory):
+        """Return the cached resource for key, building it with factory() on a miss"""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+
+        # Built outside the lock; if two sessions race, the first one stored wins
+        resource = factory()
+        with self._lock:
+            resource = self._entries.setdefault(key, resource)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return resource
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+_resource_cache = ResourceCache()
+
+
+def get_resource_cache():
+    """Return the process-wide resource cache"""
+    return _resource_cache
+
+
+def _secret_key(secret):
+    """Key component for a secret, so API keys are never kept in cache keys"""
+    return hashlib.sha256(secret.encode("utf-8")).hexdigest() if secret else None
+
+
+def get_chat_model(model_type, model_name, temperature, base_url=None, api_key=None, priority="interactive"):
+    """
+    Return a shared chat model for this configuration. Its calls go through the backend's gateway,
+    which limits concurrent requests and serves interactive ones before background ones.
+    """
+    from core.llm_gateway import GatewayChatModel, get_gateway
+
+    key = ("llm", model_type, model_name, temperature, base_url, _secret_key(api_key))
+
+    def create():
+        if model_type == "ollama":
+            from langchain_community.chat_models import ChatOllama
+
+            options = {"base_url": base_url} if base_url else {}
+            return ChatOllama(model=model_name, temperature=temperature, keep_alive=OLLAMA_KEEP_ALIVE, **options)
+
+        from langchain_openai import ChatOpenAI
+
+        return ChatOpenAI(model=model_name, temperature=temperature, api_key=api_key)
+
+    client = _resource_cache.get_or_create(key, create)
+    return _resource_cache.get_or_create(
+        key + (priority,),
+        lambda: GatewayChatModel(inner=client, gateway=get_gateway(model_type, base_url), priority=priority,
+                                 credential=_secret_key(api_key)),
+    )
+
+
+def get_agents(db, llm, planner_llm, model_type):
+    """Return the shared SQL agent and dispatcher chain for this database and pair of models"""
+    from core.agent_factory import initialize_agents
+
+    # db and the models are shared objects themselves, so identity is the configuration; the entry
+    # keeps them referenced so their ids cannot be reused while it is cached
+    key = ("agents", id(db), id(llm), id(planner_llm), model_type)
+
+    def create():
+        return db, llm, planner_llm, initialize_agents(db, llm, planner_llm, model_type)
+
+    return _resource_cache.get_or_create(key, create)[-1]
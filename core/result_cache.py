@@ -0,0 +1,158 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from config.settings import (
+    RESULT_CACHE_MAX_ENTRIES, RESULT_CACHE_TTL, RESULT_CACHE_NEAR_DUPLICATES, RESULT_CACHE_SIMILARITY
+)
+
+_NON_WORD_RE = re.compile(r"[^\w\s]")
+_WHITESPACE_RE = re.compile(r"\s+")
+_NUMBER_RE = re.compile(r"\d+(?:\.\d+)?")
+# Words that do not change what a question asks for; negations ("not", "no", "sin") are not among them
+_STOPWORDS = frozenset("""
+a an the of in on at to for by with from and or is are was were be been do does did
+what which who how many much show list give me tell all there please
+el la los las un una unos unas de del en con por para y o es son fue fueron que cual cuales
+cuantos cuantas muestra muestrame dame dime todos todas hay por favor
+""".split())
+
+
+def normalize_question(question):
+    """Lowercase, strip punctuation and collapse whitespace"""
+    question = _NON_WORD_RE.sub(" ", question.lower())
+    return _WHITESPACE_RE.sub(" ", question).strip()
+
+
+def _content_words(text):
+    return frozenset(word for word in text.split() if word not in _STOPWORDS)
+
+
+def _trigrams(text):
+    padded = f"  {text} "
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+class ResultCache:
+    """
+    Process-wide cache of database answers keyed on the schema fingerprint, the database role and the
+    normalized question, so answers never cross privilege boundaries.
+    Entries expire after `ttl` seconds, the least recently used are evicted past `max_entries`, and an
+    entry is dropped when any table it read has changed since it was stored.
+    """
+
+    def __init__(self, max_entries=RESULT_CACHE_MAX_ENTRIES, ttl=RESULT_CACHE_TTL,
+                 near_duplicates=RESULT_CACHE_NEAR_DUPLICATES, similarity=RESULT_CACHE_SIMILARITY):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.near_duplicates = near_duplicates
+        self.similarity = similarity
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _find(self, key, normalized):
+        """Exact match first, then the most similar question with the same numbers and content words"""
+        entry = self._entries.get(key)
+        if entry is not None or not self.near_duplicates:
+            return key, entry, False
+
+        trigrams = _trigrams(normalized)
+        numbers = _NUMBER_RE.findall(normalized)
+        words = _content_words(normalized)
+        best_key, best_entry, best_score = None, None, self.similarity
+        for candidate_key, candidate in self._entries.items():
+            # "last 5 users" and "last 10 users", or "shipped" and "not shipped", are similar text but
+            # different answers; only wording around the same content words may differ
+            if candidate_key[:2] != key[:2] or candidate["numbers"] != numbers or candidate["words"] != words:
+                continue
+            union = len(trigrams | candidate["trigrams"])
+            score = len(trigrams & candidate["trigrams"]) / union if union else 0.0
+            if score >= best_score:
+                best_key, best_entry, best_score = candidate_key, candidate, score
+        return best_key, best_entry, best_entry is not None
+
+    def lookup(self, question, schema_fingerprint, role, table_versions_fn=None):
+        """
+        Return the cached entry for the question or None.
+        `table_versions_fn(tables)` returns the current {table: version} used to detect changed tables.
+        """
+        normalized = normalize_question(question)
+        key = (schema_fingerprint, role, normalized)
+
+        with self._lock:
+            found_key, entry, is_near = self._find(key, normalized)
+            if entry is not None and time.time() - entry["created"] > self.ttl:
+                del self._entries[found_key]
+                entry = None
+
+        if entry is not None and entry["table_versions"] and table_versions_fn is not None:
+            current = table_versions_fn(list(entry["table_versions"]))
+            if any(current.get(table) != version for table, version in entry["table_versions"].items()):
+                with self._lock:
+                    self._entries.pop(found_key, None)
+                    self.invalidations += 1
+                entry = None
+
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(found_key)
+            self.hits += 1
+            if is_near:
+                self.near_hits += 1
+            return entry
+
+    def store(self, question, schema_fingerprint, role, answer, sql_queries, table_versions, sql_params=None):
+        """Cache the answer and the SQL (plus bind parameters of the last statement) that produced it"""
+        normalized = normalize_question(question)
+        entry = {
+            "question": question,
+            "answer": answer,
+            "sql": list(sql_queries),
+            "sql_params": dict(sql_params or {}),
+            "table_versions": dict(table_versions),
+            "created": time.time(),
+            "trigrams": _trigrams(normalized),
+            "numbers": _NUMBER_RE.findall(normalized),
+            "words": _content_words(normalized),
+        }
+        with self._lock:
+            self._entries[(schema_fingerprint, role, normalized)] = entry
+            self._entries.move_to_end((schema_fingerprint, role, normalized))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate_tables(self, tables):
+        """Drop every entry that read any of the given tables"""
+        tables = set(tables)
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                if tables & entry["table_versions"].keys():
+                    del self._entries[key]
+                    self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "near_hits": self.near_hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+_result_cache = ResultCache()
+
+
+def get_result_cache():
+    """Return the process-wide result cache"""
+    return _result_cache
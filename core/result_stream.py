@@ -0,0 +1,102 @@
+import re
+
+from langchain_community.utilities.sql_database import SQLDatabase, truncate_word
+from sqlalchemy import text
+
+from config.settings import RESULT_FETCH_BATCH_SIZE, LLM_RESULT_MAX_ROWS, LLM_SAMPLE_ROWS, LLM_SUMMARY_MAX_ROWS
+from core.columnar import fetch_columnar, format_column_summary
+from core.guardrails import guard_query
+from core.snapshots import get_snapshot_store
+from core.tracing import trace_span
+
+_SELECT_RE = re.compile(r"^\s*(select|with)\b", re.IGNORECASE)
+
+
+def stream_rows(engine, command, parameters=None, batch_size=RESULT_FETCH_BATCH_SIZE, execution_options=None):
+    """
+    Yield (columns, rows) batches through a server-side cursor (a psycopg2 named cursor on PostgreSQL),
+    so only one batch is held in memory. Closing the generator early stops reading the result.
+    """
+    if isinstance(command, str):
+        command = text(command)
+    options = {"stream_results": True, "max_row_buffer": batch_size, **(execution_options or {})}
+    with engine.connect() as conn:
+        result = conn.execution_options(**options).execute(command, parameters or {})
+        if not result.returns_rows:
+            conn.commit()
+            return
+        columns = list(result.keys())
+        while True:
+            batch = result.fetchmany(batch_size)
+            if not batch:
+                break
+            yield columns, batch
+
+
+def is_paginable(sql):
+    """Only plain SELECT/WITH queries can be wrapped for pagination"""
+    return bool(sql) and _SELECT_RE.match(sql) is not None
+
+
+def fetch_result_page(engine, sql, page, page_size, parameters=None):
+    """Return one page of a SELECT as a ColumnarResult (truncated means more pages), fetched on demand"""
+    if not is_paginable(sql):
+        raise ValueError("Only SELECT queries can be paginated")
+    paged = text(f"SELECT * FROM ({sql.strip().rstrip(';')}) AS paged_result LIMIT :page_limit OFFSET :page_offset")
+    page_parameters = {**(parameters or {}), "page_limit": page_size + 1, "page_offset": page * page_size}
+    return fetch_columnar(engine, paged, page_size, parameters=page_parameters)
+
+
+class StreamingSQLDatabase(SQLDatabase):
+    """
+    SQLDatabase whose run() streams rows through a server-side cursor into columnar buffers, so a careless
+    "show all orders" never loads the whole table into the worker or the LLM context. Small results are
+    returned as rows; larger ones as a few sample rows plus per-column statistics. Every query goes through
+    the EXPLAIN guardrail first, and a rejection reaches the agent as an "Error: ..." observation.
+    """
+
+    max_result_rows = LLM_RESULT_MAX_ROWS
+
+    def run(self, command, fetch="all", include_columns=False, *, parameters=None, execution_options=None):
+        # Hot aggregate queries are answered from their precomputed snapshot while it is fresh
+        snapshot_store = get_snapshot_store()
+        if snapshot_store is not None and fetch == "all" and not parameters:
+            with trace_span("sql_snapshot") as span:
+                snapshot = snapshot_store.lookup(self, command)
+                span["hit"] = snapshot is not None
+            if snapshot is not None:
+                result, age = snapshot
+                return f"Note: precomputed result from {age:.0f} seconds ago.\n{result}" if result else ""
+
+        with trace_span("sql_guard"):
+            command, note = guard_query(self._engine, command, parameters)
+        if fetch != "all":
+            return super().run(command, fetch, include_columns,
+                               parameters=parameters, execution_options=execution_options)
+
+        with trace_span("sql", query=str(getattr(command, "text", command))[:500]) as span:
+            # The LLM only sees a sample and statistics, so a small buffer keeps peak memory bounded
+            result = fetch_columnar(self._engine, command, LLM_SUMMARY_MAX_ROWS,
+                                    parameters=parameters, execution_options=execution_options)
+            span.update(rows=result.row_count, truncated=result.truncated)
+        if not result.row_count:
+            return ""
+
+        if result.row_count <= self.max_result_rows and not result.truncated:
+            rows = self._format_rows(result.names, result.rows(), include_columns)
+            return f"{note}\n{rows}" if note else rows
+
+        row_count = f"{result.row_count}+" if result.truncated else str(result.row_count)
+        sample = self._format_rows(result.names, result.rows(LLM_SAMPLE_ROWS), include_columns)
+        summary = (f"The query returned {row_count} rows, too many to list. First {LLM_SAMPLE_ROWS} rows:\n{sample}\n"
+                   f"Column statistics over {result.row_count} rows:\n{format_column_summary(result)}")
+        return f"{note}\n{summary}" if note else summary
+
+    def _format_rows(self, columns, rows, include_columns):
+        res = [
+            {column: truncate_word(value, length=self._max_string_length) for column, value in zip(columns, row)}
+            for row in rows
+        ]
+        if not include_columns:
+            res = [tuple(row.values()) for row in res]
+        return str(res)
@@ -0,0 +1,168 @@
+import hashlib
+import json
+import os
+
+from sqlalchemy import inspect, text
+
+from config.settings import SCHEMA_CACHE_DIR
+
+# One row per table with a cheap fingerprint of its definition. pg_class.xmin changes whenever the
+# relation row is rewritten (ADD/DROP COLUMN, ALTER TABLE options...), relfilenode on table rewrites,
+# the newest pg_attribute.xmin catches column renames and type changes and the newest
+# pg_constraint.xmin catches added or dropped foreign keys. Table and column comments live in
+# pg_description, whose newest xmin and row count catch comments set, changed or removed.
+FINGERPRINT_QUERY = text("""
+SELECT c.oid AS oid,
+       c.relname AS table_name,
+       c.xmin::text || ':' || c.relfilenode::text || ':' ||
+       COALESCE((SELECT max(a.xmin::text::bigint) FROM pg_catalog.pg_attribute a
+                 WHERE a.attrelid = c.oid)::text, '') || ':' ||
+       COALESCE((SELECT max(co.xmin::text::bigint) FROM pg_catalog.pg_constraint co
+                 WHERE co.conrelid = c.oid)::text, '') || ':' ||
+       (SELECT COALESCE(max(d.xmin::text::bigint)::text, '') || '/' || count(*)::text
+        FROM pg_catalog.pg_description d
+        WHERE d.objoid = c.oid AND d.classoid = 'pg_catalog.pg_class'::regclass) AS fingerprint
+FROM pg_catalog.pg_class c
+JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
+WHERE c.relkind IN ('r', 'p') AND n.nspname = current_schema()
+""")
+
+# All columns of the given tables in a single round trip
+COLUMNS_QUERY = text("""
+SELECT c.relname AS table_name,
+       obj_description(c.oid, 'pg_class') AS table_comment,
+       a.attname AS column_name,
+       pg_catalog.format_type(a.atttypid, a.atttypmod) AS data_type,
+       col_description(c.oid, a.attnum) AS column_comment
+FROM pg_catalog.pg_attribute a
+JOIN pg_catalog.pg_class c ON c.oid = a.attrelid
+WHERE a.attrelid = ANY(:oids) AND a.attnum > 0 AND NOT a.attisdropped
+ORDER BY c.relname, a.attnum
+""")
+
+# Tables referenced through foreign keys by the given tables
+FOREIGN_KEYS_QUERY = text("""
+SELECT c.relname AS table_name, r.relname AS referenced_table
+FROM pg_catalog.pg_constraint co
+JOIN pg_catalog.pg_class c ON c.oid = co.conrelid
+JOIN pg_catalog.pg_class r ON r.oid = co.confrelid
+WHERE co.contype = 'f' AND co.conrelid = ANY(:oids)
+""")
+
+
+def _cache_path(db):
+    """Cache file for this database, keyed by its URL without the password"""
+    url = db._engine.url.render_as_string(hide_password=True)
+    digest = hashlib.sha256(url.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(SCHEMA_CACHE_DIR, f"{digest}.json")
+
+
+def _read_cache(path):
+    """Read a cached catalog from disk, returning an empty one if missing or corrupt"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f).get("tables", {})
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_cache(path, catalog):
+    """Atomically write the catalog to disk"""
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"tables": catalog}, f)
+        os.replace(tmp_path, path)
+    except OSError:
+        pass  # The cache is an optimization, never fail the connection because of it
+
+
+def _inspect_catalog(db):
+    """Fallback for non-PostgreSQL engines using the SQLAlchemy inspector"""
+    inspector = inspect(db._engine)
+    catalog = {}
+    for table_name in inspector.get_table_names():
+        catalog[table_name] = {
+            "fingerprint": None,
+            "comment": None,
+            "columns": [
+                {"name": col["name"], "type": str(col["type"]), "comment": col.get("comment")}
+                for col in inspector.get_columns(table_name)
+            ],
+            "foreign_keys": sorted({fk["referred_table"] for fk in inspector.get_foreign_keys(table_name)}),
+        }
+    return catalog
+
+
+def load_schema_catalog(db):
+    """
+    Return {table_name: {"fingerprint", "comment", "columns", "foreign_keys"}} for the current schema.
+    Uses the on-disk cache and only re-reads the columns of tables whose fingerprint changed.
+    """
+    if db.dialect != "postgresql":
+        return _inspect_catalog(db)
+
+    path = _cache_path(db)
+    cached = _read_cache(path)
+
+    with db._engine.connect() as conn:
+        current = {row.table_name: row for row in conn.execute(FINGERPRINT_QUERY)}
+
+        catalog = {}
+        stale_oids = []
+        for table_name, row in current.items():
+            entry = cached.get(table_name)
+            if entry is not None and entry.get("fingerprint") == row.fingerprint:
+                catalog[table_name] = entry
+            else:
+                stale_oids.append(row.oid)
+
+        if stale_oids:
+            for row in conn.execute(COLUMNS_QUERY, {"oids": stale_oids}):
+                entry = catalog.setdefault(row.table_name, {
+                    "fingerprint": current[row.table_name].fingerprint,
+                    "comment": row.table_comment,
+                    "columns": [],
+                    "foreign_keys": [],
+                })
+                entry["columns"].append({
+                    "name": row.column_name,
+                    "type": row.data_type,
+                    "comment": row.column_comment,
+                })
+            for row in conn.execute(FOREIGN_KEYS_QUERY, {"oids": stale_oids}):
+                entry = catalog.get(row.table_name)
+                if entry is not None and row.referenced_table not in entry["foreign_keys"]:
+                    entry["foreign_keys"].append(row.referenced_table)
+
+    if stale_oids or len(catalog) != len(cached):
+        _write_cache(path, catalog)
+
+    return dict(sorted(catalog.items()))
+
+
+def schema_fingerprint(catalog):
+    """Single hash summarizing the definition of every table in the catalog"""
+    digest = hashlib.sha256()
+    for table_name in sorted(catalog):
+        entry = catalog[table_name]
+        digest.update(f"{table_name}={entry.get('fingerprint')};".encode("utf-8"))
+        if entry.get("fingerprint") is None:
+            # Without catalog fingerprints (non-PostgreSQL), hash the column definitions instead
+            for col in entry["columns"]:
+                digest.update(f"{col['name']}:{col['type']},".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def format_schema(catalog, table_names=None):
+    """Render the catalog (or only `table_names`) as the schema instruction block"""
+    schema_lines = ["The database has the following tables and columns:\n"]
+
+    for table_name in table_names if table_names is not None else catalog:
+        column_list = [f"- {col['name']} ({col['type']})" for col in catalog[table_name]["columns"]]
+        schema_lines.append(f"Table: {table_name}")
+        schema_lines.extend(column_list)
+        schema_lines.append("")  # Blank line between tables
+
+    return "\n".join(schema_lines)
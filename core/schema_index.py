@@ -0,0 +1,97 @@
+import threading
+from collections import defaultdict
+
+from config.settings import SCHEMA_TOP_K, SCHEMA_MAX_FK_NEIGHBORS
+from core.schema_cache import load_schema_catalog, schema_fingerprint, format_schema
+from utils.text_search import BM25Index, tokenize, estimate_tokens
+
+# Table names weigh more than column names when ranking
+TABLE_NAME_BOOST = 3
+
+# Schema indexes shared by every session connected to the same schema version
+_index_cache = {}
+_index_lock = threading.Lock()
+_MAX_CACHED_INDEXES = 16
+
+
+class SchemaIndex:
+    """BM25 relevance index over table names, column names and comments, with foreign-key neighbors"""
+
+    def __init__(self, catalog, top_k=SCHEMA_TOP_K, max_fk_neighbors=SCHEMA_MAX_FK_NEIGHBORS):
+        self.catalog = catalog
+        self.top_k = top_k
+        self.max_fk_neighbors = max_fk_neighbors
+        self.fingerprint = schema_fingerprint(catalog)
+        self.full_schema_tokens = estimate_tokens(format_schema(catalog))
+
+        self._index = BM25Index()
+        self._neighbors = defaultdict(set)
+        for table_name, table in catalog.items():
+            tokens = tokenize(table_name) * TABLE_NAME_BOOST
+            tokens += tokenize(table.get("comment"))
+            for col in table["columns"]:
+                tokens += tokenize(col["name"]) + tokenize(col.get("comment"))
+            self._index.add(table_name, tokens)
+
+            for referenced in table.get("foreign_keys", []):
+                if referenced in catalog and referenced != table_name:
+                    self._neighbors[table_name].add(referenced)
+                    self._neighbors[referenced].add(table_name)
+
+    @property
+    def table_names(self):
+        return list(self.catalog)
+
+    def rank_tables(self, question, k=None):
+        """Top-k tables for the question plus foreign-key neighbors of the best matches"""
+        k = k or self.top_k
+        if len(self.catalog) <= k:
+            return list(self.catalog)
+
+        selected = [table_name for table_name, _ in self._index.search(tokenize(question), k)]
+
+        # Add the tables the best matches join to, so the agent can still build the joins
+        neighbors_added = 0
+        for table_name in selected[:3]:
+            for neighbor in sorted(self._neighbors[table_name]):
+                if neighbors_added >= self.max_fk_neighbors:
+                    break
+                if neighbor not in selected:
+                    selected.append(neighbor)
+                    neighbors_added += 1
+
+        return selected
+
+    def build_slice(self, question, k=None):
+        """Return (schema_text, stats) with only the tables relevant to the question"""
+        tables = self.rank_tables(question, k)
+        if tables:
+            schema_text = format_schema(self.catalog, tables)
+        else:
+            # Nothing matched: list the table names only, the agent can still inspect them with its tools
+            schema_text = "The database has the following tables: " + ", ".join(self.catalog)
+
+        slice_tokens = estimate_tokens(schema_text)
+        stats = {
+            "tables": tables,
+            "total_tables": len(self.catalog),
+            "full_tokens": self.full_schema_tokens,
+            "slice_tokens": slice_tokens,
+            "saved_tokens": max(0, self.full_schema_tokens - slice_tokens),
+        }
+        return schema_text, stats
+
+
+def get_schema_index(db):
+    """Return the schema index for this database, building it once per schema version"""
+    catalog = load_schema_catalog(db)
+    fingerprint = schema_fingerprint(catalog)
+
+    with _index_lock:
+        index = _index_cache.get(fingerprint)
+        if index is None:
+            index = SchemaIndex(catalog)
+            if len(_index_cache) >= _MAX_CACHED_INDEXES:
+                _index_cache.pop(next(iter(_index_cache)))
+            _index_cache[fingerprint] = index
+    return index
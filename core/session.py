@@ -0,0 +1,98 @@
+import functools
+
+from config.settings import FAST_DISPATCH_ENABLED, LLM_WARM_ON_CONNECT, MEMORY_MODE, TABLE_PREVIEW_PREFETCH
+from core.background import submit_background
+from core.database import connect_to_database, inject_db_schema_to_memory
+from core.fast_dispatch import FastDispatcher
+from core.llm_gateway import warm_model
+from core.memory import create_memory, HybridSummaryMemory
+from core.memory_backend import get_memory_backend
+from core.memory_store import load_memory_store
+from core.resources import get_agents, get_chat_model
+from core.schema_index import get_schema_index
+from core.table_preview import get_table_estimates, prefetch_table_previews
+from tools.memory_tool import MemorySearchTool
+
+
+class ChatSession:
+    """
+    Everything one conversation needs to answer questions: shared database, models and agents, plus its
+    own memory. Independent of the UI, so the Streamlit app and the API service use the same objects.
+    """
+
+    def __init__(self, session_id, db, llm, sql_agent, dispatcher_chain, memory, memory_store,
+                 model_type, model_name, schema_index=None, fast_dispatcher=None,
+                 conversation_summary="", show_reasoning=False, decompose_chain=None):
+        self.session_id = session_id
+        self.db = db
+        self.llm = llm
+        self.sql_agent = sql_agent
+        self.dispatcher_chain = dispatcher_chain
+        self.decompose_chain = decompose_chain
+        self.memory = memory
+        self.memory_store = memory_store
+        self.memory_tool = MemorySearchTool(memory_store, memory, conversation_summary)
+        self.model_type = model_type
+        self.model_name = model_name
+        self.schema_index = schema_index
+        self.fast_dispatcher = fast_dispatcher
+        self.show_reasoning = show_reasoning
+
+        # Outputs of the last question, read by the UI after answering
+        self.last_result_query = None
+        self.last_answer_seconds = None
+        self.last_ttft_seconds = None
+        self.last_trace = None
+        self.schema_slice_stats = None
+
+
+def create_session(session_id, db_config, model_config, memory_mode=MEMORY_MODE, show_reasoning=False,
+                   memory_store=None, conversation_summary=None):
+    """
+    Connect to the database and build a ChatSession for the given DatabaseConfig and ModelConfig.
+    The session's turns and summary are restored from the memory backend unless given.
+    """
+    db = connect_to_database(db_config.user, db_config.password, db_config.host, db_config.port, db_config.name)
+
+    # Clients are shared by every session with the same settings; the planner runs colder for stable JSON
+    # and summaries wait behind answers on the same backend
+    model_type, model_name = model_config.model_type, model_config.model_name
+    client_options = {"base_url": model_config.host or None, "api_key": model_config.api_key or None}
+    llm = get_chat_model(model_type, model_name, model_config.temperature, **client_options)
+    planner_llm = get_chat_model(model_type, model_name, 0.1, **client_options)
+    summary_llm = get_chat_model(model_type, model_name, model_config.temperature, priority="background",
+                                 **client_options)
+    if LLM_WARM_ON_CONNECT:
+        submit_background(warm_model, model_type, model_name, client_options["base_url"],
+                          key=("warm", model_type, model_name, client_options["base_url"]))
+
+    # Create memory, restoring the summary persisted for this session
+    backend = get_memory_backend()
+    if memory_store is None:
+        memory_store = load_memory_store(backend, session_id)
+    if conversation_summary is None:
+        conversation_summary = backend.load_summary(session_id) if backend is not None else ""
+    memory = create_memory(summary_llm, memory_mode)
+    if memory_mode != "buffer" and conversation_summary:
+        memory.buffer = conversation_summary
+    if isinstance(memory, HybridSummaryMemory) and backend is not None:
+        memory.on_summary = functools.partial(backend.save_summary, session_id)
+
+    agents = get_agents(db, llm, planner_llm, model_type)
+
+    # Build the relevance index used to prune the schema sent with each question
+    schema_index = get_schema_index(db)
+    fast_dispatcher = FastDispatcher(schema_index.table_names) if FAST_DISPATCH_ENABLED else None
+    inject_db_schema_to_memory(db, memory, debug=True, schema_index=schema_index)
+
+    # Warm the preview cache for the first tables; views are only evaluated when expanded
+    estimates = get_table_estimates(db)
+    tables = [table for table in db.get_usable_table_names() if estimates.get(table, {}).get("kind") != "view"]
+    prefetch_table_previews(db, tables[:TABLE_PREVIEW_PREFETCH])
+
+    return ChatSession(
+        session_id, db, llm, agents["sql_agent"], agents["dispatcher_chain"], memory, memory_store,
+        model_type, model_name, schema_index=schema_index, fast_dispatcher=fast_dispatcher,
+        conversation_summary=conversation_summary, show_reasoning=show_reasoning,
+        decompose_chain=agents["decompose_chain"],
+    )
@@ -0,0 +1,228 @@
+import contextlib
+import contextvars
+import hashlib
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from config.settings import (
+    SNAPSHOT_AUTO, SNAPSHOT_ENABLED, SNAPSHOT_IDLE_TIMEOUT, SNAPSHOT_MAX_AGE, SNAPSHOT_MAX_ENTRIES,
+    SNAPSHOT_MIN_HITS, SNAPSHOT_REFRESH_INTERVAL
+)
+from core.background import submit_background
+from utils.sql_helpers import extract_tables, normalize_sql
+
+logger = logging.getLogger(__name__)
+
+# Queries worth precomputing: aggregates over whole tables, not lookups of a few rows
+_AGGREGATE_RE = re.compile(r"\bgroup\s+by\b|\b(?:count|sum|avg|min|max)\s*\(|\bdistinct\b", re.IGNORECASE)
+_SELECT_RE = re.compile(r"^\s*(?:select|with)\b", re.IGNORECASE)
+
+# Set while a snapshot is being taken, so its own query reaches the database
+_bypass = contextvars.ContextVar("snapshot_bypass", default=False)
+
+
+@contextlib.contextmanager
+def bypass_snapshots():
+    token = _bypass.set(True)
+    try:
+        yield
+    finally:
+        _bypass.reset(token)
+
+
+def _table_versions(db, tables):
+    # core.database builds its databases from core.result_stream, which routes queries here
+    from core.database import get_table_versions
+
+    return get_table_versions(db, tables)
+
+
+def _database_key(db):
+    return db._engine.url.render_as_string(hide_password=True)
+
+
+def is_snapshot_candidate(sql):
+    return bool(_SELECT_RE.match(sql) and _AGGREGATE_RE.search(sql))
+
+
+def materialized_view_sql(sql):
+    """DDL a DBA can run to keep the query as a materialized view instead (the app's sessions are read-only)"""
+    name = "chat_mv_" + hashlib.sha1(normalize_sql(sql).encode("utf-8")).hexdigest()[:10]
+    return f"CREATE MATERIALIZED VIEW {name} AS\n{normalize_sql(sql)};\n\nREFRESH MATERIALIZED VIEW {name};"
+
+
+class SnapshotStore:
+    """
+    Counts the SQL behind answered questions and keeps the result of the hot aggregate queries.
+    A snapshot is served instead of running its query while it is younger than `max_age` and none of its
+    tables has changed; stale snapshots are retaken in the background and on a schedule.
+    """
+
+    def __init__(self, min_hits=SNAPSHOT_MIN_HITS, max_age=SNAPSHOT_MAX_AGE, max_entries=SNAPSHOT_MAX_ENTRIES,
+                 auto=SNAPSHOT_AUTO):
+        self.min_hits = min_hits
+        self.max_age = max_age
+        self.max_entries = max_entries
+        self.auto = auto
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._refresher = None
+        self.hits = 0
+        self.stale = 0
+        self.refreshes = 0
+
+    def record(self, db, question, sql_queries, known_tables=None):
+        """Count the queries that answered a question; hot ones get a snapshot when `auto` is set"""
+        promoted = []
+        with self._lock:
+            for sql in sql_queries:
+                if not is_snapshot_candidate(sql):
+                    continue
+                key = (_database_key(db), normalize_sql(sql))
+                entry = self._entries.get(key)
+                if entry is None:
+                    entry = self._entries[key] = {
+                        "db": db, "sql": normalize_sql(sql), "tables": extract_tables(sql, known_tables), "count": 0,
+                        "questions": [], "enabled": False, "snapshot": None,
+                    }
+                self._entries.move_to_end(key)
+                entry["count"] += 1
+                entry["last_used"] = time.time()
+                if question not in entry["questions"]:
+                    entry["questions"] = (entry["questions"] + [question])[-5:]
+                if self.auto and not entry["enabled"] and entry["count"] >= self.min_hits:
+                    entry["enabled"] = True
+                    promoted.append(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        for key in promoted:
+            self.refresh(key)
+
+    def enable(self, key, enabled=True):
+        """Start or stop keeping a snapshot of a tracked query"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            entry["enabled"] = enabled
+            if not enabled:
+                entry["snapshot"] = None
+        if enabled:
+            submit_background(self.refresh, key, key=("snapshot", key))
+
+    def refresh(self, key):
+        """Retake the snapshot of a tracked query"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or not entry["enabled"]:
+                return
+            db, sql, tables = entry["db"], entry["sql"], entry["tables"]
+
+        # Versions are read first, so changes made while the query runs make the snapshot stale
+        versions = _table_versions(db, tables)
+        started = time.time()
+        with bypass_snapshots():
+            result = db.run_no_throw(sql)
+        if str(result).startswith("Error"):
+            logger.warning("Snapshot of %s failed: %s", sql, result)
+            return
+        with self._lock:
+            entry["snapshot"] = {"result": result, "versions": versions, "taken_at": started,
+                                 "seconds": time.time() - started}
+            self.refreshes += 1
+        self._start_refresher()
+
+    def lookup(self, db, command):
+        """Result of a fresh snapshot for this SQL, or None to run it (stale ones are retaken meanwhile)"""
+        if _bypass.get() or not isinstance(command, str):
+            return None
+        key = (_database_key(db), normalize_sql(command))
+        with self._lock:
+            entry = self._entries.get(key)
+            snapshot = entry["snapshot"] if entry is not None else None
+            if snapshot is None:
+                return None
+            entry["last_used"] = time.time()
+            tables = entry["tables"]
+
+        age = time.time() - snapshot["taken_at"]
+        if age <= self.max_age and _table_versions(db, tables) == snapshot["versions"]:
+            with self._lock:
+                self.hits += 1
+            return snapshot["result"], age
+
+        with self._lock:
+            self.stale += 1
+        submit_background(self.refresh, key, key=("snapshot", key))
+        return None
+
+    def refresh_due(self):
+        """Retake snapshots that are old or whose tables changed; forget the ones nobody asks for anymore"""
+        now = time.time()
+        due = []
+        with self._lock:
+            for key, entry in self._entries.items():
+                snapshot = entry["snapshot"]
+                if snapshot is None:
+                    continue
+                if now - entry["last_used"] > SNAPSHOT_IDLE_TIMEOUT:
+                    # Taken again once the query is asked for enough times
+                    entry["snapshot"] = None
+                    entry["enabled"] = False
+                    continue
+                due.append((key, entry["db"], entry["tables"], snapshot))
+        for key, db, tables, snapshot in due:
+            try:
+                if (now - snapshot["taken_at"] >= SNAPSHOT_REFRESH_INTERVAL
+                        or _table_versions(db, tables) != snapshot["versions"]):
+                    submit_background(self.refresh, key, key=("snapshot", key))
+            except Exception:
+                logger.exception("Could not check snapshot of %s", key[1])
+
+    def _start_refresher(self):
+        with self._lock:
+            if self._refresher is not None:
+                return
+            self._refresher = threading.Thread(target=self._refresh_loop, name="snapshot-refresher", daemon=True)
+        self._refresher.start()
+
+    def _refresh_loop(self):
+        while True:
+            time.sleep(SNAPSHOT_REFRESH_INTERVAL)
+            self.refresh_due()
+
+    def hot_queries(self, db, limit=10):
+        """Most frequent tracked queries on this database, with their snapshot state"""
+        now = time.time()
+        database_key = _database_key(db)
+        with self._lock:
+            entries = [item for item in self._entries.items() if item[0][0] == database_key]
+            entries = sorted(entries, key=lambda item: item[1]["count"], reverse=True)[:limit]
+            return [
+                {
+                    "key": key, "sql": entry["sql"], "count": entry["count"], "questions": list(entry["questions"]),
+                    "enabled": entry["enabled"],
+                    "snapshot_age": now - entry["snapshot"]["taken_at"] if entry["snapshot"] else None,
+                    "snapshot_seconds": entry["snapshot"]["seconds"] if entry["snapshot"] else None,
+                }
+                for key, entry in entries
+            ]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "tracked": len(self._entries),
+                "snapshots": sum(1 for entry in self._entries.values() if entry["snapshot"] is not None),
+                "hits": self.hits, "stale": self.stale, "refreshes": self.refreshes,
+            }
+
+
+_snapshot_store = SnapshotStore() if SNAPSHOT_ENABLED else None
+
+
+def get_snapshot_store():
+    """Return the process-wide snapshot store, or None when snapshots are disabled"""
+    return _snapshot_store
@@ -0,0 +1,96 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import text
+
+from config.settings import (
+    TABLE_PREVIEW_ROWS, TABLE_PREVIEW_TTL, TABLE_PREVIEW_WORKERS, TABLE_PREVIEW_SAMPLE_MIN_ROWS
+)
+from core.columnar import fetch_columnar
+
+# Planner estimates instead of COUNT(*): reltuples is -1 until the table has been analyzed
+TABLE_ESTIMATES_QUERY = text("""
+SELECT c.relname AS table_name, c.relkind AS kind, c.reltuples::bigint AS estimated_rows
+FROM pg_catalog.pg_class c
+JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
+WHERE c.relkind IN ('r', 'p', 'v', 'm', 'f') AND n.nspname = current_schema()
+""")
+
+# Previews are cached per database and table; every session connected to the same database shares them
+_preview_cache = {}
+_cache_lock = threading.Lock()
+
+_executor = ThreadPoolExecutor(max_workers=TABLE_PREVIEW_WORKERS, thread_name_prefix="preview")
+
+
+def _database_key(db):
+    return db._engine.url.render_as_string(hide_password=True)
+
+
+def _cached(key, loader):
+    """Return the cached value for key, calling loader() when it is missing or older than the TTL"""
+    now = time.time()
+    with _cache_lock:
+        entry = _preview_cache.get(key)
+        if entry is not None and now - entry[0] < TABLE_PREVIEW_TTL:
+            return entry[1]
+
+    value = loader()
+    with _cache_lock:
+        for stale in [k for k, (created, _) in _preview_cache.items() if now - created >= TABLE_PREVIEW_TTL]:
+            del _preview_cache[stale]
+        _preview_cache[key] = (now, value)
+    return value
+
+
+def get_table_estimates(db):
+    """Return {table: {"kind", "estimated_rows"}} from the catalog, without scanning any table"""
+    if db.dialect != "postgresql":
+        return {}
+
+    def load():
+        with db._engine.connect() as conn:
+            return {
+                row.table_name: {
+                    "kind": "view" if row.kind == "v" else "table",
+                    "estimated_rows": row.estimated_rows if row.estimated_rows >= 0 else None,
+                }
+                for row in conn.execute(TABLE_ESTIMATES_QUERY)
+            }
+
+    return _cached((_database_key(db), "__estimates__"), load)
+
+
+def _preview_sql(db, table_name, limit, estimated_rows):
+    """Build the preview query, sampling a few pages of big tables instead of reading from the start"""
+    table = db._engine.dialect.identifier_preparer.quote(table_name)
+    if estimated_rows and estimated_rows >= TABLE_PREVIEW_SAMPLE_MIN_ROWS:
+        # Read roughly 100x the rows we need, spread over random pages
+        percent = min(100.0, max(0.001, limit * 100 * 100.0 / estimated_rows))
+        return f"SELECT * FROM {table} TABLESAMPLE SYSTEM ({percent:.3f}) LIMIT {limit}"
+    return f"SELECT * FROM {table} LIMIT {limit}"
+
+
+def get_table_preview(db, table_name, limit=TABLE_PREVIEW_ROWS):
+    """Get a preview of a database table as a ColumnarResult, or an error message"""
+    estimate = get_table_estimates(db).get(table_name, {})
+
+    def load():
+        sql = _preview_sql(db, table_name, limit, estimate.get("estimated_rows"))
+        result = fetch_columnar(db._engine, sql, limit)
+        if not result.row_count and "TABLESAMPLE" in sql:
+            # The sampled pages may all be empty (e.g. after a bulk delete)
+            result = fetch_columnar(db._engine, _preview_sql(db, table_name, limit, None), limit)
+        return result
+
+    try:
+        return _cached((_database_key(db), table_name, limit), load)
+    except Exception as e:
+        # Errors are not cached, the next expansion tries again
+        return f"Error querying {table_name}: {str(e)}"
+
+
+def prefetch_table_previews(db, table_names, limit=TABLE_PREVIEW_ROWS):
+    """Load the previews of the given tables concurrently in the preview pool, without waiting for them"""
+    return [_executor.submit(get_table_preview, db, table, limit) for table in table_names]
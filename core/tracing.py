@@ -0,0 +1,291 @@
+import contextlib
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from config.settings import TRACE_ENABLED, TRACE_EXPORT_PATH, TRACE_EXPORT_FORMAT, TRACE_HISTORY
+from utils.text_search import estimate_tokens
+
+# Trace of the request being processed; asyncio tasks and to_thread workers inherit it
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+
+# Finished traces kept in memory for the sidebar panel
+_recent_traces = deque(maxlen=TRACE_HISTORY)
+_recent_lock = threading.Lock()
+_export_lock = threading.Lock()
+
+
+def _span_id():
+    return uuid.uuid4().hex[:16]
+
+
+class RequestTrace:
+    """Timed spans of one question: dispatch, agent steps, LLM calls, SQL and memory updates"""
+
+    def __init__(self, prompt):
+        self.trace_id = uuid.uuid4().hex
+        self.root_id = _span_id()
+        self.prompt = prompt
+        self.started = time.time()
+        self.duration_ms = None
+        self.spans = []
+        self._lock = threading.Lock()
+        self.handler = TraceCallbackHandler(self)
+
+    def add_span(self, name, started, ended, parent_id=None, span_id=None, **attributes):
+        """Record a finished span; started and ended are time.time() values"""
+        span = {
+            "span_id": span_id or _span_id(),
+            "parent_id": parent_id or self.root_id,
+            "name": name,
+            "start": started,
+            "duration_ms": round((ended - started) * 1000, 2),
+            "attributes": attributes,
+        }
+        with self._lock:
+            self.spans.append(span)
+        return span
+
+    @contextlib.contextmanager
+    def span(self, name, **attributes):
+        """Time a block; attributes added to the yielded dict while it runs are recorded too"""
+        started = time.time()
+        try:
+            yield attributes
+        finally:
+            self.add_span(name, started, time.time(), **attributes)
+
+    def finish(self):
+        self.duration_ms = round((time.time() - self.started) * 1000, 2)
+
+    def breakdown(self):
+        """Total milliseconds per span name (LLM calls and SQL also counted by tokens and rows)"""
+        totals = {}
+        with self._lock:
+            spans = list(self.spans)
+        for span in spans:
+            entry = totals.setdefault(span["name"], {"count": 0, "ms": 0.0})
+            entry["count"] += 1
+            entry["ms"] += span["duration_ms"]
+            for field in ("input_tokens", "output_tokens", "rows"):
+                if field in span["attributes"]:
+                    entry[field] = entry.get(field, 0) + (span["attributes"][field] or 0)
+        return totals
+
+    def to_dict(self):
+        with self._lock:
+            spans = list(self.spans)
+        return {
+            "trace_id": self.trace_id,
+            "prompt": self.prompt,
+            "start": self.started,
+            "duration_ms": self.duration_ms,
+            "spans": spans,
+        }
+
+
+def _token_usage(response):
+    """(input, output) tokens reported by the provider, or None when it reports nothing"""
+    for generations in response.generations:
+        for generation in generations:
+            message = getattr(generation, "message", None)
+            usage = getattr(message, "usage_metadata", None)
+            if usage:
+                return usage.get("input_tokens"), usage.get("output_tokens")
+            info = generation.generation_info or {}
+            if "eval_count" in info:  # Ollama
+                return info.get("prompt_eval_count"), info.get("eval_count")
+    usage = (response.llm_output or {}).get("token_usage")
+    if usage:  # OpenAI without streaming
+        return usage.get("prompt_tokens"), usage.get("completion_tokens")
+    return None
+
+
+class TraceCallbackHandler(BaseCallbackHandler):
+    """LangChain callbacks that turn LLM calls, tool calls and agent steps into spans of a RequestTrace"""
+
+    def __init__(self, trace):
+        self.trace = trace
+        self._open = {}
+        self._lock = threading.Lock()
+
+    def _start(self, run_id, parent_run_id, name, **attributes):
+        with self._lock:
+            parent = self._open.get(parent_run_id)
+            self._open[run_id] = {
+                "span_id": _span_id(),
+                "parent_id": parent["span_id"] if parent else None,
+                "name": name,
+                "start": time.time(),
+                "attributes": attributes,
+            }
+
+    def _end(self, run_id, **attributes):
+        with self._lock:
+            opened = self._open.pop(run_id, None)
+        if opened is None:
+            return
+        self.trace.add_span(opened["name"], opened["start"], time.time(), parent_id=opened["parent_id"],
+                            span_id=opened["span_id"], **{**opened["attributes"], **attributes})
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, **kwargs):
+        prompt_text = "".join(str(m.content) for batch in messages for m in batch)
+        self._start(run_id, parent_run_id, "llm", input_tokens=estimate_tokens(prompt_text))
+
+    def on_llm_start(self, serialized, prompts, *, run_id, parent_run_id=None, **kwargs):
+        self._start(run_id, parent_run_id, "llm", input_tokens=estimate_tokens("".join(prompts)))
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        usage = _token_usage(response)
+        if usage is None:
+            # Streaming providers often report no usage; keep the prompt estimate and estimate the output
+            text = "".join(g.text for generations in response.generations for g in generations)
+            self._end(run_id, output_tokens=estimate_tokens(text), estimated=True)
+        else:
+            self._end(run_id, input_tokens=usage[0], output_tokens=usage[1])
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error=str(error))
+
+    def on_tool_start(self, serialized, input_str, *, run_id, parent_run_id=None, **kwargs):
+        self._start(run_id, parent_run_id, f"tool:{(serialized or {}).get('name') or kwargs.get('name')}")
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error=str(error))
+
+    def on_agent_action(self, action, *, run_id, parent_run_id=None, **kwargs):
+        now = time.time()
+        with self._lock:
+            parent = self._open.get(parent_run_id)
+        self.trace.add_span("agent_step", now, now, parent_id=parent["span_id"] if parent else None,
+                            tool=action.tool, tool_input=str(action.tool_input)[:500])
+
+
+def start_trace(prompt):
+    """Start tracing a request in the current context; returns None when tracing is disabled"""
+    if not TRACE_ENABLED:
+        return None
+    trace = RequestTrace(prompt)
+    _current_trace.set(trace)
+    return trace
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+def trace_config():
+    """RunnableConfig that routes LangChain callbacks into the current trace"""
+    trace = _current_trace.get()
+    return {"callbacks": [trace.handler]} if trace is not None else {}
+
+
+@contextlib.contextmanager
+def trace_span(name, **attributes):
+    """Time a block as a span of the current trace; a no-op outside a traced request"""
+    trace = _current_trace.get()
+    if trace is None:
+        yield attributes
+        return
+    with trace.span(name, **attributes) as span_attributes:
+        yield span_attributes
+
+
+def traced(trace, name, fn):
+    """Wrap fn so each call is recorded as a span of trace (for background work)"""
+    if trace is None:
+        return fn
+
+    def wrapper(*args, **kwargs):
+        with trace.span(name):
+            return fn(*args, **kwargs)
+
+    wrapper.__name__ = getattr(fn, "__name__", name)
+    return wrapper
+
+
+def _otel_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def to_otel(trace):
+    """Convert a trace to one OTLP/JSON ExportTraceServiceRequest, as written by the collector file exporter"""
+    data = trace.to_dict()
+    root = {
+        "span_id": trace.root_id, "parent_id": None, "name": "request", "start": data["start"],
+        "duration_ms": data["duration_ms"] or 0, "attributes": {"prompt": data["prompt"]},
+    }
+    spans = []
+    for span in [root] + data["spans"]:
+        start_ns = int(span["start"] * 1e9)
+        spans.append({
+            "traceId": data["trace_id"],
+            "spanId": span["span_id"],
+            "parentSpanId": span["parent_id"] or "",
+            "name": span["name"],
+            "kind": 1,
+            "startTimeUnixNano": str(start_ns),
+            "endTimeUnixNano": str(start_ns + int(span["duration_ms"] * 1e6)),
+            "attributes": [
+                {"key": key, "value": _otel_value(value)}
+                for key, value in span["attributes"].items() if value is not None
+            ],
+        })
+    return {"resourceSpans": [{
+        "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": "postgres-whisperer"}}]},
+        "scopeSpans": [{"scope": {"name": "core.tracing"}, "spans": spans}],
+    }]}
+
+
+def export_trace(trace):
+    """Keep the finished trace for the sidebar and append it to the export file (runs in the background)"""
+    with _recent_lock:
+        _recent_traces.append(trace)
+    if not TRACE_EXPORT_PATH:
+        return
+    record = to_otel(trace) if TRACE_EXPORT_FORMAT == "otel" else trace.to_dict()
+    directory = os.path.dirname(TRACE_EXPORT_PATH)
+    with _export_lock:
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(TRACE_EXPORT_PATH, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, default=str) + "\n")
+
+
+def get_recent_traces():
+    """Finished traces, oldest first"""
+    with _recent_lock:
+        return list(_recent_traces)
+
+
+def latency_percentiles(traces=None):
+    """p50/p95 milliseconds per span name (and for whole requests) over the recent traces"""
+    traces = get_recent_traces() if traces is None else traces
+    samples = {"request": [t.duration_ms for t in traces if t.duration_ms is not None]}
+    for trace in traces:
+        for name, entry in trace.breakdown().items():
+            samples.setdefault(name, []).append(entry["ms"])
+
+    def percentile(values, q):
+        values = sorted(values)
+        return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+    return {
+        name: {"count": len(values), "p50": percentile(values, 0.5), "p95": percentile(values, 0.95)}
+        for name, values in samples.items() if values
+    }
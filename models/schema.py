@@ -1,3 +1,5 @@
+from typing import Literal
+
 from pydantic import BaseModel, Field
 
 
@@ -6,9 +8,20 @@ class MemorySearchInput(BaseModel):
 
 
 class AgentResponse(BaseModel):
-    reasoning: str = Field(default="", description="Agent's reasoning process")
-    action: str = Field(description="Action to take: database_query, memory_lookup, or direct_response")
+    action: Literal["database_query", "memory_lookup", "direct_response"] = Field(
+        description="Action to take: database_query, memory_lookup, or direct_response"
+    )
     explanation: str = Field(default="", description="Explanation for the chosen action")
+    reasoning: str = Field(default="", description="Agent's reasoning process")
+
+
+class SubQuery(BaseModel):
+    label: str = Field(default="", description="What this query answers")
+    sql: str = Field(description="A single read-only SELECT")
+
+
+class QueryPlan(BaseModel):
+    queries: list[SubQuery] = Field(default_factory=list, description="Independent queries for one question")
 
 
 class DatabaseConfig(BaseModel):
@@ -24,4 +37,18 @@ class ModelConfig(BaseModel):
     model_name: str
     temperature: float
     host: str = ""  # Only for Ollama
-    api_key: str = ""  # Only for OpenAI
\ No newline at end of file
+    api_key: str = ""  # Only for OpenAI
+
+
+class SessionRequest(BaseModel):
+    session_id: str = ""  # Reuse an id, with its token, to restore a persisted conversation
+    session_token: str = ""
+    database: DatabaseConfig
+    model: ModelConfig
+    memory_mode: str = "hybrid"
+    show_reasoning: bool = False
+
+
+class QuestionRequest(BaseModel):
+    prompt: str
+    stream: bool = True  # Newline-delimited JSON events instead of a single JSON answer
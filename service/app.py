@@ -0,0 +1,265 @@
+"""
+Streamlit-free API for the question pipeline. Each conversation is a ChatSession held by this process;
+questions go through a FairScheduler, so a bounded number run at once, users take turns, and a full
+queue answers 429 instead of piling up work.
+
+    uvicorn service.app:app --host 0.0.0.0 --port 8000
+
+Several processes can serve behind a load balancer as long as requests of a session stick to the
+process that created it (e.g. hashing the session id in the path); conversations themselves are
+persisted in the memory backend and restored when a session is created again elsewhere.
+
+Session ids are generated here and come with a token that every /sessions/{id} route requires in the
+X-Session-Token header. Tokens are signed with SERVICE_SECRET_KEY, which all processes must share for
+a conversation to be restored in another one.
+"""
+import asyncio
+import hashlib
+import hmac
+import json
+import secrets
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Header, HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+
+from config.settings import (
+    RESULT_PAGE_SIZE, SERVICE_SECRET_KEY, SERVICE_SESSION_IDLE_TIMEOUT, SERVICE_REQUEST_TIMEOUT
+)
+from core.llm_gateway import get_gateway_stats
+from core.memory import get_conversation_summary
+from core.memory_store import turns_as_messages
+from core.pipeline import answer_question
+from core.result_stream import fetch_result_page
+from core.session import create_session
+from core.snapshots import get_snapshot_store
+from core.table_preview import get_table_estimates, get_table_preview
+from models.schema import SessionRequest, QuestionRequest
+from service.scheduler import FairScheduler, QueueFull
+from utils.json_helpers import get_dispatch_parse_stats
+
+# Result queries kept per session for pagination, by result id
+MAX_RESULTS_PER_SESSION = 100
+
+scheduler = FairScheduler()
+_sessions = {}
+# Without a configured key, tokens only hold within this process
+_secret_key = (SERVICE_SECRET_KEY or secrets.token_hex(32)).encode("utf-8")
+
+
+@asynccontextmanager
+async def lifespan(app):
+    scheduler.start()
+    yield
+    await scheduler.stop()
+
+
+app = FastAPI(title="PostgresWhisperer API", lifespan=lifespan)
+
+
+class QueueStream:
+    """Pipeline stream that turns progress into JSON events on an asyncio queue"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.first_token_seconds = None
+        self.events = asyncio.Queue()
+        self._loop = asyncio.get_running_loop()
+
+    def _emit(self, event_type, **data):
+        # Callbacks may fire in tool threads; the queue belongs to the event loop
+        self._loop.call_soon_threadsafe(self.events.put_nowait, {"type": event_type, **data})
+
+    def status(self, message):
+        self._emit("status", message=message)
+
+    def reasoning(self, reasoning, action, explanation):
+        self._emit("reasoning", reasoning=reasoning, action=action, explanation=explanation)
+
+    def note(self, message):
+        self._emit("note", message=message)
+
+    def new_message(self):
+        self._emit("new_message")
+
+    def token(self, chunk):
+        if not chunk:
+            return
+        if self.first_token_seconds is None:
+            self.first_token_seconds = time.perf_counter() - self.started
+        self._emit("token", text=chunk)
+
+    def finish(self, result):
+        pass
+
+
+def _evict_idle_sessions():
+    now = time.time()
+    for session_id, entry in list(_sessions.items()):
+        if now - entry["last_used"] > SERVICE_SESSION_IDLE_TIMEOUT:
+            del _sessions[session_id]
+
+
+def _session_token(session_id):
+    return hmac.new(_secret_key, session_id.encode("utf-8"), hashlib.sha256).hexdigest()
+
+
+def _check_token(session_id, token):
+    if not hmac.compare_digest(token.encode("utf-8"), _session_token(session_id).encode("utf-8")):
+        raise HTTPException(status_code=403, detail="Invalid session token")
+
+
+def _get_entry(session_id, token):
+    _check_token(session_id, token)
+    entry = _sessions.get(session_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Unknown session, create it again")
+    entry["last_used"] = time.time()
+    return entry
+
+
+async def _answer(entry, prompt, stream=None):
+    """Run one question for the session and describe the answer"""
+    session = entry["session"]
+    answer = await answer_question(session, prompt, stream)
+    result_id = None
+    if session.last_result_query:
+        result_id = uuid.uuid4().hex
+        entry["results"][result_id] = session.last_result_query
+        while len(entry["results"]) > MAX_RESULTS_PER_SESSION:
+            entry["results"].popitem(last=False)
+    return {
+        "type": "answer",
+        "answer": answer,
+        "result_id": result_id,
+        "seconds": session.last_answer_seconds,
+        "first_token_seconds": session.last_ttft_seconds,
+    }
+
+
+@app.get("/health")
+async def health():
+    return {"status": "ok"}
+
+
+@app.get("/stats")
+async def stats():
+    snapshot_store = get_snapshot_store()
+    return {"sessions": len(_sessions), "scheduler": scheduler.queue_stats(), "llm": get_gateway_stats(),
+            "dispatch_parsing": get_dispatch_parse_stats(),
+            "snapshots": snapshot_store.stats() if snapshot_store is not None else None}
+
+
+@app.post("/sessions")
+async def open_session(request: SessionRequest):
+    _evict_idle_sessions()
+    if request.session_id:
+        # Restoring a conversation takes the token it was created with
+        _check_token(request.session_id, request.session_token)
+        if request.session_id in _sessions:
+            raise HTTPException(status_code=409, detail="Session is already open, close it first")
+        session_id = request.session_id
+    else:
+        session_id = uuid.uuid4().hex
+    try:
+        session = await asyncio.to_thread(
+            create_session, session_id, request.database, request.model,
+            memory_mode=request.memory_mode, show_reasoning=request.show_reasoning,
+        )
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"Connection error: {str(e)}")
+
+    if session_id in _sessions:
+        raise HTTPException(status_code=409, detail="Session is already open, close it first")
+    _sessions[session_id] = {"session": session, "last_used": time.time(), "results": OrderedDict()}
+    estimates = await asyncio.to_thread(get_table_estimates, session.db)
+    tables = [{"name": table, **estimates.get(table, {})} for table in session.db.get_usable_table_names()]
+    return {"session_id": session_id, "session_token": _session_token(session_id),
+            "model_name": session.model_name, "tables": tables}
+
+
+@app.delete("/sessions/{session_id}")
+async def close_session(session_id: str, x_session_token: str = Header("")):
+    _check_token(session_id, x_session_token)
+    _sessions.pop(session_id, None)
+    return {"closed": session_id}
+
+
+@app.post("/sessions/{session_id}/questions")
+async def ask(session_id: str, request: QuestionRequest, x_session_token: str = Header("")):
+    entry = _get_entry(session_id, x_session_token)
+    stream = QueueStream() if request.stream else None
+    try:
+        future = await scheduler.enqueue(session_id, lambda: _answer(entry, request.prompt, stream))
+    except QueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "5"})
+
+    if not request.stream:
+        try:
+            return await asyncio.wait_for(future, SERVICE_REQUEST_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=504, detail="The question took too long to answer")
+
+    async def events():
+        while not future.done():
+            next_event = asyncio.ensure_future(stream.events.get())
+            await asyncio.wait({next_event, future}, return_when=asyncio.FIRST_COMPLETED)
+            if not next_event.done():
+                next_event.cancel()
+                break
+            yield json.dumps(next_event.result()) + "\n"
+        # Events emitted right before the answer was ready
+        await asyncio.sleep(0)
+        while not stream.events.empty():
+            yield json.dumps(stream.events.get_nowait()) + "\n"
+        try:
+            final = future.result()
+        except Exception as e:
+            final = {"type": "error", "message": str(e)}
+        yield json.dumps(jsonable_encoder(final)) + "\n"
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+
+@app.get("/sessions/{session_id}/results/{result_id}")
+async def result_page(session_id: str, result_id: str, page: int = 0, page_size: int = RESULT_PAGE_SIZE,
+                      x_session_token: str = Header("")):
+    entry = _get_entry(session_id, x_session_token)
+    # One page never holds more than RESULT_PAGE_SIZE rows, whatever the caller asks for
+    page, page_size = max(0, page), max(1, min(page_size, RESULT_PAGE_SIZE))
+    if result_id not in entry["results"]:
+        raise HTTPException(status_code=404, detail="Unknown result")
+    sql, params = entry["results"][result_id]
+    try:
+        result = await asyncio.to_thread(
+            fetch_result_page, entry["session"].db._engine, sql, page, page_size, params
+        )
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Could not load the result: {str(e)}")
+    return jsonable_encoder({"columns": result.names, "rows": result.rows(), "truncated": result.truncated})
+
+
+@app.get("/sessions/{session_id}/tables/{table_name}/preview")
+async def table_preview(session_id: str, table_name: str, x_session_token: str = Header("")):
+    db = _get_entry(session_id, x_session_token)["session"].db
+    if table_name not in db.get_usable_table_names():
+        raise HTTPException(status_code=404, detail="Unknown table")
+    preview = await asyncio.to_thread(get_table_preview, db, table_name)
+    if isinstance(preview, str):
+        raise HTTPException(status_code=400, detail=preview)
+    return jsonable_encoder({"columns": preview.names, "rows": preview.rows(), "truncated": preview.truncated})
+
+
+@app.get("/sessions/{session_id}/memory")
+async def conversation_memory(session_id: str, turns: int = 0, x_session_token: str = Header("")):
+    # Only the last `turns` turns when given, the memory view does not need the whole store
+    session = _get_entry(session_id, x_session_token)["session"]
+    memory_store = session.memory_store
+    return {
+        "summary": get_conversation_summary(session.memory),
+        "turns": list(turns_as_messages(memory_store.recent(turns)) if turns > 0 else memory_store),
+    }
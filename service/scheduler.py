@@ -0,0 +1,109 @@
+import asyncio
+from collections import OrderedDict, deque
+
+from config.settings import SERVICE_WORKERS, SERVICE_MAX_QUEUE, SERVICE_MAX_QUEUE_PER_SESSION
+
+
+class QueueFull(Exception):
+    """Raised when a request is refused because the service or the session already has too much queued"""
+
+
+class FairScheduler:
+    """
+    Bounded pool of asyncio workers with one FIFO queue per session. Workers take requests round-robin
+    across sessions, so a user sending many questions cannot starve the others, and a session never runs
+    two requests at once (its memory must see turns in order). Full queues refuse new work (backpressure)
+    instead of growing without bound.
+    """
+
+    def __init__(self, workers=SERVICE_WORKERS, max_queue=SERVICE_MAX_QUEUE,
+                 max_queue_per_session=SERVICE_MAX_QUEUE_PER_SESSION):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.max_queue_per_session = max_queue_per_session
+        self._queues = OrderedDict()  # session id -> deque of (job, future), in round-robin order
+        self._running = set()  # sessions with a request in progress
+        self._queued = 0
+        self._wakeup = None
+        self._tasks = []
+        self.stats = {"completed": 0, "failed": 0, "rejected": 0}
+
+    def start(self):
+        self._wakeup = asyncio.Condition()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def enqueue(self, session_id, job):
+        """Queue job (a coroutine function) for the session, returning the future of its result"""
+        queue = self._queues.get(session_id)
+        if self._queued >= self.max_queue or (queue is not None and len(queue) >= self.max_queue_per_session):
+            self.stats["rejected"] += 1
+            raise QueueFull("Too many pending questions, try again shortly")
+
+        future = asyncio.get_running_loop().create_future()
+        if queue is None:
+            queue = self._queues[session_id] = deque()
+        queue.append((job, future))
+        self._queued += 1
+        async with self._wakeup:
+            self._wakeup.notify()
+        return future
+
+    async def submit(self, session_id, job):
+        """Queue job for the session and wait for its result"""
+        return await (await self.enqueue(session_id, job))
+
+    def _next_job(self):
+        """Pop the oldest request of the first idle session in round-robin order"""
+        for session_id, queue in self._queues.items():
+            if session_id in self._running:
+                continue
+            job, future = queue.popleft()
+            self._queued -= 1
+            # The session goes to the back of the rotation
+            del self._queues[session_id]
+            if queue:
+                self._queues[session_id] = queue
+            return session_id, job, future
+        return None
+
+    async def _worker(self):
+        while True:
+            async with self._wakeup:
+                await self._wakeup.wait_for(lambda: self._next_ready())
+                session_id, job, future = self._next_job()
+                self._running.add(session_id)
+            try:
+                if not future.cancelled():
+                    result = await job()
+                    if not future.cancelled():
+                        future.set_result(result)
+                    self.stats["completed"] += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.stats["failed"] += 1
+                if not future.cancelled():
+                    future.set_exception(e)
+            finally:
+                async with self._wakeup:
+                    self._running.discard(session_id)
+                    # The session may have more work queued that no worker could take while it ran
+                    self._wakeup.notify_all()
+
+    def _next_ready(self):
+        return any(session_id not in self._running for session_id in self._queues)
+
+    def queue_stats(self):
+        return {
+            "workers": self.workers,
+            "busy": len(self._running),
+            "queued": self._queued,
+            "sessions_waiting": sum(1 for session_id in self._queues if session_id not in self._running),
+            **self.stats,
+        }
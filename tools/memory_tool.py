@@ -1,26 +1,40 @@
-import streamlit as st
+from typing import Any
+
 from langchain_core.tools import BaseTool
+from config.settings import MEMORY_SEARCH_TOKEN_BUDGET
+from core.memory import get_conversation_summary
 from models.schema import MemorySearchInput
 
+# A single huge answer (e.g. a long SQL result) must not fill the whole budget
+MAX_MESSAGE_CHARS = MEMORY_SEARCH_TOKEN_BUDGET * 2
+
+
+def _clip(text):
+    return text if len(text) <= MAX_MESSAGE_CHARS else text[:MAX_MESSAGE_CHARS] + "..."
+
 
 class MemorySearchTool(BaseTool):
     name: str = "memory_search"
     description: str = "Search for information in the conversation memory to answer questions about past interactions"
+    memory_store: Any = None
+    memory: Any = None
+    conversation_summary: str = ""
 
     def _run(self, query: str) -> str:
-        if not st.session_state.memory_store:
+        memory_store = self.memory_store
+        if memory_store is None or not len(memory_store):
             return "No previous conversation memory available."
 
-        conversation_text = ""
-        for msg in st.session_state.memory_store:
-            role = msg.get("role", "")
-            content = msg.get("content", "")
-            conversation_text += f"{role}: {content}\n\n"
+        # Only the turns relevant to the query, within the token budget
+        parts = [f"human: {_clip(turn.human)}\n\nai: {_clip(turn.ai)}" for turn in memory_store.search(query)]
 
-        if st.session_state.conversation_summary:
-            conversation_text += f"Conversation summary: {st.session_state.conversation_summary}\n\n"
+        conversation_summary = get_conversation_summary(self.memory) or self.conversation_summary
+        if conversation_summary:
+            parts.append(f"Conversation summary: {conversation_summary}")
 
-        return f"Relevant information from conversation:\n{conversation_text}"
+        conversation_text = "\n\n".join(parts)
+        return f"Relevant information from conversation:\n{conversation_text}\n\n"
 
-    def __init__(self):
-        super().__init__(args_schema=MemorySearchInput)
\ No newline at end of file
+    def __init__(self, memory_store=None, memory=None, conversation_summary=""):
+        super().__init__(args_schema=MemorySearchInput, memory_store=memory_store, memory=memory,
+                         conversation_summary=conversation_summary or "")
@@ -1,9 +1,15 @@
+import functools
+import uuid
+
 import streamlit as st
-from langchain.memory import ConversationSummaryMemory
-from langchain_core.exceptions import OutputParserException
-from config.settings import MEMORY_SEARCH_PROMPT, DIRECT_RESPONSE_PROMPT
-from core.memory import update_conversation_memory, save_to_memory_store
-from utils.json_helpers import parse_dispatch_result
+from config.settings import CHAT_HISTORY_PAGE_TURNS, CHAT_HISTORY_RECENT_TURNS, RESULT_PAGE_SIZE
+from core.memory import get_conversation_summary
+from core.memory_store import turns_as_messages
+from core.pipeline import process_query
+from core.result_stream import fetch_result_page, is_paginable
+from ui.results import render_full_result
+from ui.service_client import get_service_client
+from ui.streaming import ChatStream
 
 
 def render_instructions():
@@ -23,72 +29,84 @@ def render_instructions():
     """)
 
 
+def render_message(history, message):
+    """Render one message, with the paginated full result behind it if any"""
+    with st.chat_message("user" if message.role == "human" else "assistant"):
+        st.write(history.content(message))
+        load_page = result_page_loader(message.meta)
+        if load_page is not None:
+            render_full_result(load_page, key=message.meta["id"])
+
+
+def show_older_messages():
+    st.session_state.history_pages = st.session_state.get("history_pages", 0) + 1
+
+
 def render_chat_history():
-    """Render the chat history from session state"""
-    for message in st.session_state.messages:
-        if message["role"] == "human":
-            with st.chat_message("user"):
-                st.write(message["content"])
-        else:
-            with st.chat_message("assistant"):
-                st.write(message["content"])
-
-
-def process_query(prompt, show_reasoning=False):
-    """Process user query through the planning system"""
-    try:
-        dispatch_result = st.session_state.dispatcher_chain.invoke(prompt)
-        reasoning, action, explanation = parse_dispatch_result(dispatch_result)
-
-        # If user wants to see reasoning, we'll show it
-        if show_reasoning:
-            with st.expander("🧠 Planner reasoning", expanded=True):
-                st.markdown(f"""
-        **🧭 Decided action:** `{action}`
-
-        **📖 Reasoning:**
-        {reasoning}
-        **🗣 Explanation:**
-        {explanation}
-        """)
-
-        # Based on the decided action, call the corresponding agent
-        if action == "database_query":
-            try:
-                response = st.session_state.sql_agent.invoke({"input": prompt})
-                result = response.get("output", "Agent returned no output.")
-            except OutputParserException as e:
-                raw = getattr(e, "llm_output", "No raw output")
-                result = f"Se encontró un error al interpretar la respuesta. Intentaré extraer la información útil:\n\n{raw}"
-            except Exception as e:
-                result = f"Error en la consulta: {str(e)}"
-        elif action == "memory_lookup":
-            # Use the memory tool to search the conversation
-            memory_result = st.session_state.memory_tool._run(prompt)
-
-            # Generate a response based on memory
-            memory_prompt = MEMORY_SEARCH_PROMPT.format(
-                memory_result=memory_result,
-                prompt=prompt
-            )
-
-            result = st.session_state.llm.invoke(memory_prompt).content
-        else:  # direct_response
-            # Generate a direct response without querying database or memory
-            direct_prompt = DIRECT_RESPONSE_PROMPT.format(prompt=prompt)
-            result = st.session_state.llm.invoke(direct_prompt).content
-
-        # Update memory with this interaction
-        update_conversation_memory(st.session_state.memory, prompt, result)
-
-        # Save to the memory store for the search tool
-        save_to_memory_store(st.session_state.memory_store, prompt, result)
-
-        return result
-
-    except Exception as e:
-        error_msg = f"Error al procesar la consulta: {str(e)}"
-        return error_msg
+    """Render the last turns of the chat, plus older pages on demand, so reruns cost the same in long chats"""
+    history = st.session_state.messages
+    pages = st.session_state.get("history_pages", 0)
+    visible = 2 * (CHAT_HISTORY_RECENT_TURNS + pages * CHAT_HISTORY_PAGE_TURNS)
+    hidden = len(history) - visible
+    if hidden > 0:
+        st.button(f"Show {min(hidden, 2 * CHAT_HISTORY_PAGE_TURNS)} older messages ({hidden} hidden)",
+                  key="show_older_messages", on_click=show_older_messages)
+
+    for message in history.window(visible):
+        render_message(history, message)
+
+
+def result_page_loader(meta):
+    """Function loading pages of the full result behind a message, or None if it has none"""
+    if not meta:
+        return None
+    client = get_service_client()
+    if meta.get("result_id") and client is not None:
+        return functools.partial(client.result_page, st.session_state.remote_session,
+                                 meta["result_id"], page_size=RESULT_PAGE_SIZE)
+    session = st.session_state.get("chat_session")
+    if meta.get("sql") and session is not None and is_paginable(meta["sql"]):
+        return functools.partial(fetch_result_page, session.db._engine, meta["sql"],
+                                 page_size=RESULT_PAGE_SIZE, parameters=meta.get("sql_params"))
+    return None
+
+
+def answer(prompt, stream):
+    """Answer through the API service when configured, otherwise in this process; returns (content, meta)"""
+    client = get_service_client()
+    if client is not None:
+        response = client.ask(st.session_state.remote_session, prompt, stream)
+        meta = {"id": uuid.uuid4().hex, "result_id": response["result_id"]} if response.get("result_id") else {}
+        return response["answer"], meta
+
+    session = st.session_state.chat_session
+    content = process_query(session, prompt, stream)
+    meta = {}
+    if session.last_result_query:
+        sql, sql_params = session.last_result_query
+        meta = {"id": uuid.uuid4().hex, "sql": sql, "sql_params": sql_params}
+    return content, meta
+
+
+def render_conversation_memory():
+    """Summary and turns of the conversation memory, from this process or the API service"""
+    client = get_service_client()
+    if client is not None:
+        memory = client.memory(st.session_state.remote_session, turns=CHAT_HISTORY_RECENT_TURNS)
+        conversation_summary, turns = memory["summary"], memory["turns"]
+    else:
+        session = st.session_state.chat_session
+        conversation_summary = get_conversation_summary(session.memory)
+        turns = turns_as_messages(session.memory_store.recent(CHAT_HISTORY_RECENT_TURNS))
+
+    if conversation_summary:
+        st.subheader("Conversation summary")
+        st.write(conversation_summary)
+
+    st.subheader(f"Message history (last {CHAT_HISTORY_RECENT_TURNS} turns)")
+    for msg in turns:
+        role = "🧑" if msg["role"] == "human" else "🤖"
+        st.text(f"{role} {msg['content'][:100]}..." if len(msg['content']) > 100 else f"{role} {msg['content']}")
 
 
 def render_chat_interface():
@@ -99,7 +117,7 @@ def render_chat_interface():
     # User input
     if prompt := st.chat_input("Ask about your database or the previous conversation..."):
         # Add user message to history
-        st.session_state.messages.append({"role": "human", "content": prompt})
+        st.session_state.messages.append("human", prompt)
 
         # Display user message
         with st.chat_message("user"):
@@ -109,27 +127,22 @@ def render_chat_interface():
         if not st.session_state.initialized:
             with st.chat_message("assistant"):
                 st.write("Please configure and connect to the database first.")
-            st.session_state.messages.append(
-                {"role": "assistant", "content": "Please configure and connect to the database first."})
+            st.session_state.messages.append("assistant", "Please configure and connect to the database first.")
         else:
             # Process the query with the planning system
             with st.chat_message("assistant"):
-                with st.spinner(f"Thinking with {st.session_state.model_name}..."):
-                    result = process_query(prompt, st.session_state.show_reasoning)
-                    st.write(result)
+                # Dispatcher decision, agent steps and answer tokens are shown as they are produced
+                stream = ChatStream(f"Thinking with {st.session_state.model_name}...")
+                content, meta = answer(prompt, stream)
+                stream.finish(content)
 
-                    # Add response to history
-                    st.session_state.messages.append({"role": "assistant", "content": result})
+                # Add response to history, with the query behind it for the paginated full result
+                load_page = result_page_loader(meta)
+                if load_page is not None:
+                    render_full_result(load_page, key=meta["id"])
+                st.session_state.messages.append("assistant", content, **meta)
 
     # Visualization of memory (optional)
-    if st.session_state.initialized and 'memory' in st.session_state:
+    if st.session_state.initialized:
         with st.expander("View conversation memory", expanded=False):
-            if isinstance(st.session_state.memory, ConversationSummaryMemory) and st.session_state.conversation_summary:
-                st.subheader("Conversation summary")
-                st.write(st.session_state.conversation_summary)
-
-            st.subheader("Message history")
-            for i, msg in enumerate(st.session_state.memory_store):
-                role = "🧑" if msg["role"] == "human" else "🤖"
-                st.text(
-                    f"{role} {msg['content'][:100]}..." if len(msg['content']) > 100 else f"{role} {msg['content']}")
\ No newline at end of file
+            render_conversation_memory()
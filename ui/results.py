@@ -0,0 +1,33 @@
+import streamlit as st
+
+from config.settings import RESULT_PAGE_SIZE
+
+
+def render_full_result(load_page, key):
+    """
+    Paginated view of the full query result; nothing is fetched until the user asks for it.
+    load_page(page) returns a ColumnarResult, read locally or from the API service.
+    """
+    if not st.checkbox("Show full result", key=f"{key}_show"):
+        return
+
+    page = st.number_input("Page", min_value=1, value=1, step=1, key=f"{key}_page")
+    try:
+        result = load_page(page - 1)
+    except Exception as e:
+        st.error(f"Could not load the result: {str(e)}")
+        return
+
+    # The same column buffers feed the table and the chart, without building row objects
+    data = result.frame_data()
+    st.dataframe(data, use_container_width=True)
+    first_row = (page - 1) * RESULT_PAGE_SIZE
+    st.caption(
+        f"Rows {first_row + 1}–{first_row + result.row_count}" + (" · more on the next page" if result.truncated else "")
+        if result.row_count else "No rows on this page"
+    )
+
+    numeric_columns = result.numeric_columns()
+    label_columns = [name for name in result.names if name not in numeric_columns]
+    if numeric_columns and result.row_count and st.checkbox("Chart", key=f"{key}_chart"):
+        st.bar_chart(data, x=label_columns[0] if label_columns else None, y=numeric_columns)
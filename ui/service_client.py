@@ -0,0 +1,101 @@
+import json
+
+import httpx
+
+from config.settings import SERVICE_URL, SERVICE_REQUEST_TIMEOUT, RESULT_PAGE_SIZE
+from core.columnar import ColumnarResult
+
+_client = None
+
+
+class ServiceClient:
+    """HTTP client of the API service (service/app.py), used by the Streamlit app when SERVICE_URL is set"""
+
+    def __init__(self, base_url=SERVICE_URL, timeout=SERVICE_REQUEST_TIMEOUT):
+        self._http = httpx.Client(base_url=base_url, timeout=timeout)
+
+    @staticmethod
+    def _headers(session):
+        return {"X-Session-Token": session["session_token"]}
+
+    def _get(self, session, path, **params):
+        response = self._http.get(f"/sessions/{session['session_id']}{path}", params=params,
+                                  headers=self._headers(session))
+        response.raise_for_status()
+        return response.json()
+
+    def open_session(self, database, model, memory_mode, show_reasoning, previous=None):
+        """Open a session on the service; with the previous one's id and token, its conversation is restored"""
+        response = self._http.post("/sessions", json={
+            "session_id": previous["session_id"] if previous else "",
+            "session_token": previous["session_token"] if previous else "",
+            "database": database.model_dump(),
+            "model": model.model_dump(),
+            "memory_mode": memory_mode,
+            "show_reasoning": show_reasoning,
+        })
+        if response.status_code >= 400:
+            raise ConnectionError(response.json().get("detail", response.text))
+        return response.json()
+
+    def close_session(self, session):
+        self._http.delete(f"/sessions/{session['session_id']}", headers=self._headers(session))
+
+    def ask(self, session, prompt, stream):
+        """Ask a question, replaying the service's progress events on stream; returns the answer event"""
+        try:
+            with self._http.stream("POST", f"/sessions/{session['session_id']}/questions",
+                                   json={"prompt": prompt, "stream": True},
+                                   headers=self._headers(session)) as response:
+                if response.status_code == 429:
+                    return {"answer": "The service is busy right now, please try again in a few seconds."}
+                response.raise_for_status()
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    event = json.loads(line)
+                    kind = event.pop("type")
+                    if kind == "answer":
+                        return event
+                    if kind == "error":
+                        return {"answer": f"Error al procesar la consulta: {event['message']}"}
+                    if kind == "token":
+                        stream.token(event["text"])
+                    elif kind == "new_message":
+                        stream.new_message()
+                    elif kind == "reasoning":
+                        stream.reasoning(event["reasoning"], event["action"], event["explanation"])
+                    else:
+                        getattr(stream, kind)(event["message"])
+        except httpx.HTTPError as e:
+            return {"answer": f"Error al procesar la consulta: {str(e)}"}
+        return {"answer": "The service closed the connection before answering."}
+
+    def result_page(self, session, result_id, page, page_size=RESULT_PAGE_SIZE):
+        data = self._get(session, f"/results/{result_id}", page=page, page_size=page_size)
+        return ColumnarResult.from_rows(data["columns"], [tuple(row) for row in data["rows"]], data["truncated"])
+
+    def table_preview(self, session, table_name):
+        try:
+            data = self._get(session, f"/tables/{table_name}/preview")
+        except httpx.HTTPStatusError as e:
+            return f"Error querying {table_name}: {e.response.text}"
+        return ColumnarResult.from_rows(data["columns"], [tuple(row) for row in data["rows"]], data["truncated"])
+
+    def memory(self, session, turns=0):
+        return self._get(session, "/memory", turns=turns)
+
+    def stats(self):
+        response = self._http.get("/stats")
+        response.raise_for_status()
+        return response.json()
+
+
+def get_service_client():
+    """Client of the configured API service, or None when the pipeline runs inside the Streamlit app"""
+    global _client
+    if not SERVICE_URL:
+        return None
+    if _client is None:
+        _client = ServiceClient()
+    return _client
@@ -1,15 +1,29 @@
-import os
 import streamlit as st
-from core.agent_factory import initialize_agents
-from core.database import connect_to_database, inject_db_schema_to_memory, get_table_preview
-from core.memory import create_memory
-from tools.memory_tool import MemorySearchTool
+from core.database import get_pool_stats
+from core.guardrails import get_guardrail_stats
+from core.llm_gateway import get_gateway_stats
+from core.plan_cache import get_plan_cache
+from core.resources import get_resource_cache
+from core.result_cache import get_result_cache
+from core.session import create_session
+from core.snapshots import get_snapshot_store, materialized_view_sql
+from core.tracing import get_recent_traces, latency_percentiles
+from core.table_preview import get_table_estimates, get_table_preview
+from models.schema import DatabaseConfig, ModelConfig
+from ui.service_client import get_service_client
+from utils.json_helpers import get_dispatch_parse_stats
 from config.settings import (
     DEFAULT_TEMPERATURE, DEFAULT_MODEL_TYPE, DEFAULT_OLLAMA_HOST,
     DEFAULT_OLLAMA_MODEL, DEFAULT_OPENAI_MODEL, DEFAULT_DB_HOST,
-    DEFAULT_DB_PORT, DEFAULT_DB_NAME, DEFAULT_DB_USER
+    DEFAULT_DB_PORT, DEFAULT_DB_NAME, DEFAULT_DB_USER, MEMORY_MODE, TABLE_BROWSER_PAGE_SIZE
 )
 
+MEMORY_MODES = {
+    "Hybrid (recent turns + batched summary)": "hybrid",
+    "Summary on every turn": "summary",
+    "Full buffer": "buffer",
+}
+
 
 def render_sidebar():
     """Render the sidebar configuration UI"""
@@ -42,8 +56,11 @@ def render_sidebar():
 
         # Advanced options
         with st.expander("Advanced options"):
-            use_summary_memory = st.checkbox("Use summary memory", value=True,
-                                             help="Generates a conversation summary to handle long histories")
+            memory_mode = st.selectbox(
+                "Memory mode", list(MEMORY_MODES),
+                index=list(MEMORY_MODES.values()).index(MEMORY_MODE) if MEMORY_MODE in MEMORY_MODES.values() else 0,
+                help="Hybrid keeps recent turns verbatim and summarizes older ones in the background"
+            )
             temperature = st.slider("Temperature", min_value=0.0, max_value=1.0, value=DEFAULT_TEMPERATURE, step=0.1,
                                     help="Higher values generate more creative but less accurate responses")
             show_reasoning = st.checkbox("Show reasoning", value=False,
@@ -61,13 +78,114 @@ def render_sidebar():
             setup_connection(
                 model_option,
                 db_host, db_port, db_name, db_user, db_password,
-                temperature, use_summary_memory, show_reasoning,
+                temperature, MEMORY_MODES[memory_mode], show_reasoning,
                 ollama_host=ollama_host if model_option == "Local (Ollama)" else None,
                 ollama_model=ollama_model if model_option == "Local (Ollama)" else None,
                 openai_api_key=api_key if model_option == "API (OpenAI)" else None,
                 openai_model=openai_model if model_option == "API (OpenAI)" else None
             )
 
+        if st.session_state.get("initialized"):
+            render_table_browser()
+
+        # Queue of the API service when the pipeline runs there
+        client = get_service_client()
+        if client is not None and st.session_state.get("initialized"):
+            service_stats = client.stats()["scheduler"]
+            st.caption(
+                f"Service: {service_stats['busy']}/{service_stats['workers']} workers busy, "
+                f"{service_stats['queued']} questions queued, {service_stats['rejected']} refused"
+            )
+
+        session = st.session_state.get("chat_session")
+
+        # Shared connection pool usage across all sessions of this process
+        pool_stats = get_pool_stats()
+        if pool_stats:
+            with st.expander("Connection pools", expanded=False):
+                for stats in pool_stats:
+                    st.caption(stats["database"])
+                    st.text(
+                        f"size={stats['pool_size']} in_use={stats['checked_out']} "
+                        f"idle={stats['checked_in']} overflow={stats['overflow']} "
+                        f"last_used={stats['idle_seconds']}s ago"
+                    )
+
+        # Token savings from schema pruning on the last database question
+        if session is not None and session.schema_slice_stats:
+            slice_stats = session.schema_slice_stats
+            st.caption(
+                f"Schema pruning: {len(slice_stats['tables'])}/{slice_stats['total_tables']} tables sent, "
+                f"~{slice_stats['saved_tokens']} tokens saved "
+                f"({slice_stats['slice_tokens']} of {slice_stats['full_tokens']})"
+            )
+
+        # Shared answer cache counters
+        cache_stats = get_result_cache().stats()
+        if cache_stats["hits"] or cache_stats["misses"]:
+            st.caption(
+                f"Answer cache: {cache_stats['hits']} hits ({cache_stats['near_hits']} near-duplicate), "
+                f"{cache_stats['misses']} misses, {cache_stats['entries']} entries, "
+                f"{cache_stats['invalidations']} invalidated"
+            )
+        plan_stats = get_plan_cache().stats()
+        if plan_stats["plans"]:
+            st.caption(f"Compiled SQL plans: {plan_stats['plans']} stored, {plan_stats['hits']} direct executions")
+        resource_stats = get_resource_cache().stats()
+        if resource_stats["hits"]:
+            st.caption(
+                f"Shared LLM clients and agents: {resource_stats['entries']} cached, "
+                f"{resource_stats['hits']} reused across connects and sessions"
+            )
+        for gateway_stats in get_gateway_stats():
+            st.caption(
+                f"LLM {gateway_stats['backend']}: {gateway_stats['in_flight']}/{gateway_stats['max_concurrency']} "
+                f"in flight, {gateway_stats['queue_depth']} queued (max {gateway_stats['max_queue_depth']}), "
+                f"{gateway_stats['coalesced']} coalesced, avg wait {gateway_stats['avg_wait_seconds']:.2f}s"
+            )
+        guardrail_stats = get_guardrail_stats()
+        if guardrail_stats["checked"]:
+            st.caption(
+                f"Query guardrails: {guardrail_stats['checked']} checked, {guardrail_stats['rejected']} rejected, "
+                f"{guardrail_stats['limited']} limited"
+            )
+
+        if session is not None and session.last_answer_seconds is not None:
+            ttft = session.last_ttft_seconds
+            st.caption(
+                f"Last answer in {session.last_answer_seconds:.2f}s"
+                + (f", first token after {ttft:.2f}s" if ttft is not None else "")
+            )
+
+        if session is not None:
+            render_trace_panel(session)
+            render_hot_queries(session)
+
+        # Background summarization cost, reported apart from the answer latency
+        memory_stats = getattr(session.memory, "stats", None) if session is not None else None
+        if memory_stats and memory_stats["summary_calls"]:
+            st.caption(
+                f"Summaries: {memory_stats['summary_calls']} calls for {memory_stats['turns_summarized']} turns, "
+                f"last took {memory_stats['last_summary_seconds']:.2f}s, ~{memory_stats['tokens_saved']} tokens saved"
+            )
+
+        # Share of questions routed without the planner LLM
+        if session is not None and session.fast_dispatcher is not None:
+            dispatch_stats = session.fast_dispatcher.stats()
+            if dispatch_stats["fast_hits"] or dispatch_stats["fallbacks"]:
+                st.caption(
+                    f"Fast dispatch: {dispatch_stats['hit_rate']:.0%} of questions "
+                    f"({dispatch_stats['fast_hits']} local, {dispatch_stats['fallbacks']} sent to the planner)"
+                )
+
+        parse_stats = get_dispatch_parse_stats()
+        if parse_stats["parsed"] or parse_stats["defaulted"]:
+            st.caption(
+                f"Planner replies: {parse_stats['parsed']} parsed ({parse_stats['early_commits']} decided early), "
+                f"{parse_stats['regex_fallbacks']} recovered by regex, "
+                f"{parse_stats['defaulted']} unreadable and sent to the SQL agent"
+            )
+
         # Display Ollama instructions
         if 'model_type' in st.session_state and st.session_state.model_type == "ollama":
             st.markdown("---")
@@ -84,88 +202,145 @@ def render_sidebar():
             """)
 
 
+def render_trace_panel(session):
+    """Latency breakdown of the last request and p50/p95 per stage over the recent ones"""
+    last_trace = session.last_trace
+    if last_trace is None:
+        return
+    with st.expander("Request traces", expanded=False):
+        st.caption(f"Last request: {last_trace.duration_ms:.0f} ms")
+        st.dataframe(
+            [{"stage": name, **entry, "ms": round(entry["ms"], 1)} for name, entry in last_trace.breakdown().items()],
+            use_container_width=True, hide_index=True
+        )
+        percentiles = latency_percentiles(get_recent_traces())
+        if percentiles:
+            st.caption(f"Over the last {percentiles.get('request', {}).get('count', 0)} requests")
+            st.dataframe(
+                [{"stage": name, "count": entry["count"], "p50 ms": round(entry["p50"], 1),
+                  "p95 ms": round(entry["p95"], 1)} for name, entry in percentiles.items()],
+                use_container_width=True, hide_index=True
+            )
+
+
+def render_hot_queries(session):
+    """Most frequent SQL behind the answers on this session's database, with the option to keep a snapshot of each"""
+    snapshot_store = get_snapshot_store()
+    hot_queries = snapshot_store.hot_queries(session.db) if snapshot_store is not None else []
+    if not hot_queries:
+        return
+    snapshot_stats = snapshot_store.stats()
+    with st.expander("Frequent queries", expanded=False):
+        st.caption(
+            f"{snapshot_stats['snapshots']} snapshots kept, {snapshot_stats['hits']} queries answered from them, "
+            f"{snapshot_stats['stale']} found stale"
+        )
+        for query in hot_queries:
+            st.code(query["sql"], language="sql")
+            age = query["snapshot_age"]
+            st.caption(
+                f"Asked {query['count']} times, e.g. \"{query['questions'][-1]}\""
+                + (f" · snapshot taken {age:.0f}s ago in {query['snapshot_seconds']:.2f}s" if age is not None else "")
+            )
+            keep = st.checkbox("Keep a precomputed snapshot", value=query["enabled"],
+                               key=f"snapshot_{hash(query['key'])}")
+            if keep != query["enabled"]:
+                snapshot_store.enable(query["key"], keep)
+            if st.checkbox("Show as a materialized view", key=f"materialized_view_{hash(query['key'])}"):
+                st.code(materialized_view_sql(query["sql"]), language="sql")
+
+
+def render_table_browser():
+    """List the available tables with row estimates, loading each preview only when asked for"""
+    client = get_service_client()
+    if client is not None:
+        remote_session = st.session_state.remote_session
+        tables = remote_session["tables"]
+        load_preview = lambda table: client.table_preview(remote_session, table)  # noqa: E731
+    else:
+        db = st.session_state.chat_session.db
+        estimates = get_table_estimates(db)
+        tables = [{"name": table, **estimates.get(table, {})} for table in db.get_usable_table_names()]
+        load_preview = lambda table: get_table_preview(db, table)  # noqa: E731
+
+    st.subheader("Available tables:")
+    search = st.text_input("Filter tables", key="table_filter").strip().lower()
+    if search:
+        tables = [table for table in tables if search in table["name"].lower()]
+    # Only one page of tables gets widgets, so reruns stay fast on schemas with thousands of tables
+    pages = max(1, -(-len(tables) // TABLE_BROWSER_PAGE_SIZE))
+    page = 1
+    if pages > 1:
+        page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, value=1,
+                               key=f"table_page_{search}_{pages}")
+    start = (page - 1) * TABLE_BROWSER_PAGE_SIZE
+    if len(tables) > TABLE_BROWSER_PAGE_SIZE:
+        st.caption(f"Tables {start + 1}-{min(start + TABLE_BROWSER_PAGE_SIZE, len(tables))} of {len(tables)}")
+    for table in tables[start:start + TABLE_BROWSER_PAGE_SIZE]:
+        label = table["name"]
+        if table.get("kind") == "view":
+            label += " (view)"
+        elif table.get("estimated_rows") is not None:
+            label += f" (~{table['estimated_rows']:,} rows)"
+
+        with st.expander(label, expanded=False):
+            if not st.checkbox("Show preview", key=f"preview_{table['name']}"):
+                continue
+            preview = load_preview(table["name"])
+            if isinstance(preview, str):
+                st.code(preview)
+            else:
+                st.dataframe(preview.frame_data(), use_container_width=True)
+
+
 def setup_connection(
         model_option, db_host, db_port, db_name, db_user, db_password,
-        temperature, use_summary_memory, show_reasoning,
+        temperature, memory_mode, show_reasoning,
         ollama_host=None, ollama_model=None,
         openai_api_key=None, openai_model=None
 ):
-    """Set up the connection to the database and initialize the agents"""
+    """Set up the connection to the database and initialize the agents, here or in the API service"""
     try:
-        # Connect to the database
-        db = connect_to_database(db_user, db_password, db_host, db_port, db_name)
-
         # Configure LLM based on selected option
         if model_option == "Local (Ollama)":
-            # Configure local Ollama model
-            from langchain_community.chat_models import ChatOllama
-
-            llm = ChatOllama(
-                model=ollama_model,
-                base_url=ollama_host,
-                temperature=temperature
-            )
-            # Configure a simpler model for the planner (for better performance)
-            planner_llm = ChatOllama(
-                model=ollama_model,
-                base_url=ollama_host,
-                temperature=0.1
-            )
-            st.session_state.model_type = "ollama"
-            st.session_state.model_name = ollama_model
+            model_config = ModelConfig(model_type="ollama", model_name=ollama_model, temperature=temperature,
+                                       host=ollama_host or "")
         else:
             # Configure OpenAI model
             if not openai_api_key:
                 st.error("Please enter an OpenAI API key")
                 return
+            model_config = ModelConfig(model_type="openai", model_name=openai_model, temperature=temperature,
+                                       api_key=openai_api_key)
+        db_config = DatabaseConfig(host=db_host, port=db_port, name=db_name, user=db_user, password=db_password)
 
-            os.environ["OPENAI_API_KEY"] = openai_api_key
-            from langchain_openai import ChatOpenAI
-
-            llm = ChatOpenAI(temperature=temperature, model=openai_model)
-            planner_llm = ChatOpenAI(temperature=0.1, model=openai_model)
-            st.session_state.model_type = "openai"
-            st.session_state.model_name = openai_model
-
-        # Create memory
-        memory = create_memory(llm, use_summary_memory)
-
-        # Create memory tool
-        memory_tool = MemorySearchTool()
-
-        # Initialize agents
-        agents = initialize_agents(db, llm, planner_llm, st.session_state.model_type)
+        client = get_service_client()
+        if client is not None:
+            # Reconnecting keeps the conversation: the previous session is closed and restored with its token
+            previous = st.session_state.get("remote_session")
+            if previous is not None:
+                client.close_session(previous)
+            st.session_state.remote_session = client.open_session(
+                db_config, model_config, memory_mode, show_reasoning, previous=previous
+            )
+        else:
+            st.session_state.chat_session = create_session(
+                st.session_state.session_id, db_config, model_config,
+                memory_mode=memory_mode, show_reasoning=show_reasoning,
+                # The summary is read from the memory backend on every connect, never from page-load state
+                memory_store=st.session_state.memory_store,
+            )
 
         # Save to session state
-        st.session_state.llm = llm
-        st.session_state.sql_agent = agents["sql_agent"]
-        st.session_state.dispatcher_chain = agents["dispatcher_chain"]
-        st.session_state.memory = memory
-        st.session_state.memory_tool = memory_tool
-        st.session_state.db = db
+        st.session_state.model_type = model_config.model_type
+        st.session_state.model_name = model_config.model_name
         st.session_state.initialized = True
         st.session_state.show_reasoning = show_reasoning
 
-        # Inject schema to memory
-        inject_db_schema_to_memory(st.session_state.db, st.session_state.memory, debug=True)
-
         # Success message and database summary
         st.success(f"Connection successful using {st.session_state.model_name}!")
 
-        # Show available tables
-        tables_info = db.get_usable_table_names()
-        st.subheader("Available tables:")
-        for table in tables_info:
-            st.write(f"- {table}")
-
-        # Show a preview of the tables
-        st.subheader("Table preview:")
-        for table in tables_info[:3]:  # Limit to 3 tables to avoid overloading
-            st.write(f"**Table: {table}**")
-            preview = get_table_preview(db, table)
-            st.code(preview)
-
     except Exception as e:
         st.error(f"Connection error: {str(e)}")
         st.error("If you're using a local Ollama model, make sure it's running")
-        st.info("Run Ollama with: `ollama serve` and make sure you've downloaded the model")
\ No newline at end of file
+        st.info("Run Ollama with: `ollama serve` and make sure you've downloaded the model")
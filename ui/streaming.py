@@ -0,0 +1,64 @@
+import time
+
+import streamlit as st
+
+# Minimum delay between re-renders of the partial answer
+RENDER_INTERVAL_SECONDS = 0.05
+
+
+class ChatStream:
+    """Streams the dispatcher decision, agent steps and answer tokens into the current chat bubble"""
+
+    def __init__(self, initial_status=""):
+        self.started = time.perf_counter()
+        self.first_token_seconds = None
+        self._status = st.empty()
+        self._answer = st.empty()
+        self._chunks = []
+        self._last_render = 0.0
+        if initial_status:
+            self.status(initial_status)
+
+    def status(self, message):
+        """Show what the pipeline is doing right now (decided action, SQL being run...)"""
+        self._status.caption(message)
+
+    def reasoning(self, reasoning, action, explanation):
+        """Show the planner's decision"""
+        with st.expander("🧠 Planner reasoning", expanded=True):
+            st.markdown(f"""
+        **🧭 Decided action:** `{action}`
+
+        **📖 Reasoning:**
+        {reasoning}
+        **🗣 Explanation:**
+        {explanation}
+        """)
+
+    def note(self, message):
+        """Show how the answer was produced (cache hits...)"""
+        st.caption(message)
+
+    def new_message(self):
+        """Start a new LLM message; the partial text of the previous one is replaced"""
+        self._chunks = []
+
+    def token(self, chunk):
+        """Append a token to the partial answer"""
+        if not chunk:
+            return
+        now = time.perf_counter()
+        if self.first_token_seconds is None:
+            self.first_token_seconds = now - self.started
+        self._chunks.append(chunk)
+        if now - self._last_render >= RENDER_INTERVAL_SECONDS:
+            self._answer.markdown("".join(self._chunks) + "▌")
+            self._last_render = now
+
+    def finish(self, result):
+        """Replace the partial output with the final answer"""
+        if self.first_token_seconds is None:
+            self.first_token_seconds = time.perf_counter() - self.started
+        self._status.empty()
+        self._answer.markdown(result)
+
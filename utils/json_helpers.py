@@ -1,6 +1,52 @@
-import json
+import logging
 import re
-import streamlit as st
+import threading
+
+from pydantic import ValidationError
+
+from models.schema import AgentResponse
+
+logger = logging.getLogger(__name__)
+
+_FENCED_JSON_RE = re.compile(r'```(?:json)?\s*(\{.*?\})\s*```', re.DOTALL)
+_ACTION_RE = re.compile(r'"action"\s*:\s*"(database_query|memory_lookup|direct_response)"')
+# Longest prefix of an action field that can still straddle two chunks
+_ACTION_OVERLAP = len('"action" : "database_query"') + 8
+
+_parse_stats = {"parsed": 0, "extracted": 0, "early_commits": 0, "regex_fallbacks": 0, "defaulted": 0}
+_stats_lock = threading.Lock()
+
+
+def _count(name):
+    with _stats_lock:
+        _parse_stats[name] += 1
+
+
+def get_dispatch_parse_stats():
+    """How planner replies were parsed; "defaulted" ones were sent to the SQL agent for lack of an action"""
+    with _stats_lock:
+        return dict(_parse_stats)
+
+
+def _load_response(text):
+    """AgentResponse from a JSON reply, a fenced JSON block or the outermost braces of the text"""
+    if text.startswith("{"):
+        # Structured output: the reply is the object itself
+        try:
+            return AgentResponse.model_validate_json(text)
+        except ValidationError:
+            pass
+    match = _FENCED_JSON_RE.search(text)
+    if match:
+        candidate = match.group(1)
+    else:
+        start, end = text.find("{"), text.rfind("}")
+        if start == -1 or end < start:
+            raise ValueError("no JSON object in the planner output")
+        candidate = text[start:end + 1]
+    response = AgentResponse.model_validate_json(candidate)
+    _count("extracted")
+    return response
 
 
 def parse_dispatch_result(dispatch_result: str) -> tuple[str, str, str]:
@@ -10,31 +56,63 @@ def parse_dispatch_result(dispatch_result: str) -> tuple[str, str, str]:
     If the result is not valid JSON, attempts to extract information via regex or defaults.
     """
     try:
-        # Try to find JSON content in the response (sometimes models wrap JSON in markdown or other text)
-        json_match = re.search(r'```(?:json)?\s*(\{.*?\})\s*```', dispatch_result, re.DOTALL)
-        if json_match:
-            # If there's JSON within code blocks, try to parse that
-            data = json.loads(json_match.group(1))
-        else:
-            # Try to parse the whole response as JSON
-            data = json.loads(dispatch_result)
-
-        reasoning = data.get("reasoning", "")
-        action = data.get("action", "database_query")
-        explanation = data.get("explanation", "")
-
-    except json.JSONDecodeError:
-        # If JSON parsing fails, try to extract information using regex
-        # Look for action pattern
-        action_match = re.search(r'"action":\s*"(database_query|memory_lookup|direct_response)"', dispatch_result)
-        action = action_match.group(1) if action_match else "database_query"
-
-        # Extract potential reasoning
-        reasoning = dispatch_result
-        explanation = "Content extracted from non-JSON response."
-
-        # Don't show warning to user - handle gracefully
-        if st.session_state.get("show_reasoning", False):
-            st.info("Note: Planner output was not formatted as valid JSON, but I was able to process it.")
-
-    return reasoning, action, explanation
\ No newline at end of file
+        response = _load_response(dispatch_result.strip())
+        _count("parsed")
+        return response.reasoning, response.action, response.explanation
+    except (ValueError, ValidationError):
+        pass
+
+    # If JSON parsing fails, try to extract the action using regex
+    action_match = _ACTION_RE.search(dispatch_result)
+    if action_match:
+        action = action_match.group(1)
+        _count("regex_fallbacks")
+    else:
+        # Misparsed replies take the safe but most expensive path, the SQL agent
+        action = "database_query"
+        _count("defaulted")
+
+    # Extract potential reasoning
+    reasoning = dispatch_result
+    explanation = "Content extracted from non-JSON response."
+
+    # Don't show warning to user - handle gracefully; the explanation above says what happened
+    logger.info("Planner output was not valid JSON, extracted action %s", action)
+    return reasoning, action, explanation
+
+
+class DispatchStreamParser:
+    """
+    Incremental parser for a streamed planner reply: feed() returns the action as soon as the
+    "action" field is complete, so the caller can commit to it before the reasoning is generated.
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self._tail = ""
+        self.action = None
+
+    def feed(self, chunk):
+        """Add a chunk; returns the action the first time it can be read, otherwise None"""
+        self._chunks.append(chunk)
+        if self.action is not None:
+            return None
+        # Only the unscanned text plus a short overlap is searched, never the whole reply again
+        self._tail = (self._tail + chunk)[-(_ACTION_OVERLAP + len(chunk)):]
+        match = _ACTION_RE.search(self._tail)
+        if match is None:
+            return None
+        self.action = match.group(1)
+        return self.action
+
+    @property
+    def text(self):
+        return "".join(self._chunks)
+
+    def result(self, complete=True):
+        """(reasoning, action, explanation) of the reply; an early commit has no reasoning yet"""
+        if complete or self.action is None:
+            return parse_dispatch_result(self.text)
+        _count("early_commits")
+        _count("parsed")
+        return "", self.action, "Action read before the planner finished its reasoning."
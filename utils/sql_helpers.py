@@ -0,0 +1,34 @@
+import re
+
+_IDENT = r'(?:"[^"]+"|[\w$]+)'
+_TABLE_REF = rf'{_IDENT}(?:\.{_IDENT})?'
+# Words that end a table reference rather than alias it
+_CLAUSE_WORD = (r'(?:where|join|inner|left|right|full|cross|natural|on|using|group|order|limit|offset|having|'
+                r'union|intersect|except|window|for|fetch|lateral|tablesample)\b')
+_ALIASED_REF = rf'{_TABLE_REF}(?:\s+(?:as\s+)?(?!{_CLAUSE_WORD}){_IDENT})?'
+# The whole FROM list, so comma joins ("FROM orders o, customers c") count every table
+_TABLE_LIST_RE = re.compile(rf'\b(?:from|join)\s+({_ALIASED_REF}(?:\s*,\s*{_ALIASED_REF})*)', re.IGNORECASE)
+_TABLE_REF_RE = re.compile(_TABLE_REF)
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_sql(sql):
+    """Collapse whitespace and drop the trailing semicolon so equivalent SQL strings compare equal"""
+    return _WHITESPACE_RE.sub(" ", sql).strip().rstrip(";").strip()
+
+
+def extract_tables(sql, known_tables=None):
+    """Return the table names referenced in FROM/JOIN clauses, optionally restricted to known tables"""
+    tables = []
+    for match in _TABLE_LIST_RE.finditer(sql):
+        # Each item of the list starts with its table, optionally followed by an alias
+        for item in match.group(1).split(","):
+            ref = _TABLE_REF_RE.match(item.strip())
+            if ref is None:
+                continue  # A quoted name containing a comma
+            name = ref.group(0).split(".")[-1].strip('"')
+            if known_tables is not None and name not in known_tables:
+                continue
+            if name not in tables:
+                tables.append(name)
+    return tables
@@ -0,0 +1,95 @@
+import math
+import re
+from collections import defaultdict
+
+_WORD_RE = re.compile(r"[A-Za-z0-9]+")
+_CAMEL_RE = re.compile(r"([a-z0-9])([A-Z])")
+
+_STOPWORDS = frozenset({
+    "a", "an", "the", "of", "in", "on", "for", "to", "and", "or", "by", "with", "from", "is", "are",
+    "was", "were", "be", "me", "my", "i", "you", "we", "our", "it", "its", "this", "that", "what",
+    "which", "who", "how", "show", "give", "list", "get", "find", "all", "per", "each", "do", "does",
+})
+
+
+def tokenize(text):
+    """Lowercase word tokens, splitting snake_case/camelCase and dropping stopwords and plural 's'"""
+    if not text:
+        return []
+    text = _CAMEL_RE.sub(r"\1 \2", text).replace("_", " ")
+    tokens = []
+    for word in _WORD_RE.findall(text.lower()):
+        if word in _STOPWORDS:
+            continue
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        tokens.append(word)
+    return tokens
+
+
+def estimate_tokens(text):
+    """Rough LLM token estimate (~4 characters per token)"""
+    return len(text) // 4 if text else 0
+
+
+class BM25Index:
+    """Incremental Okapi BM25 index over small documents"""
+
+    def __init__(self, k1=1.2, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings = defaultdict(dict)  # term -> {doc_id: term frequency}
+        self._doc_terms = {}  # doc_id -> {term: term frequency}
+        self._doc_len = {}
+        self._total_len = 0
+
+    def __len__(self):
+        return len(self._doc_len)
+
+    def __contains__(self, doc_id):
+        return doc_id in self._doc_len
+
+    def add(self, doc_id, tokens):
+        """Index (or re-index) a document"""
+        if doc_id in self._doc_len:
+            self.remove(doc_id)
+        term_freqs = defaultdict(int)
+        for token in tokens:
+            term_freqs[token] += 1
+        for term, freq in term_freqs.items():
+            self._postings[term][doc_id] = freq
+        self._doc_terms[doc_id] = dict(term_freqs)
+        self._doc_len[doc_id] = len(tokens)
+        self._total_len += len(tokens)
+
+    def remove(self, doc_id):
+        """Drop a document and its postings"""
+        term_freqs = self._doc_terms.pop(doc_id, None)
+        if term_freqs is None:
+            return
+        for term in term_freqs:
+            postings = self._postings[term]
+            postings.pop(doc_id, None)
+            if not postings:
+                del self._postings[term]
+        self._total_len -= self._doc_len.pop(doc_id)
+
+    def search(self, query_tokens, k=10):
+        """Return up to k (doc_id, score) pairs, best first"""
+        n_docs = len(self._doc_len)
+        if not n_docs or not query_tokens:
+            return []
+        avg_len = self._total_len / n_docs or 1.0
+
+        scores = defaultdict(float)
+        for term in set(query_tokens):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, freq in postings.items():
+                norm = self.k1 * (1 - self.b + self.b * self._doc_len[doc_id] / avg_len)
+                scores[doc_id] += idf * freq * (self.k1 + 1) / (freq + norm)
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        return ranked[:k]